@@ -15,6 +15,11 @@ from pycti import (
     StixCoreRelationship,
     get_config_variable,
 )
+from snapshot import BlacklistSnapshot, diff, ip_key, key_ip
+
+IPV4_VALIDATOR = re.compile(
+    "^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$"
+)
 
 
 class abuseipdbipblacklistimport:
@@ -45,6 +50,18 @@ class abuseipdbipblacklistimport:
             config,
             True,
         )
+        snapshot_path = get_config_variable(
+            "ABUSEIPDB_SNAPSHOT_PATH",
+            ["abuseipdbipblacklistimport", "snapshot_path"],
+            config,
+        )
+        self.snapshot = BlacklistSnapshot(snapshot_path) if snapshot_path else None
+        self.dropped_score = get_config_variable(
+            "ABUSEIPDB_DROPPED_SCORE",
+            ["abuseipdbipblacklistimport", "dropped_score"],
+            config,
+            True,
+        )
         self.update_existing_data = get_config_variable(
             "CONNECTOR_UPDATE_EXISTING_DATA",
             ["connector", "update_existing_data"],
@@ -62,6 +79,126 @@ class abuseipdbipblacklistimport:
     def next_run(self, seconds):
         return
 
+    def create_objects(self, d, external_reference):
+        # Creating the indicator, the observable and their relationship for an IP
+        if IPV4_VALIDATOR.match(d["ipAddress"]):
+            pattern = "[ipv4-addr:value = '" + d["ipAddress"] + "']"
+            stix_indicator = stix2.Indicator(
+                id=Indicator.generate_id(pattern),
+                name=d["ipAddress"],
+                description="Agressive IP known malicious on AbuseIPDB"
+                + " - countryCode: "
+                + str(d["countryCode"])
+                + " - abuseConfidenceScore: "
+                + str(d["abuseConfidenceScore"])
+                + " - lastReportedAt: "
+                + str(d["lastReportedAt"]),
+                created_by_ref=self.identity["standard_id"],
+                confidence=self.helper.connect_confidence_level,
+                pattern_type="stix",
+                pattern=pattern,
+                external_references=[external_reference],
+                object_marking_refs=[stix2.TLP_WHITE],
+                custom_properties={
+                    "x_opencti_score": d["abuseConfidenceScore"],
+                    "x_opencti_main_observable_type": "IPv4-Addr",
+                },
+            )
+            stix_observable = stix2.IPv4Address(
+                type="ipv4-addr",
+                spec_version="2.1",
+                value=d["ipAddress"],
+                object_marking_refs=[stix2.TLP_WHITE],
+                custom_properties={
+                    "x_opencti_description": "Agressive IP known malicious on AbuseIPDB"
+                    + " - countryCode: "
+                    + str(d["countryCode"])
+                    + " - abuseConfidenceScore: "
+                    + str(d["abuseConfidenceScore"])
+                    + " - lastReportedAt: "
+                    + str(d["lastReportedAt"]),
+                    "x_opencti_score": d["abuseConfidenceScore"],
+                    "created_by_ref": self.identity["standard_id"],
+                    "external_references": [external_reference],
+                },
+            )
+        else:
+            pattern = "[ipv6-addr:value = '" + d["ipAddress"] + "']"
+            stix_indicator = stix2.Indicator(
+                id=Indicator.generate_id(pattern),
+                name=d["ipAddress"],
+                description="Agressive IP known malicious on AbuseIPDB"
+                + " - countryCode: "
+                + str(d["countryCode"])
+                + " - abuseConfidenceScore: "
+                + str(d["abuseConfidenceScore"])
+                + " - lastReportedAt: "
+                + str(d["lastReportedAt"]),
+                created_by_ref=self.identity["standard_id"],
+                confidence=self.helper.connect_confidence_level,
+                pattern_type="stix",
+                pattern=pattern,
+                external_references=[external_reference],
+                object_marking_refs=[stix2.TLP_WHITE],
+                custom_properties={
+                    "x_opencti_score": d["abuseConfidenceScore"],
+                    "x_opencti_main_observable_type": "IPv6-Addr",
+                },
+            )
+            stix_observable = stix2.IPv6Address(
+                type="ipv6-addr",
+                spec_version="2.1",
+                value=d["ipAddress"],
+                object_marking_refs=[stix2.TLP_WHITE],
+                custom_properties={
+                    "description": "Agressive IP known malicious on AbuseIPDB"
+                    + " - countryCode: "
+                    + str(d["countryCode"])
+                    + " - abuseConfidenceScore: "
+                    + str(d["abuseConfidenceScore"])
+                    + " - lastReportedAt: "
+                    + str(d["lastReportedAt"]),
+                    "x_opencti_score": d["abuseConfidenceScore"],
+                    "created_by_ref": self.identity["standard_id"],
+                    "external_references": [external_reference],
+                },
+            )
+        stix_relationship = stix2.Relationship(
+            id=StixCoreRelationship.generate_id(
+                "based-on", stix_indicator.id, stix_observable.id
+            ),
+            relationship_type="based-on",
+            source_ref=stix_indicator.id,
+            target_ref=stix_observable.id,
+            object_marking_refs=[stix2.TLP_WHITE],
+        )
+        return [stix_indicator, stix_observable, stix_relationship]
+
+    def create_dropped_objects(self, address):
+        # Decaying the score of an IP which dropped off the list
+        if ":" in address:
+            pattern = "[ipv6-addr:value = '" + address + "']"
+            stix_observable = stix2.IPv6Address(
+                value=address,
+                custom_properties={"x_opencti_score": self.dropped_score},
+            )
+        else:
+            pattern = "[ipv4-addr:value = '" + address + "']"
+            stix_observable = stix2.IPv4Address(
+                value=address,
+                custom_properties={"x_opencti_score": self.dropped_score},
+            )
+        stix_indicator = stix2.Indicator(
+            id=Indicator.generate_id(pattern),
+            name=address,
+            created_by_ref=self.identity["standard_id"],
+            pattern_type="stix",
+            pattern=pattern,
+            object_marking_refs=[stix2.TLP_WHITE],
+            custom_properties={"x_opencti_score": self.dropped_score},
+        )
+        return [stix_indicator, stix_observable]
+
     def run(self):
         self.helper.log_info("abuseIPDB dataset...")
         while True:
@@ -120,116 +257,57 @@ class abuseipdbipblacklistimport:
                             url="https://www.abuseipdb.com/",
                             description="AbuseIPDB database URL",
                         )
-                        bundle_objects = []
+                        current = {}
+                        for d in data_json["data"]:
+                            current[ip_key(d["ipAddress"])] = d
+                        scores = {
+                            key: d["abuseConfidenceScore"] for key, d in current.items()
+                        }
+
+                        # Only sending the added IPs and the score changes
+                        if self.snapshot is not None:
+                            changed, dropped = diff(self.snapshot.load(), scores)
+                            self.helper.log_info(
+                                str(len(changed))
+                                + " added or changed IPs, "
+                                + str(len(dropped))
+                                + " dropped IPs"
+                            )
+                        else:
+                            changed, dropped = list(current), []
 
                         # Filling the bundle
-                        ipv4validator = re.compile(
-                            "^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$"
-                        )
-                        for d in data_json["data"]:
-                            if ipv4validator.match(d["ipAddress"]):
-                                pattern = "[ipv4-addr:value = '" + d["ipAddress"] + "']"
-                                stix_indicator = stix2.Indicator(
-                                    id=Indicator.generate_id(pattern),
-                                    name=d["ipAddress"],
-                                    description="Agressive IP known malicious on AbuseIPDB"
-                                    + " - countryCode: "
-                                    + str(d["countryCode"])
-                                    + " - abuseConfidenceScore: "
-                                    + str(d["abuseConfidenceScore"])
-                                    + " - lastReportedAt: "
-                                    + str(d["lastReportedAt"]),
-                                    created_by_ref=self.identity["standard_id"],
-                                    confidence=self.helper.connect_confidence_level,
-                                    pattern_type="stix",
-                                    pattern=pattern,
-                                    external_references=[external_reference],
-                                    object_marking_refs=[stix2.TLP_WHITE],
-                                    custom_properties={
-                                        "x_opencti_score": d["abuseConfidenceScore"],
-                                        "x_opencti_main_observable_type": "IPv4-Addr",
-                                    },
-                                )
-                                stix_observable = stix2.IPv4Address(
-                                    type="ipv4-addr",
-                                    spec_version="2.1",
-                                    value=d["ipAddress"],
-                                    object_marking_refs=[stix2.TLP_WHITE],
-                                    custom_properties={
-                                        "x_opencti_description": "Agressive IP known malicious on AbuseIPDB"
-                                        + " - countryCode: "
-                                        + str(d["countryCode"])
-                                        + " - abuseConfidenceScore: "
-                                        + str(d["abuseConfidenceScore"])
-                                        + " - lastReportedAt: "
-                                        + str(d["lastReportedAt"]),
-                                        "x_opencti_score": d["abuseConfidenceScore"],
-                                        "created_by_ref": self.identity["standard_id"],
-                                        "external_references": [external_reference],
-                                    },
-                                )
-                            else:
-                                pattern = "[ipv6-addr:value = '" + d["ipAddress"] + "']"
-                                stix_indicator = stix2.Indicator(
-                                    id=Indicator.generate_id(pattern),
-                                    name=d["ipAddress"],
-                                    description="Agressive IP known malicious on AbuseIPDB"
-                                    + " - countryCode: "
-                                    + str(d["countryCode"])
-                                    + " - abuseConfidenceScore: "
-                                    + str(d["abuseConfidenceScore"])
-                                    + " - lastReportedAt: "
-                                    + str(d["lastReportedAt"]),
-                                    created_by_ref=self.identity["standard_id"],
-                                    confidence=self.helper.connect_confidence_level,
-                                    pattern_type="stix",
-                                    pattern=pattern,
-                                    external_references=[external_reference],
-                                    object_marking_refs=[stix2.TLP_WHITE],
-                                    custom_properties={
-                                        "x_opencti_score": d["abuseConfidenceScore"],
-                                        "x_opencti_main_observable_type": "IPv6-Addr",
-                                    },
-                                )
-                                stix_observable = stix2.IPv6Address(
-                                    type="ipv6-addr",
-                                    spec_version="2.1",
-                                    value=d["ipAddress"],
-                                    object_marking_refs=[stix2.TLP_WHITE],
-                                    custom_properties={
-                                        "description": "Agressive IP known malicious on AbuseIPDB"
-                                        + " - countryCode: "
-                                        + str(d["countryCode"])
-                                        + " - abuseConfidenceScore: "
-                                        + str(d["abuseConfidenceScore"])
-                                        + " - lastReportedAt: "
-                                        + str(d["lastReportedAt"]),
-                                        "x_opencti_score": d["abuseConfidenceScore"],
-                                        "created_by_ref": self.identity["standard_id"],
-                                        "external_references": [external_reference],
-                                    },
+                        bundle_objects = []
+                        for key in changed:
+                            bundle_objects += self.create_objects(
+                                current[key], external_reference
+                            )
+                        if len(bundle_objects) > 0:
+                            # Creating the bundle from the list
+                            bundle = self.helper.stix2_create_bundle(bundle_objects)
+                            # Sending the bundle
+                            self.helper.send_stix2_bundle(
+                                bundle,
+                                update=self.update_existing_data,
+                                work_id=work_id,
+                            )
+
+                        if self.dropped_score is not None and len(dropped) > 0:
+                            bundle_objects = []
+                            for key in dropped:
+                                bundle_objects += self.create_dropped_objects(
+                                    key_ip(key)
                                 )
-                            # Adding the IP to the list
-                            stix_relationship = stix2.Relationship(
-                                id=StixCoreRelationship.generate_id(
-                                    "based-on", stix_indicator.id, stix_observable.id
-                                ),
-                                relationship_type="based-on",
-                                source_ref=stix_indicator.id,
-                                target_ref=stix_observable.id,
-                                object_marking_refs=[stix2.TLP_WHITE],
+                            bundle = self.helper.stix2_create_bundle(bundle_objects)
+                            self.helper.send_stix2_bundle(
+                                bundle,
+                                update=True,
+                                work_id=work_id,
                             )
-                            bundle_objects.append(stix_indicator)
-                            bundle_objects.append(stix_observable)
-                            bundle_objects.append(stix_relationship)
-                        # Creating the bundle from the list
-                        bundle = self.helper.stix2_create_bundle(bundle_objects)
-                        # Sending the bundle
-                        self.helper.send_stix2_bundle(
-                            bundle,
-                            update=self.update_existing_data,
-                            work_id=work_id,
-                        )
+
+                        # Storing the snapshot once the bundles are sent
+                        if self.snapshot is not None:
+                            self.snapshot.save(scores)
                     except Exception as e:
                         self.helper.log_error(str(e))
                     # Store the current timestamp as a last run
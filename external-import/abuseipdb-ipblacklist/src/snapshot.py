@@ -0,0 +1,88 @@
+import ipaddress
+import os
+import struct
+
+# IPv6 keys are shifted above every IPv4 key
+IPV6_OFFSET = 1 << 128
+
+HEADER = struct.Struct("!4sII")
+MAGIC = b"AIP1"
+IPV4_RECORD = struct.Struct("!IB")
+IPV6_RECORD = struct.Struct("!QQB")
+
+
+def ip_key(address):
+    """Convert an IP address to an integer key, IPv4 and IPv6 never overlap"""
+    ip = ipaddress.ip_address(address)
+    if ip.version == 4:
+        return int(ip)
+    return IPV6_OFFSET + int(ip)
+
+
+def key_ip(key):
+    """Convert an integer key back to its IP address"""
+    if key < IPV6_OFFSET:
+        return str(ipaddress.IPv4Address(key))
+    return str(ipaddress.IPv6Address(key - IPV6_OFFSET))
+
+
+class BlacklistSnapshot:
+    """
+    Scores of the IPs sent during the previous run, kept in a local file as
+    sorted packed integers: 5 bytes per IPv4 and 17 bytes per IPv6.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Return the score of each IP key, empty if there is no snapshot"""
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path, "rb") as snapshot_file:
+            data = snapshot_file.read()
+        magic, ipv4_count, ipv6_count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a blacklist snapshot")
+        scores = {}
+        offset = HEADER.size
+        for key, score in IPV4_RECORD.iter_unpack(
+            data[offset : offset + ipv4_count * IPV4_RECORD.size]
+        ):
+            scores[key] = score
+        offset += ipv4_count * IPV4_RECORD.size
+        for high, low, score in IPV6_RECORD.iter_unpack(
+            data[offset : offset + ipv6_count * IPV6_RECORD.size]
+        ):
+            scores[IPV6_OFFSET + (high << 64) + low] = score
+        return scores
+
+    def save(self, scores):
+        """Replace the snapshot with the score of each IP key"""
+        keys = sorted(scores)
+        ipv4_keys = [key for key in keys if key < IPV6_OFFSET]
+        ipv6_keys = [key - IPV6_OFFSET for key in keys if key >= IPV6_OFFSET]
+        chunks = [HEADER.pack(MAGIC, len(ipv4_keys), len(ipv6_keys))]
+        chunks += [IPV4_RECORD.pack(key, scores[key]) for key in ipv4_keys]
+        chunks += [
+            IPV6_RECORD.pack(
+                key >> 64, key & 0xFFFFFFFFFFFFFFFF, scores[IPV6_OFFSET + key]
+            )
+            for key in ipv6_keys
+        ]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as snapshot_file:
+            snapshot_file.write(b"".join(chunks))
+        os.replace(tmp_path, self.path)
+
+
+def diff(previous, current):
+    """
+    Compare the scores of two runs.
+
+    Return the keys which were added or whose score changed, and the keys which
+    dropped off the list.
+    """
+    changed = [key for key, score in current.items() if previous.get(key) != score]
+    dropped = [key for key in previous if key not in current]
+    return changed, dropped
@@ -0,0 +1,136 @@
+"""
+Measure the CPE parsing and the local CPE store on the size of the NVD dictionary
+
+    python benchmark_cpe_store.py [--cpes 1300000] [--store /tmp/cpe.db] [page.json ...]
+
+Pages dumped from the NVD CPE API can be given instead of the synthetic
+dictionary. The first import sends every CPE, the second one must send none.
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from connector import CPEConnector, CPEStore
+
+PAGE_SIZE = 10000
+
+
+def generate_products(count: int, rng: random.Random) -> list:
+    products = []
+    for index in range(count):
+        part = "h" if rng.random() < 0.1 else rng.choice(["a", "o"])
+        vendor = "".join(rng.choice(string.ascii_lowercase) for _ in range(6))
+        product = f"product_{index}"
+        version = f"{rng.randint(0, 20)}.{rng.randint(0, 99)}"
+        language = rng.choice(["*"] * 9 + ["en", "fr-fr"])
+        cpe_name = f"cpe:2.3:{part}:{vendor}:{product}:{version}:*:*:{language}:*:*:*:*"
+        products.append(
+            {
+                "cpe": {
+                    "deprecated": rng.random() < 0.05,
+                    "cpeName": cpe_name,
+                    "titles": (
+                        [{"title": f"{vendor} {product} {version}", "lang": "en"}]
+                        if rng.random() < 0.9
+                        else []
+                    ),
+                }
+            }
+        )
+    return products
+
+
+def load_products(files: list) -> list:
+    products = []
+    for file_path in files:
+        with open(file_path, "r") as f:
+            products += json.load(f)["products"]
+    return products
+
+
+def split_each_time(cpe: str) -> tuple:
+    # Previous parsing, which split the CPE for each field
+    return (
+        cpe.split(":")[2],
+        cpe.split(":")[3],
+        cpe.split(":")[4],
+        cpe.split(":")[5],
+        cpe.split(":")[8],
+    )
+
+
+def split_once(cpe: str) -> tuple:
+    parts = cpe.split(":")
+    return parts[2], parts[3], parts[4], parts[5], parts[8]
+
+
+def run_import(connector: CPEConnector, products: list) -> tuple:
+    sent = 0
+    start = time.perf_counter()
+    for i in range(0, len(products), PAGE_SIZE):
+        stix_objects = connector._json_to_stix(
+            {"products": products[i : i + PAGE_SIZE]}
+        )
+        stix_objects, fingerprints = connector._filter_unchanged(stix_objects)
+        sent += len(stix_objects)
+        if fingerprints:
+            connector.store.update(fingerprints)
+    return sent, time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Pages of the NVD CPE API")
+    parser.add_argument("--cpes", type=int, default=1300000)
+    parser.add_argument("--store", help="Path of the store, temporary by default")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.files:
+        products = load_products(args.files)
+    else:
+        products = generate_products(args.cpes, random.Random(args.seed))
+    cpe_names = [product["cpe"]["cpeName"] for product in products]
+    print(f"{len(products)} CPEs")
+
+    for parse in (split_each_time, split_once):
+        start = time.perf_counter()
+        for cpe_name in cpe_names:
+            parse(cpe_name)
+        print(f"{parse.__name__}: {time.perf_counter() - start:.2f}s")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_path = args.store or os.path.join(tmp_dir, "cpe.db")
+
+        # Only the helper logging is used to convert the CPEs
+        connector = CPEConnector.__new__(CPEConnector)
+        connector.helper = SimpleNamespace(
+            log_debug=lambda msg: None,
+            log_info=lambda msg: None,
+            log_error=lambda msg: print(msg, file=sys.stderr),
+        )
+        connector.store = CPEStore(store_path)
+
+        sent, duration = run_import(connector, products)
+        print(f"first import: {sent} CPEs sent in {duration:.2f}s")
+        resent, duration = run_import(connector, products)
+        print(f"second import: {resent} CPEs sent in {duration:.2f}s")
+        print(f"store size: {os.path.getsize(store_path) / 1024 / 1024:.1f} MiB")
+
+        connector.store.connection.close()
+
+    if resent != 0:
+        print("Unchanged CPEs were sent again", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
+import hashlib
+import json
 import math
 import os
+import sqlite3
 import sys
 import time
 from datetime import datetime
@@ -16,6 +19,86 @@ from urllib3.util import Retry
 APP_VERSION = "1.0.0"
 
 
+class CPEStore:
+    """
+    Local store of the CPEs already sent to OpenCTI
+
+    Each cpeName is kept with a short hash of the values of the Software object
+    created for it, so that only new or changed CPEs are sent again.
+    """
+
+    # Maximum number of parameters in a single SQLite query
+    QUERY_SIZE = 500
+
+    def __init__(self, path: str):
+        """
+        Opens the store, creating it if needed
+
+        Args:
+            path (str): The path of the SQLite database file
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cpe (name TEXT PRIMARY KEY, fingerprint BLOB NOT NULL) WITHOUT ROWID"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def fingerprint(values: list) -> bytes:
+        """
+        Hashes the values of a Software object
+
+        Args:
+            values (list): The values to hash
+
+        Returns:
+            bytes: An 8 bytes digest of the values
+        """
+        return hashlib.blake2b(
+            json.dumps(values).encode("utf-8"), digest_size=8
+        ).digest()
+
+    def changed(self, fingerprints: dict) -> set:
+        """
+        Compares fingerprints with the stored ones
+
+        Args:
+            fingerprints (dict): The fingerprint of each cpeName
+
+        Returns:
+            set: The cpeNames which are new or whose fingerprint changed
+        """
+        names = list(fingerprints)
+        stored = {}
+        for i in range(0, len(names), self.QUERY_SIZE):
+            chunk = names[i : i + self.QUERY_SIZE]
+            stored.update(
+                self.connection.execute(
+                    "SELECT name, fingerprint FROM cpe WHERE name IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                )
+            )
+        return {
+            name
+            for name, fingerprint in fingerprints.items()
+            if stored.get(name) != fingerprint
+        }
+
+    def update(self, fingerprints: dict) -> None:
+        """
+        Stores the fingerprints of CPEs sent to OpenCTI
+
+        Args:
+            fingerprints (dict): The fingerprint of each cpeName
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO cpe (name, fingerprint) VALUES (?, ?)",
+            fingerprints.items(),
+        )
+        self.connection.commit()
+
+
 class CPEConnector:
     def __init__(self):
         """
@@ -56,6 +139,12 @@ class CPEConnector:
             "NIST_API_KEY", ["cpe", "api_key"], config, False
         )
 
+        # Only send the new or changed CPEs if a store is configured
+        store_path = get_config_variable(
+            "CPE_STORE_PATH", ["cpe", "store_path"], config, False
+        )
+        self.store = CPEStore(store_path) if store_path else None
+
     def _get_interval(self) -> int:
         """
         Returns the interval to use for the connector
@@ -235,36 +324,26 @@ class CPEConnector:
             dict: A dictionary containing the vendor, name, version and language of the CPE
         """
 
+        parts = cpe.split(":")
+
         # Check if the CPE is a hardware
-        if cpe.split(":")[2] == "h":
-            is_hardware = True
-        else:
-            is_hardware = False
+        is_hardware = parts[2] == "h"
 
         # Get the vendor of the CPE
-        if cpe.split(":")[3] == "*":
-            vendor = ""
-        else:
-            vendor = cpe.split(":")[3]
+        vendor = "" if parts[3] == "*" else parts[3]
 
         # Get the name of the CPE
-        if cpe.split(":")[4] == "*":
-            name = ""
-        else:
-            name = cpe.split(":")[4].replace("_", " ")
+        name = "" if parts[4] == "*" else parts[4].replace("_", " ")
 
         # Get the version of the CPE
-        if cpe.split(":")[5] == "*":
-            version = ""
-        else:
-            version = cpe.split(":")[5]
+        version = "" if parts[5] == "*" else parts[5]
 
         # Get the language of the CPE
-        if cpe.split(":")[8] == "*":
+        if parts[8] == "*":
             language = ""
         else:
             try:
-                language = langcodes.standardize_tag(cpe.split(":")[8], "ietf")
+                language = langcodes.standardize_tag(parts[8], "ietf")
             except Exception as e:
                 language = ""
 
@@ -292,28 +371,24 @@ class CPEConnector:
 
         self.helper.log_info("Converting JSON objects to STIX2 objects...")
 
-        nb_results = json_objects["resultsPerPage"]
-
         stix_objects = []
 
         # Create a STIX2 Cyber Observable Object Sofwtare for each CPE
-        for i in range(nb_results):
-            cpe_infos = self._get_cpe_infos(
-                json_objects["products"][i]["cpe"]["cpeName"]
-            )
+        for product in json_objects["products"]:
+            cpe = product["cpe"]
+            cpe_infos = self._get_cpe_infos(cpe["cpeName"])
             if (
-                json_objects["products"][i]["cpe"]["deprecated"] is False
-                and cpe_infos["is_hardware"] is False
+                cpe["deprecated"] is False and cpe_infos["is_hardware"] is False
             ):  # CPEs hardware are not supported by STIX2
                 self.helper.log_debug(
-                    f"Creating a software for the CPE: {json_objects['products'][i]['cpe']['cpeName']}"
+                    f"Creating a software for the CPE: {cpe['cpeName']}"
                 )
                 software = stix2.Software(
                     type="software",
                     spec_version="2.1",
                     id=self._get_id("software"),
-                    name=self._get_cpe_title(json_objects["products"][i]["cpe"]),
-                    cpe=json_objects["products"][i]["cpe"]["cpeName"],
+                    name=self._get_cpe_title(cpe, cpe_infos),
+                    cpe=cpe["cpeName"],
                     languages=cpe_infos["language"],
                     vendor=cpe_infos["vendor"],
                     version=cpe_infos["version"],
@@ -324,13 +399,14 @@ class CPEConnector:
 
         return stix_objects
 
-    def _get_cpe_title(self, cpe: dict) -> str:
+    def _get_cpe_title(self, cpe: dict, cpe_infos: dict = None) -> str:
         """
         Extracts the title from the cpe.
 
         Args:
             self
             cpe (dict): The cpe where the title is extracted
+            cpe_infos (dict): The informations already extracted from the cpeName
 
         Returns:
             str: The title of the cpe.
@@ -343,23 +419,54 @@ class CPEConnector:
                 cpe_title = title["title"]
 
         if cpe_title == "":
-            cpe_title = self._get_cpe_infos(cpe["cpeName"])["name"]
+            if cpe_infos is None:
+                cpe_infos = self._get_cpe_infos(cpe["cpeName"])
+            cpe_title = cpe_infos["name"]
 
         return cpe_title
 
-    def _import_all(self, work_id) -> None:
+    def _filter_unchanged(self, stix_objects: list) -> tuple:
         """
-        Imports all the CPEs from the NIST API
+        Removes the Software objects already sent with the same values
 
         Args:
-            work_id (str): The work ID to use
+            self
+            stix_objects (list): The STIX2 objects to filter
+
+        Returns:
+            tuple: The new or changed STIX2 objects and their fingerprints
         """
 
-        self.helper.log_info(
-            f"{self.helper.connect_name} connector is starting the collection of all CPEs..."
+        fingerprints = {
+            software["cpe"]: CPEStore.fingerprint(
+                [
+                    software.get("name"),
+                    software.get("languages"),
+                    software.get("vendor"),
+                    software.get("version"),
+                ]
+            )
+            for software in stix_objects
+        }
+        changed = self.store.changed(fingerprints)
+
+        return (
+            [software for software in stix_objects if software["cpe"] in changed],
+            {cpe: fingerprints[cpe] for cpe in changed},
         )
 
-        api_url = self._get_api_url(0, None, None)
+    def _import_pages(self, work_id, start_date, end_date) -> None:
+        """
+        Imports the CPEs from the NIST API, page by page
+
+        Args:
+            self
+            work_id (str): The work ID to use
+            start_date (str): The start of the modification range, None for all the CPEs
+            end_date (str): The end of the modification range, None for all the CPEs
+        """
+
+        api_url = self._get_api_url(0, start_date, end_date)
         parameters = self._get_request_params(api_url)
 
         if parameters["totalResults"] == 0:
@@ -369,74 +476,73 @@ class CPEConnector:
         total_request = math.ceil(
             parameters["totalResults"] / parameters["resultsPerPage"]
         )
-        stix_objects = []
 
         for i in range(total_request):
-            api_url = self._get_api_url(i * parameters["resultsPerPage"], None, None)
+            api_url = self._get_api_url(
+                i * parameters["resultsPerPage"], start_date, end_date
+            )
 
             json_objects = self._get_cpe_list(api_url)
             stix_objects = self._json_to_stix(json_objects)
 
-            bundle = stix2.Bundle(objects=stix_objects, allow_custom=True).serialize()
+            fingerprints = None
+            if self.store is not None:
+                total_objects = len(stix_objects)
+                stix_objects, fingerprints = self._filter_unchanged(stix_objects)
+                self.helper.log_info(
+                    f"{total_objects - len(stix_objects)} unchanged STIX objects skipped"
+                )
 
-            self.helper.log_info(
-                f"Sending {len(stix_objects)} STIX objects to OpenCTI..."
-            )
-            self.helper.send_stix2_bundle(
-                bundle,
-                update=False,
-                work_id=work_id,
-            )
+            if len(stix_objects) > 0:
+                bundle = stix2.Bundle(
+                    objects=stix_objects, allow_custom=True
+                ).serialize()
+
+                self.helper.log_info(
+                    f"Sending {len(stix_objects)} STIX objects to OpenCTI..."
+                )
+                self.helper.send_stix2_bundle(
+                    bundle,
+                    update=False,
+                    work_id=work_id,
+                )
+
+                # Only remember the CPEs once they are sent
+                if fingerprints:
+                    self.store.update(fingerprints)
 
             time.sleep(6)  # Sleep for 6 seconds as recommanded by NIST NVD API
 
-    def _import_date(self, work_id) -> None:
+    def _import_all(self, work_id) -> None:
         """
-        Imports the CPEs from the NIST API based on a time difference between the last run and the current time
+        Imports all the CPEs from the NIST API
 
         Args:
             work_id (str): The work ID to use
         """
 
         self.helper.log_info(
-            f"{self.helper.connect_name} connector is starting the collection of CPEs based on a time difference..."
+            f"{self.helper.connect_name} connector is starting the collection of all CPEs..."
         )
 
-        last_run_date = self._get_date_iso(self.last_run)
-        current_date = self._get_date_iso(self.current_run)
+        self._import_pages(work_id, None, None)
 
-        api_url = self._get_api_url(0, last_run_date, current_date)
-        parameters = self._get_request_params(api_url)
+    def _import_date(self, work_id) -> None:
+        """
+        Imports the CPEs from the NIST API based on a time difference between the last run and the current time
 
-        if parameters["totalResults"] == 0:
-            self.helper.log_info("No CPEs to import!")
-            return
+        Args:
+            work_id (str): The work ID to use
+        """
 
-        total_request = math.ceil(
-            parameters["totalResults"] / parameters["resultsPerPage"]
+        self.helper.log_info(
+            f"{self.helper.connect_name} connector is starting the collection of CPEs based on a time difference..."
         )
-        stix_objects = []
 
-        for i in range(total_request):
-            api_url = self._get_api_url(
-                i * parameters["resultsPerPage"], last_run_date, current_date
-            )
-
-            json_objects = self._get_cpe_list(api_url)
-            stix_objects = self._json_to_stix(json_objects)
-
-            bundle = stix2.Bundle(objects=stix_objects, allow_custom=True).serialize()
-
-            self.helper.log_info(
-                f"Sending {len(stix_objects)} STIX objects to OpenCTI..."
-            )
-            self.helper.send_stix2_bundle(
-                bundle,
-                update=False,
-                work_id=work_id,
-            )
+        last_run_date = self._get_date_iso(self.last_run)
+        current_date = self._get_date_iso(self.current_run)
 
-            time.sleep(6)  # Sleep for 6 seconds as recommanded by NIST NVD API
+        self._import_pages(work_id, last_run_date, current_date)
 
     def run(self) -> None:
         """
@@ -96,10 +96,50 @@ class CVEConnector:
     ) -> None:
         """
         Import CVEs history if pull_history config is True
+        The position reached is stored in the state after each page, so that an
+        interrupted history import resumes from it
         :param start_date: Start date in datetime
         :param end_date: End date in datetime
         :param work_id: Work id in string
         """
+        current_state = self.helper.get_state() or {}
+        cursor = current_state.get("history_cursor")
+
+        for window_start, window_end in self._history_windows(start_date, end_date):
+            start_index = 0
+            if cursor is not None:
+                cursor_start = datetime.fromisoformat(cursor["lastModStartDate"])
+                if window_start < cursor_start:
+                    continue
+                # The last window grows with the current date, its pages change
+                if (
+                    window_start == cursor_start
+                    and window_end.isoformat() == cursor["lastModEndDate"]
+                ):
+                    start_index = cursor["startIndex"]
+                    info_msg = (
+                        f"[CONNECTOR] Resuming CVE history from {window_start} "
+                        f"at index {start_index}"
+                    )
+                    self.helper.log_info(info_msg)
+                cursor = None
+
+            cve_params = self._update_cve_params(window_start, window_end)
+
+            def checkpoint(next_index: int, cve_params: dict = cve_params) -> None:
+                self.helper.set_state(
+                    {"history_cursor": cve_params | {"startIndex": next_index}}
+                )
+
+            self.converter.send_bundle(cve_params, work_id, start_index, checkpoint)
+
+    def _history_windows(self, start_date: datetime, end_date: datetime):
+        """
+        Split the history into date ranges of MAX_AUTHORIZED days at most
+        :param start_date: Start date in datetime
+        :param end_date: End date in datetime
+        :return: Generator of start and end dates in datetime
+        """
         years = range(start_date.year, end_date.year + 1)
         start, end = start_date, end_date + timedelta(1)
 
@@ -118,9 +158,6 @@ class CVEConnector:
             start_date_current_year = year_start
 
             while days_in_year > 0:
-                end_date_current_year = start_date_current_year + timedelta(
-                    days=MAX_AUTHORIZED
-                )
                 info_msg = (
                     f"[CONNECTOR] Connector retrieve CVE history for year {year}, "
                     f"{days_in_year} days left"
@@ -129,42 +166,25 @@ class CVEConnector:
 
                 """
                 If retrieve history for this year and days_in_year left are less than 120 days
-                Retrieve CVEs from the rest of days                         
+                Retrieve CVEs from the rest of days
+                Retrieving for each year MAX_AUTHORIZED = 120 days
+                1 year % 120 days => 5 or 6 (depends if it is a leap year or not)
                 """
                 if year == end_date.year and days_in_year < MAX_AUTHORIZED:
-                    end_date_current_year = start_date_current_year + timedelta(
+                    yield start_date_current_year, start_date_current_year + timedelta(
                         days=days_in_year
                     )
-                    # Update date range
-                    cve_params = self._update_cve_params(
-                        start_date_current_year, end_date_current_year
-                    )
-
-                    self.converter.send_bundle(cve_params, work_id)
                     days_in_year = 0
-
-                """
-                Retrieving for each year MAX_AUTHORIZED = 120 days
-                1 year % 120 days => 5 or 6 (depends if it is a leap year or not)
-                """
-                if days_in_year > 6:
-                    # Update date range
-                    cve_params = self._update_cve_params(
-                        start_date_current_year, end_date_current_year
+                elif days_in_year > 6:
+                    yield start_date_current_year, start_date_current_year + timedelta(
+                        days=MAX_AUTHORIZED
                     )
-
-                    self.converter.send_bundle(cve_params, work_id)
                     start_date_current_year += timedelta(days=MAX_AUTHORIZED)
                     days_in_year -= MAX_AUTHORIZED
                 else:
-                    end_date_current_year = start_date_current_year + timedelta(
+                    yield start_date_current_year, start_date_current_year + timedelta(
                         days=days_in_year
                     )
-                    # Update date range
-                    cve_params = self._update_cve_params(
-                        start_date_current_year, end_date_current_year
-                    )
-                    self.converter.send_bundle(cve_params, work_id)
                     days_in_year = 0
 
             info_msg = f"[CONNECTOR] Importing CVE history for year {year} finished"
@@ -1,12 +1,49 @@
+import threading
 import time
 
 import requests
 from requests.adapters import HTTPAdapter
+from services.utils import (  # type: ignore
+    NVD_ANONYMOUS_QUOTA,
+    NVD_KEYED_QUOTA,
+    NVD_QUOTA_WINDOW,
+)
 from urllib3.util import Retry
 
 from .endpoints import BASE_URL
 
 
+class TokenBucket:
+    """
+    Token bucket spreading requests evenly over the NVD quota
+    """
+
+    def __init__(self, requests: int, window: int):
+        """
+        Initialize the bucket
+        :param requests: Number of requests allowed in the window
+        :param window: Window in seconds
+        """
+        self.rate = requests / window
+        self.tokens = 1.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Wait until a request can be sent
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(1.0, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            # Take the token now and wait for it
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
 class CVEClient:
     """
     Working with CVE API
@@ -20,11 +57,30 @@ class CVEClient:
         :param header:
         """
         headers = {"Bearer": api_key, "User-Agent": header}
+        if api_key:
+            headers["apiKey"] = api_key
         self.token = api_key
         self.helper = helper
         self.session = requests.Session()
         self.session.headers.update(headers)
 
+        # Define the retry strategy
+        retry_strategy = Retry(
+            total=4,  # Maximum number of retries
+            backoff_factor=6,  # Exponential backoff factor (e.g., 2 means 1, 2, 4, 8 seconds, ...)
+            status_forcelist=[429, 500, 502, 503, 504],  # HTTP status codes to retry on
+        )
+        # Create an HTTP adapter with the retry strategy and mount it to session
+        adapter = HTTPAdapter(max_retries=retry_strategy)
+
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Requests allowed by NVD depend on the presence of an API key
+        self.limiter = TokenBucket(
+            NVD_KEYED_QUOTA if api_key else NVD_ANONYMOUS_QUOTA, NVD_QUOTA_WINDOW
+        )
+
     @staticmethod
     def _request_data(self, api_url: str, params=None):
         """
@@ -46,23 +102,11 @@ class CVEClient:
             return None
 
     def request(self, api_url, params):
-        # Define the retry strategy
-        retry_strategy = Retry(
-            total=4,  # Maximum number of retries
-            backoff_factor=6,  # Exponential backoff factor (e.g., 2 means 1, 2, 4, 8 seconds, ...)
-            status_forcelist=[429, 500, 502, 503, 504],  # HTTP status codes to retry on
-        )
-        # Create an HTTP adapter with the retry strategy and mount it to session
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
-
+        # Stay within the NVD quota instead of sleeping after every request
+        self.limiter.acquire()
         response = self.session.get(api_url, params=params)
 
         if response.status_code == 200:
-            # It is recommended that users "sleep" their scripts for six seconds between requests (NIST)
-            time.sleep(6)
             return response
         else:
             raise Exception(
@@ -8,69 +8,67 @@ class CVEVulnerability(CVEClient):
         :param cve_params: Dict of params
         :return: A list of dicts of CVE
         """
+        cve_vulnerabilities_filtered = []
+        for _, cve_vulnerabilities in self.get_vulnerability_pages(cve_params):
+            cve_vulnerabilities_filtered += cve_vulnerabilities
 
-        cve_collection = self.get_complete_collection(cve_params)
+        info_msg = (
+            f"[API] Filter for only CVSS 3.1 CVEs. "
+            f"Getting {len(cve_vulnerabilities_filtered)} vulnerabilities in total"
+        )
+        self.helper.log_info(info_msg)
 
-        if cve_collection is None:
-            raise Exception(
-                "Attempting to retrieve data failed. " "Wait for connector to re-run..."
-            )
+        return cve_vulnerabilities_filtered
 
-        page_size = cve_collection["resultsPerPage"]
-        cve_vulnerabilities_total = cve_collection["vulnerabilities"]
-        total_items = cve_collection["totalResults"]
+    def get_vulnerability_pages(self, cve_params=None, start_index: int = 0):
+        """
+        Get CVE with scoring system V3, page by page
+        :param cve_params: Dict of params
+        :param start_index: Index of the first CVE to retrieve
+        :return: Generator of the index of the next page and the CVEs of the page
+        """
+        cve_params = dict(cve_params or {})
+        total_items = None
 
-        if page_size == 0:
-            msg = "[API] No Vulnerabilities to retrieve..."
-            self.helper.log_info(msg)
-        elif page_size >= total_items:
-            msg = f"[API] Received all {page_size} items. Pagination not required."
-            self.helper.log_info(msg)
-        else:
-            msg = f"[API] Received first {page_size} items of {total_items} total items, start pagination..."
-            self.helper.log_info(msg)
+        while total_items is None or start_index < total_items:
+            if start_index > 0:
+                cve_params.update({"startIndex": start_index})
 
-            start_index = page_size
+            cve_collection = self.get_complete_collection(cve_params)
 
-            while start_index < total_items:
-                cve_params.update(
-                    {"startIndex": start_index, "resultsPerPage": page_size}
+            if cve_collection is None:
+                raise Exception(
+                    "Attempting to retrieve data failed. "
+                    "Wait for connector to re-run..."
                 )
 
-                cve_collection = self.get_complete_collection(cve_params)
-
-                if cve_collection is None:
-                    raise Exception(
-                        "Attempting to retrieve data failed. "
-                        "Wait for connector to re-run..."
-                    )
-
-                page_size = cve_collection["resultsPerPage"]
-                start_index += page_size
+            page_size = cve_collection["resultsPerPage"]
+            total_items = cve_collection["totalResults"]
 
-                msg = f"[API] Received next {page_size} items, currently received {start_index} items of {total_items} total items."
+            if page_size == 0:
+                msg = "[API] No Vulnerabilities to retrieve..."
                 self.helper.log_info(msg)
+                return
 
-                cve_vulnerabilities_total += cve_collection["vulnerabilities"]
+            # Keep the same page size for the next pages
+            cve_params.update({"resultsPerPage": page_size})
+            start_index += page_size
 
-        info_msg = (
-            f"[API] All CVEs are retrieved. "
-            f"Getting {len(cve_vulnerabilities_total)} vulnerabilities in total"
-        )
-        self.helper.log_info(info_msg)
+            msg = f"[API] Received {page_size} items, currently received {min(start_index, total_items)} items of {total_items} total items."
+            self.helper.log_info(msg)
 
-        cve_vulnerabilities_filtered = []
-        for cve_vulnerability in cve_vulnerabilities_total:
-            metric_exist = cve_vulnerability["cve"]["metrics"]
-            if metric_exist:
-                for key, value in metric_exist.items():
-                    if key == "cvssMetricV31":
-                        cve_vulnerabilities_filtered.append(cve_vulnerability)
+            yield start_index, self._filter_cvss_v31(cve_collection["vulnerabilities"])
 
-        info_msg = (
-            f"[API] Filter for only CVSS 3.1 CVEs. "
-            f"Getting {len(cve_vulnerabilities_filtered)} vulnerabilities in total"
-        )
-        self.helper.log_info(info_msg)
-
-        return cve_vulnerabilities_filtered
+    @staticmethod
+    def _filter_cvss_v31(cve_vulnerabilities: list) -> list:
+        """
+        Keep only CVE with a CVSS 3.1 metric
+        :param cve_vulnerabilities: List of dicts of CVE
+        :return: A list of dicts of CVE
+        """
+        return [
+            cve_vulnerability
+            for cve_vulnerability in cve_vulnerabilities
+            if cve_vulnerability["cve"]["metrics"]
+            and "cvssMetricV31" in cve_vulnerability["cve"]["metrics"]
+        ]
@@ -18,33 +18,45 @@ class CVEConverter:
         )
         self.author = self._create_author()
 
-    def send_bundle(self, cve_params: dict, work_id: str) -> None:
+    def send_bundle(
+        self,
+        cve_params: dict,
+        work_id: str,
+        start_index: int = 0,
+        checkpoint=None,
+    ) -> None:
         """
-        Send bundle to API
+        Send bundles to API, one for each page of CVEs
         :param cve_params: Dict of params
         :param work_id: work id in string
+        :param start_index: Index of the first CVE to retrieve
+        :param checkpoint: Called with the index of the next page once a page is sent
         :return:
         """
-        vulnerabilities_objects = self.vulnerabilities_to_stix2(cve_params)
-
-        if len(vulnerabilities_objects) != 0:
-            vulnerabilities_objects.append(self.author)
-            vulnerabilities_bundle = self._to_stix_bundle(vulnerabilities_objects)
-            vulnerabilities_to_json = self._to_json_bundle(vulnerabilities_bundle)
-
-            # Retrieve the author object for the info message
-            info_msg = (
-                f"[CONVERTER] Sending bundle to server with {len(vulnerabilities_bundle)} objects, "
-                f"concerning {len(vulnerabilities_objects) - 1} vulnerabilities"
-            )
-            self.helper.log_info(info_msg)
-
-            self.helper.send_stix2_bundle(
-                vulnerabilities_to_json,
-                work_id=work_id,
-            )
-        else:
-            pass
+        for next_index, vulnerabilities in self.client_api.get_vulnerability_pages(
+            cve_params, start_index
+        ):
+            vulnerabilities_objects = self._convert_vulnerabilities(vulnerabilities)
+
+            if len(vulnerabilities_objects) != 0:
+                vulnerabilities_objects.append(self.author)
+                vulnerabilities_bundle = self._to_stix_bundle(vulnerabilities_objects)
+                vulnerabilities_to_json = self._to_json_bundle(vulnerabilities_bundle)
+
+                # Retrieve the author object for the info message
+                info_msg = (
+                    f"[CONVERTER] Sending bundle to server with {len(vulnerabilities_bundle)} objects, "
+                    f"concerning {len(vulnerabilities_objects) - 1} vulnerabilities"
+                )
+                self.helper.log_info(info_msg)
+
+                self.helper.send_stix2_bundle(
+                    vulnerabilities_to_json,
+                    work_id=work_id,
+                )
+
+            if checkpoint is not None:
+                checkpoint(next_index)
 
     def vulnerabilities_to_stix2(self, cve_params: dict) -> list:
         """
@@ -53,7 +65,14 @@ class CVEConverter:
         :return: List of data converted into STIX2
         """
         vulnerabilities = self.client_api.get_vulnerabilities(cve_params)
+        return self._convert_vulnerabilities(vulnerabilities)
 
+    def _convert_vulnerabilities(self, vulnerabilities: list) -> list:
+        """
+        Convert CVEs into STIX2 format
+        :param vulnerabilities: List of dicts of CVE
+        :return: List of data converted into STIX2
+        """
         vulnerabilities_to_stix2 = []
 
         for vulnerability in vulnerabilities:
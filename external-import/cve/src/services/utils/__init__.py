@@ -1,3 +1,8 @@
 from .configVariables import ConfigCVE  # noqa: F401
-from .constants import MAX_AUTHORIZED  # noqa: F401
+from .constants import (  # noqa: F401
+    MAX_AUTHORIZED,
+    NVD_ANONYMOUS_QUOTA,
+    NVD_KEYED_QUOTA,
+    NVD_QUOTA_WINDOW,
+)
 from .version import __version__ as APP_VERSION  # noqa: F401
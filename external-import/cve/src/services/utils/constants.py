@@ -2,3 +2,7 @@ from pathlib import Path
 
 CONFIG_FILE_PATH = Path(__file__).parents[2].joinpath("config.yml")
 MAX_AUTHORIZED = 120
+# NVD quotas: number of requests in a rolling window of seconds
+NVD_QUOTA_WINDOW = 30
+NVD_KEYED_QUOTA = 50
+NVD_ANONYMOUS_QUOTA = 5
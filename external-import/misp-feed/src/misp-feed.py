@@ -1,15 +1,16 @@
 import json
 import os
 import re
-import ssl
 import sys
 import time
-import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional
 
 import boto3
 import pytz
+import requests
 import stix2
 import yaml
 from dateutil.parser import parse
@@ -32,6 +33,7 @@ from pycti import (
     Tool,
     get_config_variable,
 )
+from requests.adapters import HTTPAdapter
 
 PATTERNTYPES = ["yara", "sigma", "pcre", "snort", "suricata"]
 OPENCTISTIX2 = {
@@ -78,6 +80,43 @@ OPENCTISTIX2 = {
 FILETYPES = ["file-name", "file-md5", "file-sha1", "file-sha256"]
 
 
+class BundleBuilder:
+    """
+    Ordered list of STIX objects indexed by key and by uuid.
+
+    Membership checks and uuid lookups are O(1), so building the bundle of
+    an event with tens of thousands of attributes stays linear.
+    """
+
+    def __init__(self, objects=None):
+        self.objects = []
+        self._keys = set()
+        self._by_uuid = {}
+        for stix_object in objects or []:
+            self.add(stix_object)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, stix_object, key=None):
+        """Append the object unless its key (default: its id) is already known"""
+        key = stix_object["id"] if key is None else key
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self.objects.append(stix_object)
+        stix_id = stix_object["id"]
+        # Keep the first object seen for a uuid, like a linear scan would
+        self._by_uuid.setdefault(stix_id[stix_id.index("--") + 2 :], stix_object)
+        return True
+
+    def get_by_uuid(self, uuid):
+        return self._by_uuid.get(uuid)
+
+
 class MispFeed:
     def __init__(self):
         # Instantiate the connector helper from config
@@ -97,6 +136,13 @@ class MispFeed:
             False,
             default="url",
         )
+        self.misp_feed_download_workers = get_config_variable(
+            "MISP_FEED_DOWNLOAD_WORKERS",
+            ["misp_feed", "download_workers"],
+            config,
+            True,
+            1,
+        )
         if self.source_type == "url":
             self.misp_feed_url = get_config_variable(
                 "MISP_FEED_URL", ["misp_feed", "url"], config
@@ -104,6 +150,15 @@ class MispFeed:
             self.misp_feed_ssl_verify = get_config_variable(
                 "MISP_FEED_SSL_VERIFY", ["misp_feed", "ssl_verify"], config, False, True
             )
+            # Keep-alive connections shared by all the event downloads
+            self.session = requests.Session()
+            self.session.verify = self.misp_feed_ssl_verify
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=max(int(self.misp_feed_download_workers), 1),
+            )
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
         self.misp_feed_import_from_date = get_config_variable(
             "MISP_FEED_IMPORT_FROM_DATE", ["misp_feed", "import_from_date"], config
         )
@@ -225,30 +280,71 @@ class MispFeed:
             A string with the content or None in case of failure.
         """
         try:
-            return (
-                urllib.request.urlopen(
-                    url,
-                    context=ssl.create_default_context(),
-                )
-                .read()
-                .decode("utf-8")
-            )
-        except (
-            urllib.error.URLError,
-            urllib.error.HTTPError,
-            urllib.error.ContentTooShortError,
-        ) as urllib_error:
-            self.helper.log_error(f"Error retrieving url {url}: {urllib_error}")
+            response = self.session.get(url)
+            response.raise_for_status()
+            return response.text
+        except requests.exceptions.RequestException as request_error:
+            self.helper.log_error(f"Error retrieving url {url}: {request_error}")
         return None
 
-    def _send_bundle(self, work_id: str, serialized_bundle: str) -> None:
+    def _retrieve_json(self, url: str) -> Optional[dict]:
+        """
+        Retrieve and decode a JSON document from the given url.
+
+        The body is decoded straight from the response stream, without
+        building an intermediate copy of the whole text.
+
+        Parameters
+        ----------
+        url : str
+            Url to retrieve.
+
+        Returns
+        -------
+        dict
+            The decoded content or None in case of failure.
+        """
+        try:
+            with self.session.get(url, stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                return json.load(response.raw)
+        except (requests.exceptions.RequestException, ValueError) as request_error:
+            self.helper.log_error(f"Error retrieving url {url}: {request_error}")
+        return None
+
+    def _retrieve_s3_object(self, key: str) -> dict:
+        """
+        Retrieve and decode a JSON object from the bucket.
+
+        The object body is parsed straight from the S3 stream, nothing is
+        written on the local disk.
+
+        Parameters
+        ----------
+        key : str
+            Key of the object in the bucket.
+
+        Returns
+        -------
+        dict
+            The decoded content.
+        """
+        # Boto3 clients are thread safe, unlike the bucket resource
+        response = self.s3.meta.client.get_object(Bucket=self.s3.name, Key=key)
+        with response["Body"] as body:
+            return json.load(body)
+
+    def _send_bundle(self, work_id: str, serialized_bundle: str) -> bool:
         try:
             self.helper.send_stix2_bundle(
                 serialized_bundle,
                 work_id=work_id,
             )
+            return True
         except Exception as e:
             self.helper.log_error(f"Error while sending bundle: {e}")
+            return False
 
     def _resolve_markings(self, tags, with_default=True):
         markings = []
@@ -1670,14 +1766,11 @@ class MispFeed:
             }
 
     def _find_type_by_uuid(self, uuid, bundle_objects):
-        # filter by uuid
-        i_result = list(filter(lambda o: o.id.endswith("--" + uuid), bundle_objects))
-
-        if len(i_result) > 0:
-            uuid = i_result[0]["id"]
+        entity = bundle_objects.get_by_uuid(uuid)
+        if entity is not None:
             return {
-                "entity": i_result[0],
-                "type": uuid[: uuid.index("--")],
+                "entity": entity,
+                "type": entity["id"][: entity["id"].index("--")],
             }
         return None
 
@@ -1715,13 +1808,7 @@ class MispFeed:
                 raise ValueError("The list of is too long.")
 
         ### Default variables
-        added_markings = []
-        added_entities = []
-        added_object_refs = []
-        added_sightings = []
         added_files = []
-        added_observables = []
-        added_relationships = []
 
         ### Pre-process
         # Author
@@ -1892,13 +1979,11 @@ class MispFeed:
             # TODO Extend observable
 
         ### Prepare the bundle
-        bundle_objects = [author]
-        object_refs = []
+        bundle_objects = BundleBuilder([author])
+        object_refs = BundleBuilder()
         # Add event markings
         for event_marking in event_markings:
-            if event_marking["id"] not in added_markings:
-                bundle_objects.append(event_marking)
-                added_markings.append(event_marking["id"])
+            bundle_objects.add(event_marking)
         # Add event elements
         all_event_elements = (
             event_elements["intrusion_sets"]
@@ -1909,44 +1994,26 @@ class MispFeed:
             + event_elements["countries"]
         )
         for event_element in all_event_elements:
-            if event_element["id"] not in added_object_refs:
-                object_refs.append(event_element)
-                added_object_refs.append(event_element["id"])
-            if event_element["id"] not in added_entities:
-                bundle_objects.append(event_element)
-                added_entities.append(event_element["id"])
+            object_refs.add(event_element)
+            bundle_objects.add(event_element)
         # Add indicators
         for indicator in indicators:
             if indicator["indicator"] is not None:
-                if indicator["indicator"]["id"] not in added_object_refs:
-                    object_refs.append(indicator["indicator"])
-                    added_object_refs.append(indicator["indicator"]["id"])
-                if indicator["indicator"]["id"] not in added_entities:
-                    bundle_objects.append(indicator["indicator"])
-                    added_entities.append(indicator["indicator"]["id"])
+                object_refs.add(indicator["indicator"])
+                bundle_objects.add(indicator["indicator"])
             if indicator["observable"] is not None:
-                if indicator["observable"]["id"] not in added_object_refs:
-                    object_refs.append(indicator["observable"])
-                    added_object_refs.append(indicator["observable"]["id"])
-                if indicator["observable"]["id"] not in added_entities:
-                    bundle_objects.append(indicator["observable"])
-                    added_entities.append(indicator["observable"]["id"])
+                object_refs.add(indicator["observable"])
+                bundle_objects.add(indicator["observable"])
 
             # Add attribute markings
             for attribute_marking in indicator["markings"]:
-                if attribute_marking["id"] not in added_markings:
-                    bundle_objects.append(attribute_marking)
-                    added_markings.append(attribute_marking["id"])
+                bundle_objects.add(attribute_marking)
             # Add attribute sightings identities
             for attribute_identity in indicator["identities"]:
-                if attribute_identity["id"] not in added_entities:
-                    bundle_objects.append(attribute_identity)
-                    added_entities.append(attribute_identity["id"])
+                bundle_objects.add(attribute_identity)
             # Add attribute sightings
             for attribute_sighting in indicator["sightings"]:
-                if attribute_sighting["id"] not in added_sightings:
-                    bundle_objects.append(attribute_sighting)
-                    added_sightings.append(attribute_sighting["id"])
+                bundle_objects.add(attribute_sighting)
             # Add attribute elements
             all_attribute_elements = (
                 indicator["attribute_elements"]["intrusion_sets"]
@@ -1957,12 +2024,8 @@ class MispFeed:
                 + indicator["attribute_elements"]["countries"]
             )
             for attribute_element in all_attribute_elements:
-                if attribute_element["id"] not in added_object_refs:
-                    object_refs.append(attribute_element)
-                    added_object_refs.append(attribute_element["id"])
-                if attribute_element["id"] not in added_entities:
-                    bundle_objects.append(attribute_element)
-                    added_entities.append(attribute_element["id"])
+                object_refs.add(attribute_element)
+                bundle_objects.add(attribute_element)
             # Add attribute relationships
             for relationship in indicator["relationships"]:
                 indicators_relationships.append(relationship)
@@ -1972,12 +2035,8 @@ class MispFeed:
             objects_relationships.append(indicator_relationship)
         # Add MISP objects_observables
         for object_observable in objects_observables:
-            if object_observable["id"] not in added_object_refs:
-                object_refs.append(object_observable)
-                added_object_refs.append(object_observable["id"])
-            if object_observable["id"] not in added_observables:
-                bundle_objects.append(object_observable)
-                added_observables.append(object_observable["id"])
+            object_refs.add(object_observable)
+            bundle_objects.add(object_observable)
 
         # Link all objects with each other, now so we can find the correct entity type prefix in bundle_objects
         for object in event["Event"].get("Object", []):
@@ -2008,24 +2067,11 @@ class MispFeed:
                         )
         # Add object_relationships
         for object_relationship in objects_relationships:
-            if (
-                object_relationship["source_ref"] + object_relationship["target_ref"]
-                not in added_object_refs
-            ):
-                object_refs.append(object_relationship)
-                added_object_refs.append(
-                    object_relationship["source_ref"]
-                    + object_relationship["target_ref"]
-                )
-            if (
+            relationship_key = (
                 object_relationship["source_ref"] + object_relationship["target_ref"]
-                not in added_relationships
-            ):
-                bundle_objects.append(object_relationship)
-                added_relationships.append(
-                    object_relationship["source_ref"]
-                    + object_relationship["target_ref"]
-                )
+            )
+            object_refs.add(object_relationship, key=relationship_key)
+            bundle_objects.add(object_relationship, key=relationship_key)
 
         # Create the report if needed
         # Report in STIX must have at least one object_refs
@@ -2033,7 +2079,7 @@ class MispFeed:
             # Report in STIX lib must have at least one object_refs
             if len(object_refs) == 0:
                 # Put a fake ID in the report
-                object_refs.append(
+                object_refs.objects.append(
                     "intrusion-set--fc5ee88d-7987-4c00-991e-a863e9aa8a0e"
                 )
             report = stix2.Report(
@@ -2070,7 +2116,7 @@ class MispFeed:
                 created_by_ref=author["id"],
                 object_marking_refs=event_markings,
                 labels=event_tags,
-                object_refs=object_refs,
+                object_refs=object_refs.objects,
                 external_references=event_external_references,
                 confidence=self.helper.connect_confidence_level,
                 custom_properties={
@@ -2078,7 +2124,7 @@ class MispFeed:
                 },
                 allow_custom=True,
             )
-            bundle_objects.append(report)
+            bundle_objects.add(report)
             for note in event["Event"].get("EventReport", []):
                 note = stix2.Note(
                     id=Note.generate_id(
@@ -2101,8 +2147,64 @@ class MispFeed:
                     object_refs=[report],
                     allow_custom=True,
                 )
-                bundle_objects.append(note)
-        return stix2.Bundle(objects=bundle_objects, allow_custom=True).serialize()
+                bundle_objects.add(note)
+        return stix2.Bundle(
+            objects=bundle_objects.objects, allow_custom=True
+        ).serialize()
+
+    def _process_s3_object(self, work_id, key, event_future) -> None:
+        try:
+            file_name = key.split("/")[-1]
+            events = event_future.result()
+            bundle = self._process_event(events)
+            self.helper.log_info("Sending event STIX2 bundle...")
+            if not self._send_bundle(work_id, bundle):
+                return
+            self.s3.meta.client.delete_object(Bucket=self.s3.name, Key=key)
+            self.helper.set_state({"last_file": file_name})
+        except Exception as e:
+            self.helper.log_error(str(e))
+
+    def _process_url_event(self, work_id, now, item, event_future) -> int:
+        last_event_timestamp = item["timestamp"]
+        self.helper.log_info(
+            "Processing event "
+            + item["info"]
+            + " (date="
+            + item["date"]
+            + ", modified="
+            + datetime.utcfromtimestamp(last_event_timestamp)
+            .astimezone(pytz.UTC)
+            .isoformat()
+            + ")"
+        )
+        event = event_future.result()
+        if event is None:
+            raise ValueError("Unable to retrieve event " + item["event_key"])
+        bundle = self._process_event(event)
+        self.helper.log_info("Sending event STIX2 bundle...")
+        self._send_bundle(work_id, bundle)
+        message = (
+            "Event processed, storing state (last_run="
+            + now.astimezone(pytz.utc).isoformat()
+            + ", last_event="
+            + datetime.utcfromtimestamp(last_event_timestamp)
+            .astimezone(pytz.UTC)
+            .isoformat()
+            + ", last_event_timestamp="
+            + str(last_event_timestamp)
+        )
+        self.helper.set_state(
+            {
+                "last_run": now.astimezone(pytz.utc).isoformat(),
+                "last_event": datetime.utcfromtimestamp(last_event_timestamp)
+                .astimezone(pytz.UTC)
+                .isoformat(),
+                "last_event_timestamp": last_event_timestamp,
+            }
+        )
+        self.helper.log_info(message)
+        return last_event_timestamp
 
     def process_data(self):
         try:
@@ -2119,20 +2221,24 @@ class MispFeed:
                 else:
                     objects = self.s3.objects.all()
 
-                for obj in objects:
-                    try:
-                        file_name = obj.key.split("/")[-1]
-                        self.s3.download_file(obj.key, file_name)
-                        events = json.load(open(file_name, "r"))
-                        bundle = self._process_event(events)
-                        self._send_bundle(work_id, bundle)
-                        self.s3.Object(obj.key).delete()
-                        os.remove(file_name)
-                        self.helper.set_state({"last_file": file_name})
-                        self.helper.log_info("Sending event STIX2 bundle...")
-
-                    except Exception as e:
-                        self.helper.log_error(str(e))
+                # The next objects are fetched by the workers while the current
+                # one is converted, it is deleted only once its bundle is sent
+                pending_objects = deque()
+                with ThreadPoolExecutor(
+                    max_workers=self.misp_feed_download_workers
+                ) as executor:
+                    for obj in objects:
+                        pending_objects.append(
+                            (
+                                obj.key,
+                                executor.submit(self._retrieve_s3_object, obj.key),
+                            )
+                        )
+                        if len(pending_objects) < self.misp_feed_download_workers:
+                            continue
+                        self._process_s3_object(work_id, *pending_objects.popleft())
+                    while len(pending_objects) > 0:
+                        self._process_s3_object(work_id, *pending_objects.popleft())
 
             if self.source_type == "url":
                 if (
@@ -2182,55 +2288,41 @@ class MispFeed:
                         value["timestamp"] = int(value["timestamp"])
                         items.append({**value, "event_key": key})
                     items = sorted(items, key=lambda d: d["timestamp"])
-                    for item in items:
-                        if item["timestamp"] > last_event_timestamp:
-                            last_event_timestamp = item["timestamp"]
-                            self.helper.log_info(
-                                "Processing event "
-                                + item["info"]
-                                + " (date="
-                                + item["date"]
-                                + ", modified="
-                                + datetime.utcfromtimestamp(last_event_timestamp)
-                                .astimezone(pytz.UTC)
-                                .isoformat()
-                                + ")"
-                            )
-
-                            event = json.loads(
-                                self._retrieve_data(
-                                    self.misp_feed_url
-                                    + "/"
-                                    + item["event_key"]
-                                    + ".json"
+                    items = [
+                        item
+                        for item in items
+                        if item["timestamp"] > last_event_timestamp
+                    ]
+                    # Events are downloaded ahead by the workers, but converted,
+                    # sent and stored in manifest order so the state only moves forward
+                    pending_events = deque()
+                    with ThreadPoolExecutor(
+                        max_workers=self.misp_feed_download_workers
+                    ) as executor:
+                        for item in items:
+                            pending_events.append(
+                                (
+                                    item,
+                                    executor.submit(
+                                        self._retrieve_json,
+                                        self.misp_feed_url
+                                        + "/"
+                                        + item["event_key"]
+                                        + ".json",
+                                    ),
                                 )
                             )
-                            bundle = self._process_event(event)
-                            self.helper.log_info("Sending event STIX2 bundle...")
-                            self._send_bundle(work_id, bundle)
-                            number_events = number_events + 1
-                            message = (
-                                "Event processed, storing state (last_run="
-                                + now.astimezone(pytz.utc).isoformat()
-                                + ", last_event="
-                                + datetime.utcfromtimestamp(last_event_timestamp)
-                                .astimezone(pytz.UTC)
-                                .isoformat()
-                                + ", last_event_timestamp="
-                                + str(last_event_timestamp)
+                            if len(pending_events) < self.misp_feed_download_workers:
+                                continue
+                            last_event_timestamp = self._process_url_event(
+                                work_id, now, *pending_events.popleft()
                             )
-                            self.helper.set_state(
-                                {
-                                    "last_run": now.astimezone(pytz.utc).isoformat(),
-                                    "last_event": datetime.utcfromtimestamp(
-                                        last_event_timestamp
-                                    )
-                                    .astimezone(pytz.UTC)
-                                    .isoformat(),
-                                    "last_event_timestamp": last_event_timestamp,
-                                }
+                            number_events = number_events + 1
+                        while len(pending_events) > 0:
+                            last_event_timestamp = self._process_url_event(
+                                work_id, now, *pending_events.popleft()
                             )
-                            self.helper.log_info(message)
+                            number_events = number_events + 1
                 except Exception as e:
                     self.helper.log_error(str(e))
 
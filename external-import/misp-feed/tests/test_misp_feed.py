@@ -0,0 +1,95 @@
+import importlib.util
+import json
+import os
+from unittest.mock import Mock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+# The connector module name isn't importable as is
+spec = importlib.util.spec_from_file_location(
+    "misp_feed",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/misp-feed.py")),
+)
+misp_feed = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(misp_feed)
+
+BUCKET = "misp-feed"
+KEY = "feed/event.json"
+EVENT = {"Event": {"uuid": "5f8c2a4e-8a1c-4b6a-9d52-3c1e7f6a1b2d", "info": "test"}}
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        s3 = boto3.resource("s3")
+        s3.create_bucket(Bucket=BUCKET)
+        s3.Object(BUCKET, KEY).put(Body=json.dumps(EVENT))
+        yield s3.Bucket(BUCKET)
+
+
+@pytest.fixture
+def connector(bucket):
+    connector = misp_feed.MispFeed.__new__(misp_feed.MispFeed)
+    connector.helper = Mock()
+    connector.s3 = bucket
+    connector._process_event = Mock(return_value="bundle")
+    return connector
+
+
+def object_keys(bucket):
+    return [obj.key for obj in bucket.objects.all()]
+
+
+def test_retrieve_s3_object(connector):
+    assert connector._retrieve_s3_object(KEY) == EVENT
+
+
+def test_s3_object_deleted_once_sent(connector, bucket):
+    connector._send_bundle = Mock(return_value=True)
+    event_future = Mock(result=lambda: connector._retrieve_s3_object(KEY))
+
+    connector._process_s3_object("work-id", KEY, event_future)
+
+    connector._process_event.assert_called_once_with(EVENT)
+    connector._send_bundle.assert_called_once_with("work-id", "bundle")
+    assert object_keys(bucket) == []
+    connector.helper.set_state.assert_called_once_with({"last_file": "event.json"})
+
+
+def test_s3_object_kept_when_send_fails(connector, bucket):
+    connector._send_bundle = Mock(return_value=False)
+    event_future = Mock(result=lambda: connector._retrieve_s3_object(KEY))
+
+    connector._process_s3_object("work-id", KEY, event_future)
+
+    assert object_keys(bucket) == [KEY]
+    connector.helper.set_state.assert_not_called()
+
+
+def test_s3_object_kept_when_conversion_fails(connector, bucket):
+    connector._send_bundle = Mock(return_value=True)
+    connector._process_event = Mock(side_effect=ValueError("invalid event"))
+    event_future = Mock(result=lambda: connector._retrieve_s3_object(KEY))
+
+    connector._process_s3_object("work-id", KEY, event_future)
+
+    connector._send_bundle.assert_not_called()
+    assert object_keys(bucket) == [KEY]
+    connector.helper.set_state.assert_not_called()
+
+
+def test_url_source_init(monkeypatch):
+    monkeypatch.setattr(misp_feed, "OpenCTIConnectorHelper", Mock())
+    monkeypatch.setenv("MISP_FEED_URL", "https://feed.example.com")
+    monkeypatch.setenv("MISP_FEED_DOWNLOAD_WORKERS", "4")
+
+    connector = misp_feed.MispFeed()
+
+    assert connector.source_type == "url"
+    adapter = connector.session.get_adapter("https://feed.example.com")
+    assert adapter._pool_maxsize == 4
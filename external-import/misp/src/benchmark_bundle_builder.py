@@ -0,0 +1,290 @@
+"""
+Assemble the bundle of a synthetic MISP event with the BundleBuilder
+
+    python benchmark_bundle_builder.py [--attributes 50000] [--reference-attributes 2000]
+
+The event bundle is assembled like in Misp.process_events: deduplication of the
+bundle objects and of the report object_refs, then the ObjectReference links
+resolved by uuid. The previous implementation, with lists and a scan of the
+bundle for every uuid, is run on a smaller event (its cost is quadratic) and
+must give the same bundle, object_refs and links as the builder, the script
+exits with an error otherwise.
+"""
+
+import argparse
+import random
+import sys
+import time
+import uuid
+
+from misp import BundleBuilder
+
+ELEMENT_TYPES = [
+    "intrusion_sets",
+    "malwares",
+    "tools",
+    "attack_patterns",
+    "sectors",
+    "countries",
+    "regions",
+]
+
+
+def new_id(stix_type: str, rng: random.Random) -> str:
+    return stix_type + "--" + str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def generate_event(count: int, rng: random.Random) -> dict:
+    """Converted objects of an event with `count` attributes, as built by the connector"""
+    markings = [{"id": new_id("marking-definition", rng)} for _ in range(4)]
+    identities = [{"id": new_id("identity", rng)} for _ in range(50)]
+    malwares = [{"id": new_id("malware", rng)} for _ in range(100)]
+
+    indicators = []
+    for i in range(count):
+        indicator = {"id": new_id("indicator", rng)}
+        observable = {"id": new_id("ipv4-addr", rng)} if i % 4 != 0 else None
+        attribute_elements = {element_type: [] for element_type in ELEMENT_TYPES}
+        attribute_elements["malwares"] = rng.sample(malwares, 2)
+        sightings = []
+        sighting_identities = []
+        if i % 10 == 0:
+            sighting_identities = [rng.choice(identities)]
+            sightings = [{"id": new_id("sighting", rng)}]
+        relationships = []
+        if observable is not None:
+            relationships.append(
+                {
+                    "id": new_id("relationship", rng),
+                    "source_ref": indicator["id"],
+                    "target_ref": observable["id"],
+                }
+            )
+        for malware in attribute_elements["malwares"]:
+            relationships.append(
+                {
+                    "id": new_id("relationship", rng),
+                    "source_ref": indicator["id"],
+                    "target_ref": malware["id"],
+                }
+            )
+        indicators.append(
+            {
+                "indicator": indicator,
+                "observable": observable,
+                "markings": [rng.choice(markings)],
+                "identities": sighting_identities,
+                "sightings": sightings,
+                "attribute_elements": attribute_elements,
+                "relationships": relationships,
+            }
+        )
+
+    # One MISP object for 5 attributes, each referencing another object
+    objects_observables = [
+        {"id": new_id("x-opencti-text", rng)} for _ in range(max(count // 5, 1))
+    ]
+    object_uuids = [o["id"][o["id"].index("--") + 2 :] for o in objects_observables]
+    misp_objects = [
+        {
+            "ObjectReference": [
+                {
+                    "source_uuid": object_uuid,
+                    "referenced_uuid": rng.choice(object_uuids),
+                },
+                # Not converted, the link is skipped
+                {
+                    "source_uuid": object_uuid,
+                    "referenced_uuid": str(
+                        uuid.UUID(int=rng.getrandbits(128), version=4)
+                    ),
+                },
+            ]
+        }
+        for object_uuid in object_uuids
+    ]
+
+    event_elements = {element_type: [] for element_type in ELEMENT_TYPES}
+    event_elements["malwares"] = malwares[:5]
+    return {
+        "author": {"id": new_id("identity", rng)},
+        "event_markings": markings[:1],
+        "event_elements": event_elements,
+        "indicators": indicators,
+        "objects_observables": objects_observables,
+        "misp_objects": misp_objects,
+    }
+
+
+def assemble_with_builder(event: dict):
+    bundle_objects = BundleBuilder([event["author"]])
+    object_refs = BundleBuilder()
+    for event_marking in event["event_markings"]:
+        bundle_objects.add(event_marking)
+    for element_type in ELEMENT_TYPES:
+        for event_element in event["event_elements"][element_type]:
+            object_refs.add(event_element)
+            bundle_objects.add(event_element)
+    relationships = []
+    for indicator in event["indicators"]:
+        if indicator["indicator"] is not None:
+            object_refs.add(indicator["indicator"])
+            bundle_objects.add(indicator["indicator"])
+        if indicator["observable"] is not None:
+            object_refs.add(indicator["observable"])
+            bundle_objects.add(indicator["observable"])
+        for attribute_marking in indicator["markings"]:
+            bundle_objects.add(attribute_marking)
+        for attribute_identity in indicator["identities"]:
+            bundle_objects.add(attribute_identity)
+        for attribute_sighting in indicator["sightings"]:
+            bundle_objects.add(attribute_sighting)
+        for element_type in ELEMENT_TYPES:
+            for attribute_element in indicator["attribute_elements"][element_type]:
+                object_refs.add(attribute_element)
+                bundle_objects.add(attribute_element)
+        relationships.extend(indicator["relationships"])
+    for object_observable in event["objects_observables"]:
+        object_refs.add(object_observable)
+        bundle_objects.add(object_observable)
+
+    links = []
+    for misp_object in event["misp_objects"]:
+        for ref in misp_object["ObjectReference"]:
+            source = bundle_objects.get_by_uuid(ref["source_uuid"])
+            target = bundle_objects.get_by_uuid(ref["referenced_uuid"])
+            if source is not None and target is not None:
+                links.append((source["id"], target["id"]))
+    for relationship in relationships:
+        relationship_key = relationship["source_ref"] + relationship["target_ref"]
+        object_refs.add(relationship, key=relationship_key)
+        bundle_objects.add(relationship, key=relationship_key)
+    return bundle_objects.objects, object_refs.objects, links
+
+
+def find_by_uuid_scan(uuid_value: str, bundle_objects: list):
+    # Previous find_type_by_uuid
+    result = list(filter(lambda o: o["id"].endswith("--" + uuid_value), bundle_objects))
+    return result[0] if len(result) > 0 else None
+
+
+def assemble_with_lists(event: dict):
+    """Previous implementation of the bundle assembly"""
+    added_markings = []
+    added_entities = []
+    added_object_refs = []
+    added_sightings = []
+    added_observables = []
+    added_relationships = []
+    bundle_objects = [event["author"]]
+    object_refs = []
+    for event_marking in event["event_markings"]:
+        if event_marking["id"] not in added_markings:
+            bundle_objects.append(event_marking)
+            added_markings.append(event_marking["id"])
+    for element_type in ELEMENT_TYPES:
+        for event_element in event["event_elements"][element_type]:
+            if event_element["id"] not in added_object_refs:
+                object_refs.append(event_element)
+                added_object_refs.append(event_element["id"])
+            if event_element["id"] not in added_entities:
+                bundle_objects.append(event_element)
+                added_entities.append(event_element["id"])
+    relationships = []
+    for indicator in event["indicators"]:
+        for stix_object in (indicator["indicator"], indicator["observable"]):
+            if stix_object is not None:
+                if stix_object["id"] not in added_object_refs:
+                    object_refs.append(stix_object)
+                    added_object_refs.append(stix_object["id"])
+                if stix_object["id"] not in added_entities:
+                    bundle_objects.append(stix_object)
+                    added_entities.append(stix_object["id"])
+        for attribute_marking in indicator["markings"]:
+            if attribute_marking["id"] not in added_markings:
+                bundle_objects.append(attribute_marking)
+                added_markings.append(attribute_marking["id"])
+        for attribute_identity in indicator["identities"]:
+            if attribute_identity["id"] not in added_entities:
+                bundle_objects.append(attribute_identity)
+                added_entities.append(attribute_identity["id"])
+        for attribute_sighting in indicator["sightings"]:
+            if attribute_sighting["id"] not in added_sightings:
+                bundle_objects.append(attribute_sighting)
+                added_sightings.append(attribute_sighting["id"])
+        for element_type in ELEMENT_TYPES:
+            for attribute_element in indicator["attribute_elements"][element_type]:
+                if attribute_element["id"] not in added_object_refs:
+                    object_refs.append(attribute_element)
+                    added_object_refs.append(attribute_element["id"])
+                if attribute_element["id"] not in added_entities:
+                    bundle_objects.append(attribute_element)
+                    added_entities.append(attribute_element["id"])
+        relationships.extend(indicator["relationships"])
+    for object_observable in event["objects_observables"]:
+        if object_observable["id"] not in added_object_refs:
+            object_refs.append(object_observable)
+            added_object_refs.append(object_observable["id"])
+        if object_observable["id"] not in added_observables:
+            bundle_objects.append(object_observable)
+            added_observables.append(object_observable["id"])
+
+    links = []
+    for misp_object in event["misp_objects"]:
+        for ref in misp_object["ObjectReference"]:
+            source = find_by_uuid_scan(ref["source_uuid"], bundle_objects)
+            target = find_by_uuid_scan(ref["referenced_uuid"], bundle_objects)
+            if source is not None and target is not None:
+                links.append((source["id"], target["id"]))
+    for relationship in relationships:
+        relationship_key = relationship["source_ref"] + relationship["target_ref"]
+        if relationship_key not in added_object_refs:
+            object_refs.append(relationship)
+            added_object_refs.append(relationship_key)
+        if relationship_key not in added_relationships:
+            bundle_objects.append(relationship)
+            added_relationships.append(relationship_key)
+    return bundle_objects, object_refs, links
+
+
+def timed(assemble, event: dict, label: str):
+    start = time.perf_counter()
+    result = assemble(event)
+    print(
+        f"{label}: {len(event['indicators'])} attributes, {len(result[0])} bundle "
+        f"objects, {len(result[2])} links in {time.perf_counter() - start:.2f}s"
+    )
+    return result
+
+
+def same_result(left, right) -> bool:
+    return all(
+        [o["id"] for o in left_objects] == [o["id"] for o in right_objects]
+        for left_objects, right_objects in zip(left[:2], right[:2])
+    ) and (left[2] == right[2])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--attributes", type=int, default=50000)
+    parser.add_argument("--reference-attributes", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    event = generate_event(args.attributes, random.Random(args.seed))
+    timed(assemble_with_builder, event, "builder")
+
+    reference_event = generate_event(
+        args.reference_attributes, random.Random(args.seed)
+    )
+    builder_result = timed(assemble_with_builder, reference_event, "builder")
+    lists_result = timed(assemble_with_lists, reference_event, "lists")
+
+    if not same_result(builder_result, lists_result):
+        print("The builder and the lists give different bundles", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
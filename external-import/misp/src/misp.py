@@ -5,6 +5,8 @@ import sys
 import time
 import traceback
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import pytz
@@ -112,6 +114,43 @@ def parse_filter_config(config):
     return filters
 
 
+class BundleBuilder:
+    """
+    Ordered list of STIX objects indexed by key and by uuid.
+
+    Membership checks and uuid lookups are O(1), so building the bundle of
+    an event with tens of thousands of attributes stays linear.
+    """
+
+    def __init__(self, objects=None):
+        self.objects = []
+        self._keys = set()
+        self._by_uuid = {}
+        for stix_object in objects or []:
+            self.add(stix_object)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, stix_object, key=None):
+        """Append the object unless its key (default: its id) is already known"""
+        key = stix_object["id"] if key is None else key
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self.objects.append(stix_object)
+        stix_id = stix_object["id"]
+        # Keep the first object seen for a uuid, like a linear scan would
+        self._by_uuid.setdefault(stix_id[stix_id.index("--") + 2 :], stix_object)
+        return True
+
+    def get_by_uuid(self, uuid):
+        return self._by_uuid.get(uuid)
+
+
 class Misp:
     def __init__(self):
         # Instantiate the connector helper from config
@@ -283,6 +322,16 @@ class Misp:
         self.misp_interval = get_config_variable(
             "MISP_INTERVAL", ["misp", "interval"], config, isNumber=True
         )
+        self.misp_page_size = get_config_variable(
+            "MISP_PAGE_SIZE", ["misp", "page_size"], config, isNumber=True, default=10
+        )
+        self.misp_process_workers = get_config_variable(
+            "MISP_PROCESS_WORKERS",
+            ["misp", "process_workers"],
+            config,
+            isNumber=True,
+            default=1,
+        )
 
         # Initialize MISP
         self.misp = PyMISP(
@@ -378,66 +427,57 @@ class Misp:
             if self.import_with_attachments:
                 kwargs["with_attachments"] = self.import_with_attachments
 
-            # Query with pagination of 50
+            # Query with pagination, pages are converted by a pool of workers
+            # while the next ones are fetched
             current_state = self.helper.get_state()
             if current_state is not None and "current_page" in current_state:
                 current_page = current_state["current_page"]
             else:
                 current_page = 1
             number_events = 0
-            while True:
-                kwargs["limit"] = 10
-                kwargs["page"] = current_page
-                if self.misp_import_keyword is not None:
-                    kwargs["value"] = self.misp_import_keyword
-                    kwargs["searchall"] = True
-                if self.misp_enforce_warning_list is not None:
-                    kwargs["enforce_warninglist"] = self.misp_enforce_warning_list
-                self.helper.log_info(
-                    "Fetching MISP events with args: " + json.dumps(kwargs)
-                )
-                kwargs = json.loads(json.dumps(kwargs))
-                events = []
-                try:
-                    events = self.misp.search("events", **kwargs)
-                    if isinstance(events, dict):
-                        if "errors" in events:
-                            raise ValueError(events["message"])
-                except Exception as e:
-                    self.helper.log_error(f"Error fetching misp event: {e}")
-                    self.helper.metric.inc("client_error_count")
-                    try:
-                        events = self.misp.search("events", **kwargs)
-                        if isinstance(events, dict):
-                            if "errors" in events:
-                                raise ValueError(events["message"])
-                    except Exception as e:
-                        self.helper.log_error(f"Error fetching misp event again: {e}")
-                        self.helper.metric.inc("client_error_count")
+            pending_pages = deque()
+            with ThreadPoolExecutor(max_workers=self.misp_process_workers) as executor:
+                while True:
+                    kwargs["limit"] = self.misp_page_size
+                    kwargs["page"] = current_page
+                    if self.misp_import_keyword is not None:
+                        kwargs["value"] = self.misp_import_keyword
+                        kwargs["searchall"] = True
+                    if self.misp_enforce_warning_list is not None:
+                        kwargs["enforce_warninglist"] = self.misp_enforce_warning_list
+                    self.helper.log_info(
+                        "Fetching MISP events with args: " + json.dumps(kwargs)
+                    )
+                    kwargs = json.loads(json.dumps(kwargs))
+                    events = self.fetch_events(kwargs)
+                    if events is None:
                         break
 
-                self.helper.log_info("MISP returned " + str(len(events)) + " events.")
-                number_events = number_events + len(events)
-
-                # Break if no more result
-                if len(events) == 0:
-                    break
+                    self.helper.log_info(
+                        "MISP returned " + str(len(events)) + " events."
+                    )
+                    number_events = number_events + len(events)
 
-                # Process the event
-                processed_events_last_timestamp = self.process_events(work_id, events)
-                if (
-                    processed_events_last_timestamp is not None
-                    and processed_events_last_timestamp > last_event_timestamp
-                ):
-                    last_event_timestamp = processed_events_last_timestamp
+                    # Break if no more result
+                    if len(events) == 0:
+                        break
 
-                # Next page
-                current_page += 1
-                if current_state is not None:
-                    current_state["current_page"] = current_page
-                else:
-                    current_state = {"current_page": current_page}
-                self.helper.set_state(current_state)
+                    # Process the events, waiting for the oldest pages when the pool is full
+                    pending_pages.append(
+                        (
+                            current_page,
+                            executor.submit(self.process_events, work_id, events),
+                        )
+                    )
+                    while len(pending_pages) >= self.misp_process_workers:
+                        last_event_timestamp, current_state = self.complete_page(
+                            pending_pages.popleft(), last_event_timestamp, current_state
+                        )
+                    current_page += 1
+                while len(pending_pages) > 0:
+                    last_event_timestamp, current_state = self.complete_page(
+                        pending_pages.popleft(), last_event_timestamp, current_state
+                    )
             # Loop is over, storing the state
             # We cannot store the state before, because MISP events are NOT ordered properly
             # and there is NO WAY to order them using their library
@@ -476,6 +516,44 @@ class Misp:
             self.helper.metric.state("idle")
             time.sleep(self.get_interval())
 
+    def fetch_events(self, kwargs):
+        try:
+            events = self.misp.search("events", **kwargs)
+            if isinstance(events, dict):
+                if "errors" in events:
+                    raise ValueError(events["message"])
+        except Exception as e:
+            self.helper.log_error(f"Error fetching misp event: {e}")
+            self.helper.metric.inc("client_error_count")
+            try:
+                events = self.misp.search("events", **kwargs)
+                if isinstance(events, dict):
+                    if "errors" in events:
+                        raise ValueError(events["message"])
+            except Exception as e:
+                self.helper.log_error(f"Error fetching misp event again: {e}")
+                self.helper.metric.inc("client_error_count")
+                return None
+        return events
+
+    def complete_page(self, pending_page, last_event_timestamp, current_state):
+        # Pages are completed in order, so the stored page can be safely resumed
+        page, future = pending_page
+        processed_events_last_timestamp = future.result()
+        if (
+            processed_events_last_timestamp is not None
+            and processed_events_last_timestamp > last_event_timestamp
+        ):
+            last_event_timestamp = processed_events_last_timestamp
+
+        # Next page
+        if current_state is not None:
+            current_state["current_page"] = page + 1
+        else:
+            current_state = {"current_page": page + 1}
+        self.helper.set_state(current_state)
+        return last_event_timestamp, current_state
+
     def process_events(self, work_id, events):
         # Prepare filters
         import_creator_orgs = None
@@ -577,13 +655,7 @@ class Misp:
                 continue
 
             ### Default variables
-            added_markings = []
-            added_entities = []
-            added_object_refs = []
-            added_sightings = []
             added_files = []
-            added_observables = []
-            added_relationships = []
 
             ### Pre-process
             # Author
@@ -774,13 +846,11 @@ class Misp:
                 # TODO Extend observable
 
             ### Prepare the bundle
-            bundle_objects = [author]
-            object_refs = []
+            bundle_objects = BundleBuilder([author])
+            object_refs = BundleBuilder()
             # Add event markings
             for event_marking in event_markings:
-                if event_marking["id"] not in added_markings:
-                    bundle_objects.append(event_marking)
-                    added_markings.append(event_marking["id"])
+                bundle_objects.add(event_marking)
             # Add event elements
             all_event_elements = (
                 event_elements["intrusion_sets"]
@@ -792,44 +862,26 @@ class Misp:
                 + event_elements["regions"]
             )
             for event_element in all_event_elements:
-                if event_element["id"] not in added_object_refs:
-                    object_refs.append(event_element)
-                    added_object_refs.append(event_element["id"])
-                if event_element["id"] not in added_entities:
-                    bundle_objects.append(event_element)
-                    added_entities.append(event_element["id"])
+                object_refs.add(event_element)
+                bundle_objects.add(event_element)
             # Add indicators
             for indicator in indicators:
                 if indicator["indicator"] is not None:
-                    if indicator["indicator"]["id"] not in added_object_refs:
-                        object_refs.append(indicator["indicator"])
-                        added_object_refs.append(indicator["indicator"]["id"])
-                    if indicator["indicator"]["id"] not in added_entities:
-                        bundle_objects.append(indicator["indicator"])
-                        added_entities.append(indicator["indicator"]["id"])
+                    object_refs.add(indicator["indicator"])
+                    bundle_objects.add(indicator["indicator"])
                 if indicator["observable"] is not None:
-                    if indicator["observable"]["id"] not in added_object_refs:
-                        object_refs.append(indicator["observable"])
-                        added_object_refs.append(indicator["observable"]["id"])
-                    if indicator["observable"]["id"] not in added_entities:
-                        bundle_objects.append(indicator["observable"])
-                        added_entities.append(indicator["observable"]["id"])
+                    object_refs.add(indicator["observable"])
+                    bundle_objects.add(indicator["observable"])
 
                 # Add attribute markings
                 for attribute_marking in indicator["markings"]:
-                    if attribute_marking["id"] not in added_markings:
-                        bundle_objects.append(attribute_marking)
-                        added_markings.append(attribute_marking["id"])
+                    bundle_objects.add(attribute_marking)
                 # Add attribute sightings identities
                 for attribute_identity in indicator["identities"]:
-                    if attribute_identity["id"] not in added_entities:
-                        bundle_objects.append(attribute_identity)
-                        added_entities.append(attribute_identity["id"])
+                    bundle_objects.add(attribute_identity)
                 # Add attribute sightings
                 for attribute_sighting in indicator["sightings"]:
-                    if attribute_sighting["id"] not in added_sightings:
-                        bundle_objects.append(attribute_sighting)
-                        added_sightings.append(attribute_sighting["id"])
+                    bundle_objects.add(attribute_sighting)
                 # Add attribute elements
                 all_attribute_elements = (
                     indicator["attribute_elements"]["intrusion_sets"]
@@ -841,12 +893,8 @@ class Misp:
                     + indicator["attribute_elements"]["regions"]
                 )
                 for attribute_element in all_attribute_elements:
-                    if attribute_element["id"] not in added_object_refs:
-                        object_refs.append(attribute_element)
-                        added_object_refs.append(attribute_element["id"])
-                    if attribute_element["id"] not in added_entities:
-                        bundle_objects.append(attribute_element)
-                        added_entities.append(attribute_element["id"])
+                    object_refs.add(attribute_element)
+                    bundle_objects.add(attribute_element)
                 # Add attribute relationships
                 for relationship in indicator["relationships"]:
                     indicators_relationships.append(relationship)
@@ -856,12 +904,8 @@ class Misp:
                 objects_relationships.append(indicator_relationship)
             # Add MISP objects_observables
             for object_observable in objects_observables:
-                if object_observable["id"] not in added_object_refs:
-                    object_refs.append(object_observable)
-                    added_object_refs.append(object_observable["id"])
-                if object_observable["id"] not in added_observables:
-                    bundle_objects.append(object_observable)
-                    added_observables.append(object_observable["id"])
+                object_refs.add(object_observable)
+                bundle_objects.add(object_observable)
 
             # Link all objects with each other, now so we can find the correct entity type prefix in bundle_objects
             for object in event["Event"].get("Object", []):
@@ -894,33 +938,19 @@ class Misp:
                             )
             # Add object_relationships
             for object_relationship in objects_relationships:
-                if (
+                relationship_key = (
                     object_relationship["source_ref"]
                     + object_relationship["target_ref"]
-                    not in added_object_refs
-                ):
-                    object_refs.append(object_relationship)
-                    added_object_refs.append(
-                        object_relationship["source_ref"]
-                        + object_relationship["target_ref"]
-                    )
-                if (
-                    object_relationship["source_ref"]
-                    + object_relationship["target_ref"]
-                    not in added_relationships
-                ):
-                    bundle_objects.append(object_relationship)
-                    added_relationships.append(
-                        object_relationship["source_ref"]
-                        + object_relationship["target_ref"]
-                    )
+                )
+                object_refs.add(object_relationship, key=relationship_key)
+                bundle_objects.add(object_relationship, key=relationship_key)
 
             # Create the report if needed
             if self.misp_create_reports:
                 # Report in STIX lib must have at least one object_refs
                 if len(object_refs) == 0:
                     # Put a fake ID in the report
-                    object_refs.append(
+                    object_refs.objects.append(
                         "intrusion-set--fc5ee88d-7987-4c00-991e-a863e9aa8a0e"
                     )
                 attributes = filter_event_attributes(
@@ -963,7 +993,7 @@ class Misp:
                     created_by_ref=author["id"],
                     object_marking_refs=event_markings,
                     labels=event_tags,
-                    object_refs=object_refs,
+                    object_refs=object_refs.objects,
                     external_references=event_external_references,
                     confidence=self.helper.connect_confidence_level,
                     custom_properties={
@@ -971,7 +1001,7 @@ class Misp:
                     },
                     allow_custom=True,
                 )
-                bundle_objects.append(report)
+                bundle_objects.add(report)
                 for note in event["Event"].get("EventReport", []):
                     note = stix2.Note(
                         id=Note.generate_id(
@@ -994,8 +1024,10 @@ class Misp:
                         object_refs=[report],
                         allow_custom=True,
                     )
-                    bundle_objects.append(note)
-            bundle = stix2.Bundle(objects=bundle_objects, allow_custom=True).serialize()
+                    bundle_objects.add(note)
+            bundle = stix2.Bundle(
+                objects=bundle_objects.objects, allow_custom=True
+            ).serialize()
             self.helper.log_info("Sending event STIX2 bundle")
 
             self.helper.send_stix2_bundle(bundle, work_id=work_id)
@@ -2458,14 +2490,11 @@ class Misp:
         return opencti_tags
 
     def find_type_by_uuid(self, uuid, bundle_objects):
-        # filter by uuid
-        i_result = list(filter(lambda o: o.id.endswith("--" + uuid), bundle_objects))
-
-        if len(i_result) > 0:
-            uuid = i_result[0]["id"]
+        entity = bundle_objects.get_by_uuid(uuid)
+        if entity is not None:
             return {
-                "entity": i_result[0],
-                "type": uuid[: uuid.index("--")],
+                "entity": entity,
+                "type": entity["id"][: entity["id"].index("--")],
             }
         return None
 
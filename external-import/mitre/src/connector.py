@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import ssl
@@ -37,6 +38,12 @@ def days_to_seconds(days):
     return int(days) * 24 * 60 * 60
 
 
+def content_hash(stix):
+    return hashlib.blake2b(
+        json.dumps(stix, sort_keys=True).encode("utf-8"), digest_size=8
+    ).hexdigest()
+
+
 def filter_stix_revoked(revoked_ids, stix):
     # Pure revoke
     if stix["id"] in revoked_ids:
@@ -55,6 +62,59 @@ def filter_stix_revoked(revoked_ids, stix):
     return True
 
 
+class ObjectStore:
+    """Content hashes of the objects sent for each dataset, kept in a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hashes = {}
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf8") as store_file:
+                self.hashes = json.load(store_file)
+
+    def changed(self, url: str, stix_objects: list) -> tuple:
+        """
+        Compare objects with the ones sent for a dataset.
+
+        Parameters
+        ----------
+        url : str
+            Url of the dataset.
+        stix_objects : list
+            Objects of the dataset.
+
+        Returns
+        -------
+        tuple
+            The added or modified objects and the hashes of all the objects.
+        """
+        sent_hashes = self.hashes.get(url, {})
+        hashes = {}
+        changed_objects = []
+        for stix in stix_objects:
+            hashes[stix["id"]] = content_hash(stix)
+            if sent_hashes.get(stix["id"]) != hashes[stix["id"]]:
+                changed_objects.append(stix)
+        return changed_objects, hashes
+
+    def update(self, url: str, hashes: dict):
+        """
+        Replace the hashes of a dataset once its objects are sent.
+
+        Parameters
+        ----------
+        url : str
+            Url of the dataset.
+        hashes : dict
+            Hashes of all the objects of the dataset.
+        """
+        self.hashes[url] = hashes
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as store_file:
+            json.dump(self.hashes, store_file)
+        os.replace(tmp_path, self.path)
+
+
 class Mitre:
     """Mitre connector."""
 
@@ -107,6 +167,15 @@ class Mitre:
         ]
         self.mitre_urls = list(filter(lambda url: url is not False, urls))
         self.interval = days_to_seconds(self.mitre_interval)
+        # Only send the added or modified objects if a store is configured
+        store_path = get_config_variable(
+            "MITRE_STORE_PATH",
+            ["mitre", "store_path"],
+            config,
+        )
+        self.store = ObjectStore(store_path) if store_path else None
+        # ETag and Last-Modified of each dataset, for conditional requests
+        self.validators = {}
 
     def retrieve_data(self, url: str) -> Optional[dict]:
         """
@@ -120,18 +189,27 @@ class Mitre:
         Returns
         -------
         str
-            A string with the content or None in case of failure.
+            A string with the content or None in case of failure or if the
+            dataset did not change since the last run.
         """
+        validators = self.validators.get(url, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
         try:
             # Fetch json bundle from MITRE
-            serialized_bundle = (
-                urllib.request.urlopen(
-                    url,
-                    context=ssl.create_default_context(),
-                )
-                .read()
-                .decode("utf-8")
-            )
+            with urllib.request.urlopen(
+                urllib.request.Request(url, headers=headers),
+                context=ssl.create_default_context(),
+            ) as response:
+                serialized_bundle = response.read().decode("utf-8")
+                # Only stored in the state once every dataset is sent
+                self.validators[url] = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
             # Convert the data to python dictionary
             stix_bundle = json.loads(serialized_bundle)
             stix_objects = stix_bundle["objects"]
@@ -143,7 +221,7 @@ class Mitre:
                     stix_objects,
                 )
             )
-            revoked_ids = list(map(lambda stix: stix["id"], revoked_objects))
+            revoked_ids = set(map(lambda stix: stix["id"], revoked_objects))
             # Filter every revoked MITRE elements
             not_revoked_objects = list(
                 filter(
@@ -161,9 +239,14 @@ class Mitre:
                 )
                 self.remove_statement_marking(stix_bundle)
             return stix_bundle
+        except urllib.error.HTTPError as http_error:
+            if http_error.code == 304:
+                self.helper.log_info(f"{url} did not change since the last run")
+                return None
+            self.helper.log_error(f"Error retrieving url {url}: {http_error}")
+            self.helper.metric.inc("client_error_count")
         except (
             urllib.error.URLError,
-            urllib.error.HTTPError,
             urllib.error.ContentTooShortError,
         ) as urllib_error:
             self.helper.log_error(f"Error retrieving url {url}: {urllib_error}")
@@ -188,6 +271,7 @@ class Mitre:
 
         current_state = self.helper.get_state()
         last_run = current_state.get("last_run", None) if current_state else None
+        self.validators = current_state.get("validators", {}) if current_state else {}
         self.helper.log_debug(f"Connector last run: {time_from_unixtime(last_run)}")
 
         if last_run and self.interval > unixtime_now - last_run:
@@ -211,16 +295,28 @@ class Mitre:
             if not data:
                 continue
 
-            self.helper.send_stix2_bundle(
-                json.dumps(data),
-                entities_types=self.helper.connect_scope,
-                work_id=work_id,
-            )
-            self.helper.metric.inc("record_send", len(data["objects"]))
+            hashes = None
+            if self.store is not None:
+                total_objects = len(data["objects"])
+                data["objects"], hashes = self.store.changed(url, data["objects"])
+                self.helper.log_info(
+                    f"{len(data['objects'])} added or modified objects out of {total_objects}"
+                )
+
+            if len(data["objects"]) > 0:
+                self.helper.send_stix2_bundle(
+                    json.dumps(data),
+                    entities_types=self.helper.connect_scope,
+                    work_id=work_id,
+                )
+                self.helper.metric.inc("record_send", len(data["objects"]))
+
+            if hashes is not None:
+                self.store.update(url, hashes)
 
         message = f"Connector successfully run, storing last_run as {time_now}"
         self.helper.log_info(message)
-        self.helper.set_state({"last_run": unixtime_now})
+        self.helper.set_state({"last_run": unixtime_now, "validators": self.validators})
         self.helper.api.work.to_processed(work_id, message)
 
     def run(self):
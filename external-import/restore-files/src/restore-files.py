@@ -5,6 +5,8 @@ import datetime
 import json
 import os
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import yaml
@@ -58,30 +60,144 @@ class RestoreFilesConnector:
         self.backup_path = get_config_variable(
             "BACKUP_PATH", ["backup", "path"], config
         )
+        self.index_path = get_config_variable(
+            "BACKUP_INDEX_PATH",
+            ["backup", "index_path"],
+            config,
+            default=self.backup_path + "/opencti_restore_index.json",
+        )
+        self.workers = get_config_variable(
+            "BACKUP_WORKERS", ["backup", "workers"], config, isNumber=True, default=1
+        )
+        # Element id -> name of the directory holding its file
+        self.index = {}
+
+    def build_index(self, dirs):
+        """
+        Map each element id to its directory in one pass over the backup tree.
+        The index is persisted along with the directory modification times and
+        reused on the next run if the backup tree is unchanged.
+        """
+        signature = {entry.name: entry.stat().st_mtime_ns for entry in dirs}
+        if os.path.isfile(self.index_path):
+            try:
+                with open(self.index_path, mode="r") as file:
+                    persisted = json.load(file)
+                if persisted["signature"] == signature:
+                    self.helper.log_info("Reusing index " + self.index_path)
+                    for dir_name, ids in persisted["dirs"].items():
+                        for element_id in ids:
+                            self.index[element_id] = dir_name
+                    return
+            except (OSError, ValueError, KeyError) as e:
+                self.helper.log_warning("Unable to read index: " + str(e))
+        self.helper.log_info("Indexing backup directories")
+        index_dirs = {}
+        for entry in dirs:
+            ids = [
+                file.name[:-5]
+                for file in os.scandir(entry)
+                if file.is_file() and file.name.endswith(".json")
+            ]
+            index_dirs[entry.name] = ids
+            for element_id in ids:
+                self.index[element_id] = entry.name
+        try:
+            with open(self.index_path, mode="w") as file:
+                json.dump({"signature": signature, "dirs": index_dirs}, file)
+        except OSError as e:
+            self.helper.log_warning("Unable to persist index: " + str(e))
 
     def find_element(self, dir_date, id):
-        name = id + ".json"
-        path = self.backup_path + "/opencti_data"
-        for root, dirs, files in os.walk(path):
-            if name in files:
-                # If find dir is before, no need to process the element as missing
-                path = os.path.basename(root)
-                if date_convert(path) > dir_date:
-                    return fetch_stix_data(os.path.join(root, name))[0]
+        dir_name = self.index.get(id)
+        # If find dir is before, no need to process the element as missing
+        if dir_name is not None and date_convert(dir_name) > dir_date:
+            path = os.path.join(
+                self.backup_path, "opencti_data", dir_name, id + ".json"
+            )
+            return fetch_stix_data(path)[0]
         return None
 
-    def resolve_missing(self, dir_date, element_ids, data, acc=[]):
+    def resolve_missing(self, dir_date, element_ids, data, acc, acc_ids):
         refs = ref_extractors([data])
         for ref in refs:
-            if ref not in element_ids:
-                not_in = next((x for x in acc if x["id"] == ref), None)
-                if not_in is None:
-                    missing_element = self.find_element(dir_date, ref)
-                    if missing_element is not None:
-                        acc.insert(0, missing_element)
-                        self.resolve_missing(
-                            dir_date, element_ids, missing_element, acc
-                        )
+            if ref not in element_ids and ref not in acc_ids:
+                missing_element = self.find_element(dir_date, ref)
+                if missing_element is not None:
+                    acc.appendleft(missing_element)
+                    acc_ids.add(ref)
+                    self.resolve_missing(
+                        dir_date, element_ids, missing_element, acc, acc_ids
+                    )
+
+    def build_objects(self, entry, dir_date):
+        # 00 - Create a bundle for the directory
+        files_data = []
+        element_ids = []
+        # 01 - build all _ref / _refs contained in the bundle
+        element_refs = []
+        for file in os.scandir(entry):
+            if file.is_file():
+                objects = fetch_stix_data(file)
+                object_ids = set(map(lambda x: x["id"], objects))
+                element_refs.extend(ref_extractors(objects))
+                files_data.extend(objects)
+                element_ids.extend(object_ids)
+        # Ensure the bundle is consistent (include meta elements)
+        # 02 - Scan bundle to detect missing elements
+        acc = deque()
+        acc_ids = set()
+        ids = set(element_ids)
+        refs = set(element_refs)
+        for ref in refs:
+            if ref not in ids and ref not in acc_ids:
+                # 03 - If missing, look up the element in the other dirs
+                missing_element = self.find_element(dir_date, ref)
+                if missing_element is not None:
+                    acc.appendleft(missing_element)
+                    acc_ids.add(ref)
+                    # 04 - Restart the process to handle recursive resolution
+                    self.resolve_missing(dir_date, ids, missing_element, acc, acc_ids)
+        # 05 - Add elements to the bundle
+        return list(acc) + files_data
+
+    def restore_dir(self, entry, future, stix2_splitter):
+        friendly_name = "Restore run directory @ " + entry.name
+        self.helper.log_info(friendly_name)
+        objects_with_missing = future.result()
+        if len(objects_with_missing) > 0:
+            # Create the work
+            work_id = self.helper.api.work.initiate_work(
+                self.helper.connect_id, friendly_name
+            )
+            # 06 - Send the bundle to the worker queue
+            stix_bundle = {
+                "type": "bundle",
+                "objects": objects_with_missing,
+            }
+            if self.direct_creation:
+                # Bundle must be split for reordering
+                bundles = stix2_splitter.split_bundle(stix_bundle, False)
+                self.helper.log_info(
+                    "restore dir "
+                    + entry.name
+                    + " with "
+                    + str(len(bundles))
+                    + " bundles (direct creation)"
+                )
+                for bundle in bundles:
+                    self.helper.api.stix2.import_bundle_from_json(
+                        json.dumps(bundle), True
+                    )
+                # 06 - Save the state
+                self.helper.set_state({"current": entry.name})
+            else:
+                self.helper.log_info("restore dir (worker bundles):" + entry.name)
+                self.helper.send_stix2_bundle(json.dumps(stix_bundle), work_id=work_id)
+                message = "Restore dir run, storing last_run as {0}".format(entry.name)
+                self.helper.api.work.to_processed(work_id, message)
+                # 06 - Save the state
+                self.helper.set_state({"current": entry.name})
 
     def restore_files(self):
         stix2_splitter = OpenCTIStix2Splitter()
@@ -94,76 +210,25 @@ class RestoreFilesConnector:
         )
         path = self.backup_path + "/opencti_data"
         dirs = sorted(Path(path).iterdir(), key=lambda d: date_convert(d.name))
-        for entry in dirs:
-            friendly_name = "Restore run directory @ " + entry.name
-            self.helper.log_info(friendly_name)
-            dir_date = date_convert(entry.name)
-            if start_date is not None and dir_date <= start_date:
-                continue
-            # 00 - Create a bundle for the directory
-            files_data = []
-            element_ids = []
-            # 01 - build all _ref / _refs contained in the bundle
-            element_refs = []
-            for file in os.scandir(entry):
-                if file.is_file():
-                    objects = fetch_stix_data(file)
-                    object_ids = set(map(lambda x: x["id"], objects))
-                    element_refs.extend(ref_extractors(objects))
-                    files_data.extend(objects)
-                    element_ids.extend(object_ids)
-            # Ensure the bundle is consistent (include meta elements)
-            # 02 - Scan bundle to detect missing elements
-            acc = []
-            ids = set(element_ids)
-            refs = set(element_refs)
-            for ref in refs:
-                if ref not in ids:
-                    # 03 - If missing, scan the other dir/files to find the elements
-                    missing_element = self.find_element(dir_date, ref)
-                    if missing_element is not None:
-                        acc.insert(0, missing_element)
-                        # 04 - Restart the process to handle recursive resolution
-                        self.resolve_missing(dir_date, ids, missing_element, acc)
-            # 05 - Add elements to the bundle
-            objects_with_missing = acc + files_data
-            if len(objects_with_missing) > 0:
-                # Create the work
-                work_id = self.helper.api.work.initiate_work(
-                    self.helper.connect_id, friendly_name
+        self.build_index(dirs)
+        dirs = [
+            entry
+            for entry in dirs
+            if start_date is None or date_convert(entry.name) > start_date
+        ]
+        # Directories are read and resolved concurrently but sent in order, as
+        # a directory may depend on the elements of the previous ones
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            for entry in dirs:
+                future = executor.submit(
+                    self.build_objects, entry, date_convert(entry.name)
                 )
-                # 06 - Send the bundle to the worker queue
-                stix_bundle = {
-                    "type": "bundle",
-                    "objects": objects_with_missing,
-                }
-                if self.direct_creation:
-                    # Bundle must be split for reordering
-                    bundles = stix2_splitter.split_bundle(stix_bundle, False)
-                    self.helper.log_info(
-                        "restore dir "
-                        + entry.name
-                        + " with "
-                        + str(len(bundles))
-                        + " bundles (direct creation)"
-                    )
-                    for bundle in bundles:
-                        self.helper.api.stix2.import_bundle_from_json(
-                            json.dumps(bundle), True
-                        )
-                    # 06 - Save the state
-                    self.helper.set_state({"current": entry.name})
-                else:
-                    self.helper.log_info("restore dir (worker bundles):" + entry.name)
-                    self.helper.send_stix2_bundle(
-                        json.dumps(stix_bundle), work_id=work_id
-                    )
-                    message = "Restore dir run, storing last_run as {0}".format(
-                        entry.name
-                    )
-                    self.helper.api.work.to_processed(work_id, message)
-                    # 06 - Save the state
-                    self.helper.set_state({"current": entry.name})
+                pending.append((entry, future))
+                if len(pending) >= self.workers:
+                    self.restore_dir(*pending.popleft(), stix2_splitter)
+            while len(pending) > 0:
+                self.restore_dir(*pending.popleft(), stix2_splitter)
         self.helper.log_info("restore run completed")
 
     def start(self):
@@ -1,3 +1,6 @@
+import threading
+
+import requests
 import taxii2client.v20 as tx20
 import taxii2client.v21 as tx21
 from requests.auth import AuthBase, HTTPBasicAuth
@@ -52,6 +55,9 @@ class Taxii2:
         self.filters = {}
         if self.config.enable_url_query_limit and self.config.taxii2v21:
             self.filters["limit"] = self.config.url_query_limit
+        # Pagination filters of the collections being polled, by collection url
+        self.cursors = {}
+        self.cursors_lock = threading.Lock()
 
     def _get_root(self, root_path):
         """
@@ -73,59 +79,36 @@ class Taxii2:
         msg = f"Collection {coll_title} does not exist in API root {root.title}"
         raise TAXIIServiceException(msg)
 
-    def poll_all_roots(self, coll_title):
+    def get_collections(self, root_path, coll_title):
         """
-        Polls all API roots for the specified collections
+        Returns the Collections matching a `<API Root>.<Collection Name>` entry,
+        both parts supporting the `*` wildcard
         """
-        self.helper.log_info("Polling all API Roots")
-        for root in self.config.server.api_roots:
+        if root_path == "*":
+            self.helper.log_info("Polling all API Roots")
+            roots = self.config.server.api_roots
+        else:
+            roots = [self._get_root(root_path)]
+
+        collections = []
+        for root in roots:
             if coll_title == "*":
-                return self.poll_entire_root(root)
+                self.helper.log_info(f"Polling entire API root {root.title}")
+                collections.extend(root.collections)
+            elif root_path != "*":
+                collections.append(self._get_collection(root, coll_title))
             else:
                 try:
-                    coll = self._get_collection(root, coll_title)
+                    collections.append(self._get_collection(root, coll_title))
                 except TAXIIServiceException:
                     self.helper.log_error(
                         f"Error searching for  collection {coll_title} in API Root {root.title}"
                     )
-                    return
-                try:
-                    return self.poll(coll)
-                except TAXIIServiceException as err:
-                    msg = (
-                        f"Error trying to poll Collection {coll_title} "
-                        f"in API Root {root.title}. Skipping"
-                    )
-                    self.helper.log_error(msg)
-                    self.helper.log_error(err)
-
-    def poll_entire_root(self, root):
-        """
-        Polls all Collections in a given API Root
-        """
-        self.helper.log_info(f"Polling entire API root {root.title}")
+        return collections
 
-        for coll in root.collections:
-            try:
-                return self.poll(coll)
-            except TAXIIServiceException as err:
-                msg = (
-                    f"Error trying to poll Collection {coll.title} "
-                    f"in API Root {root.title}. Skipping"
-                )
-                self.helper.log_error(msg)
-                self.helper.log_error(err)
-
-    def process_response(self, objects, response):
-        # This function is required to concat the paginated responses
-        if "objects" in response:
-            for object in response["objects"]:
-                objects.append(object)
-        return objects
-
-    def get_objects(self, collection):
+    def get_objects(self, collection, filters):
         try:
-            return collection.get_objects(**self.filters)
+            return collection.get_objects(**filters)
         except TAXIIServiceException as err:
             msg = f"Error trying to get objects from Collection {collection.title}"
             self.helper.log_error(msg)
@@ -139,49 +122,114 @@ class Taxii2:
             self.helper.log_error(msg)
             self.helper.log_error(err)
 
-    def poll(self, collection):
+    def get_cursors(self):
         """
-        Polls a specified collection in a specified API root
+        Returns a copy of the pagination cursors, safe to serialize while
+        collections are being polled
         """
-        objects = []
-        self.helper.log_info(f"Polling Collection {collection.title}")
-        response = self.get_objects(collection)
-        if "objects" in response and len(response["objects"]) > 0:
-            first_object = response["objects"][0]
-            if "spec_version" in response:
-                self.version = response["spec_version"]
-            elif "spec_version" in first_object:
-                self.version = first_object["spec_version"]
+        with self.cursors_lock:
+            return dict(self.cursors)
+
+    def _set_cursor(self, collection, cursor):
+        with self.cursors_lock:
+            if cursor is None:
+                self.cursors.pop(collection.url, None)
             else:
-                self.helper.log_info("No spec_version found, assuming TAXII 2.0")
-                self.version = "2.0"  # Default to TAXII 2.0 if nothing found
+                self.cursors[collection.url] = cursor
+
+    def poll(self, collection, added_after=None):
+        """
+        Polls a specified collection in a specified API root, page by page.
+        Before a page is yielded, the pagination filters needed to get the next
+        one are stored in cursors (removed once the collection is exhausted),
+        so an interrupted poll can resume from the last page sent.
+        :param added_after: Overrides the added_after filter for this collection
+        :return: Generator of the polled pages objects
+        """
+        start_filters = dict(self.filters)
+        if added_after is not None:
+            start_filters["added_after"] = added_after
+        filters = dict(start_filters)
+        cursor = self.get_cursors().get(collection.url)
+        if cursor is not None:
+            self.helper.log_info(
+                f"Resuming Collection {collection.title} from {cursor}"
+            )
+            filters.pop("added_after", None)
+            filters.update(cursor)
+        self.helper.log_info(f"Polling Collection {collection.title}")
+        resuming_next = cursor is not None and "next" in cursor
+        try:
+            response = self.get_objects(collection, filters)
+        except requests.exceptions.HTTPError as err:
+            if not resuming_next:
+                raise
+            self.helper.log_error(str(err))
+            response = None
+        if response is None and resuming_next:
+            # The server may have expired or rejected the next token, it would
+            # fail every later poll of the collection
+            self.helper.log_error(
+                f"Could not resume Collection {collection.title} from {cursor}, "
+                f"polling it again from its added_after date"
+            )
+            self._set_cursor(collection, None)
+            filters = dict(start_filters)
+            response = self.get_objects(collection, filters)
+        if response is None:
+            # The previous date and cursor of the collection must be kept
+            raise TAXIIServiceException(
+                f"Could not get objects from Collection {collection.title}"
+            )
+        if len(response.get("objects", [])) == 0:
+            return
+        first_object = response["objects"][0]
+        if "spec_version" in response:
+            version = response["spec_version"]
+        elif "spec_version" in first_object:
+            version = first_object["spec_version"]
+        else:
+            self.helper.log_info("No spec_version found, assuming TAXII 2.0")
+            version = "2.0"  # Default to TAXII 2.0 if nothing found
+        while True:
             # Taxii 2.0 doesn't support using next, using manifest lookup instead
-            if self.version == "2.0":
-                while True:
-                    objects = self.process_response(objects, response)
-                    # Get the manifest for the last object
-                    last_obj = response["objects"][-1]
-                    manifest = self.get_manifest(collection, last_obj)
-                    # Check manifest size
-                    if "objects" in manifest and len(manifest["objects"]) > 0:
-                        date_added = manifest["objects"][0]["date_added"]
-                        self.filters["added_after"] = date_added
-                        # Get the next set of objects
-                        response = self.get_objects(collection)
-                        if len(response["objects"]) == 0:
-                            break
-                    else:
-                        self.helper.log_info("No manifest found. Stopping pagination.")
-                        break
+            if version == "2.0":
+                # Get the manifest for the last object
+                last_obj = response["objects"][-1]
+                manifest = self.get_manifest(collection, last_obj)
+                if manifest is None:
+                    raise TAXIIServiceException(
+                        f"Could not get manifest from Collection {collection.title}"
+                    )
+                # Check manifest size
+                has_next_page = "objects" in manifest and len(manifest["objects"]) > 0
+                if has_next_page:
+                    cursor = {"added_after": manifest["objects"][0]["date_added"]}
+                else:
+                    self.helper.log_info("No manifest found. Stopping pagination.")
             else:
                 # Assuming newer versions will support next
-                while True:
-                    objects = self.process_response(objects, response)
-                    if "more" not in response or response["more"] != True:
-                        # "more" doesn't exist or is not True, exit the loop
-                        break
-                    if "next" in response:
-                        self.filters.pop("added_after", None)
-                        self.filters["next"] = response["next"]
-                        response = self.get_objects(collection)
-        return objects
+                has_next_page = response.get("more") is True and "next" in response
+                if has_next_page:
+                    filters.pop("added_after", None)
+                    cursor = {"next": response["next"]}
+
+            if has_next_page:
+                filters.update(cursor)
+                self._set_cursor(collection, cursor)
+            else:
+                self._set_cursor(collection, None)
+            yield response.get("objects", [])
+            if not has_next_page:
+                break
+
+            # Get the next set of objects
+            response = self.get_objects(collection, filters)
+            if response is None:
+                # The cursor of the page which failed is kept to resume from it
+                raise TAXIIServiceException(
+                    f"Could not get objects from Collection {collection.title}"
+                )
+            if len(response.get("objects", [])) == 0:
+                self._set_cursor(collection, None)
+                break
@@ -118,6 +118,14 @@ class ConfigConnector:
             default="*.*",
         ).split(",")
 
+        self.polling_workers = get_config_variable(
+            "TAXII2_POLLING_WORKERS",
+            ["taxii2", "polling_workers"],
+            self.load,
+            isNumber=True,
+            default=1,
+        )
+
         self.initial_history = get_config_variable(
             "TAXII2_INITIAL_HISTORY",
             ["taxii2", "initial_history"],
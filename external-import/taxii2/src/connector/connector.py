@@ -1,4 +1,6 @@
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 from pycti import OpenCTIConnectorHelper
@@ -23,35 +25,84 @@ class Connector:
         self.converter_to_stix = ConverterToStix(self.helper, self.config)
         self.taxii2 = Taxii2(self.helper, self.config)
         self.process = ProcessObjects(self.helper, self.config, self.converter_to_stix)
+        self.state_lock = threading.Lock()
 
-    def _collect_intelligence(self) -> list:
+    def _collect_collections(self) -> list:
         """
-        Collect intelligence from the source and convert into STIX object
-        :return: List of STIX objects
+        Resolve the configured collections, each collection being listed once
+        :return: List of TAXII collections
         """
-        stix_objects = []
-
+        collections = {}
         for collection in self.config.collections:
             try:
                 root_path, coll_title = collection.split(".")
-                if root_path == "*":
-                    stix_objects = self.taxii2.poll_all_roots(coll_title)
-                elif coll_title == "*":
-                    root = self.taxii2._get_root(root_path)
-                    stix_objects = self.taxii2.poll_entire_root(root)
-                else:
-                    root = self.taxii2._get_root(root_path)
-                    coll = self.taxii2._get_collection(root, coll_title)
-                    stix_objects = self.taxii2.poll(coll)
+                for coll in self.taxii2.get_collections(root_path, coll_title):
+                    collections.setdefault(coll.url, coll)
             except (TAXIIServiceException, HTTPError) as err:
                 self.helper.log_error("Error connecting to TAXII server")
                 self.helper.log_error(err)
                 continue
+        return list(collections.values())
+
+    def _collect_intelligence(self, collection, work_id: str, added_after) -> bool:
+        """
+        Collect intelligence from a collection, convert into STIX object and
+        send it page by page
+        :return: True if the whole collection has been polled
+        """
+        try:
+            for stix_objects in self.taxii2.poll(collection, added_after):
+                if len(stix_objects) == 0:
+                    continue
+                # If further processing of objects is needed
+                stix_objects = self.process.objects(stix_objects)
+                stix_objects_bundle = self.helper.stix2_create_bundle(stix_objects)
+                bundles_sent = self.helper.send_stix2_bundle(
+                    stix_objects_bundle, work_id=work_id
+                )
+
+                self.helper.connector_logger.info(
+                    "Sending STIX objects to OpenCTI...",
+                    {
+                        "collection": collection.title,
+                        "bundles_sent": {str(len(bundles_sent))},
+                    },
+                )
+                self._store_state()
+        except Exception as err:
+            # A failing collection must not prevent the others from being polled
+            self.helper.log_error(
+                f"Error trying to poll Collection {collection.title}. Skipping"
+            )
+            self.helper.log_error(err)
+            return False
+        return collection.url not in self.taxii2.get_cursors()
 
-        # If further processing of objects is needed
-        stix_objects = self.process.objects(stix_objects)
+    def _store_state(self, collections_last_run: dict = None) -> None:
+        """
+        Store the pagination cursors of the collections being polled and the
+        last run of the collections entirely polled
+        :return: None
+        """
+        with self.state_lock:
+            current_state = self.helper.get_state() or {}
+            current_state["cursors"] = self.taxii2.get_cursors()
+            if collections_last_run is not None:
+                current_state["collections"] = collections_last_run
+            self.helper.set_state(current_state)
 
-        return stix_objects
+    @staticmethod
+    def _get_added_after(collections_last_run: dict, collection):
+        """
+        Get the added_after filter of a collection from its last complete poll
+        :return: RFC-3339 date or None to use the global filter
+        """
+        if collection.url not in collections_last_run:
+            return None
+        dt = datetime.fromtimestamp(
+            collections_last_run[collection.url], tz=timezone.utc
+        )
+        return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
 
     def process_message(self) -> None:
         """
@@ -81,6 +132,10 @@ class Connector:
                     "[CONNECTOR] Connector has never run..."
                 )
 
+            # Resume the collections interrupted during the previous run
+            if current_state is not None and "cursors" in current_state:
+                self.taxii2.cursors = current_state["cursors"]
+
             # Friendly name will be displayed on OpenCTI platform
             friendly_name = "Connector Taxii2 feed"
 
@@ -106,24 +161,40 @@ class Connector:
             # Set added_after to either last run or initial history
             if current_state is not None and "last_run" in current_state:
                 self.taxii2.filters["added_after"] = dt_format
+                previous_run_timestamp = last_run
             else:
                 added_after = datetime.now() - timedelta(
                     hours=self.config.initial_history
                 )
                 self.taxii2.filters["added_after"] = added_after
-
-            stix_objects = self._collect_intelligence()
-
-            if stix_objects is not None and len(stix_objects) != 0:
-                stix_objects_bundle = self.helper.stix2_create_bundle(stix_objects)
-                bundles_sent = self.helper.send_stix2_bundle(
-                    stix_objects_bundle, work_id=work_id
-                )
-
-                self.helper.connector_logger.info(
-                    "Sending STIX objects to OpenCTI...",
-                    {"bundles_sent": {str(len(bundles_sent))}},
+                previous_run_timestamp = int(added_after.timestamp())
+
+            # Collections are polled concurrently, each page is sent as soon as
+            # it is polled, then its cursor is stored
+            collections_last_run = {}
+            if current_state is not None and "collections" in current_state:
+                collections_last_run = dict(current_state["collections"])
+            collections = self._collect_collections()
+            with ThreadPoolExecutor(
+                max_workers=self.config.polling_workers
+            ) as executor:
+                results = executor.map(
+                    lambda collection: self._collect_intelligence(
+                        collection,
+                        work_id,
+                        self._get_added_after(collections_last_run, collection),
+                    ),
+                    collections,
                 )
+                for collection, polled in zip(collections, list(results)):
+                    if polled:
+                        collections_last_run[collection.url] = current_timestamp
+                    else:
+                        # Keep the failed collection where it was for the next run
+                        collections_last_run.setdefault(
+                            collection.url, previous_run_timestamp
+                        )
+            self._store_state(collections_last_run)
 
             # Store the current timestamp as a last run of the connector
             self.helper.connector_logger.debug(
@@ -5,13 +5,15 @@ from __future__ import annotations
 import csv
 import io
 import os
+import shutil
 import ssl
 import sys
+import tempfile
 import time
 import traceback
 import urllib.request
 import zipfile
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import UTC, datetime
 from typing import Dict, Iterable, List, Optional, Tuple, Union
 
@@ -29,7 +31,6 @@ from stix2.base import _Observable as Observable
 
 ALL_TYPES = "all_types"
 BASE_PATH = os.path.dirname(os.path.abspath(__file__))
-CSV_PATH = f"{BASE_PATH}/data.csv"
 
 
 # pylint:disable=too-many-instance-attributes
@@ -124,6 +125,14 @@ class ThreatFox:
         if len(self.ioc_to_import) == 0:
             self.ioc_to_import = [ALL_TYPES]
 
+        self.bundle_size: int = get_config_variable(
+            "THREATFOX_BUNDLE_SIZE",
+            ["threatfox", "bundle_size"],
+            config,
+            isNumber=True,
+            default=1000,
+        )
+
         self.update_existing_data: bool = get_config_variable(
             "CONNECTOR_UPDATE_EXISTING_DATA",
             ["connector", "update_existing_data"],
@@ -219,23 +228,30 @@ class ThreatFox:
             skipinitialspace=True,
         )
 
-        last_processed_entry_running_max = 0
+        last_processed_entry = state.get("last_processed_entry")  # epoch
+        if last_processed_entry is None:
+            self.helper.log_info(
+                "'last_processed_entry' state not found, setting it to epoch start."
+            )
+            last_processed_entry = 0
+
+        # Ranges of first_seen of the entries sent by interrupted runs. The
+        # export is sorted from the newest entry to the oldest one, every
+        # entry strictly inside a range was sent. They stay fixed during this
+        # run, the range sent by this run is tracked separately.
+        sent_ranges = [tuple(sent_range) for sent_range in state.get("sent_ranges", [])]
+        for oldest_entry, newest_entry in sent_ranges:
+            self.helper.log_info(
+                f"Resuming the interrupted run, skipping the entries between "
+                f"{oldest_entry} and {newest_entry}"
+            )
+        run_range = None
+        chunk = Chunk()
 
         try:
             lines = self.download_csv()
             csv_reader = csv.reader(lines, dialect="custom")
 
-            bundle_objects = []
-
-            last_processed_entry = state.get("last_processed_entry")  # epoch
-            if last_processed_entry is None:
-                self.helper.log_info(
-                    "'last_processed_entry' state not found, setting it to epoch start."
-                )
-                last_processed_entry = 0
-
-            last_processed_entry_running_max = last_processed_entry
-
             for i, row in enumerate(csv_reader):
                 ioc = FeedRow(row)
 
@@ -251,38 +267,45 @@ class ThreatFox:
                         f"Processing entry {i} with dateadded='{ioc.first_seen}'"
                     )
 
+                first_seen = ioc.first_seen.timestamp()
+
                 # skip entry if newer events already processed in the past
-                if last_processed_entry > ioc.first_seen.timestamp():
+                if last_processed_entry > first_seen:
                     continue
 
-                # update the running max
-                last_processed_entry_running_max = max(
-                    ioc.first_seen.timestamp(),
-                    last_processed_entry_running_max,
-                )
+                # skip entry if already sent by an interrupted run
+                if any(
+                    oldest_entry < first_seen < newest_entry
+                    for oldest_entry, newest_entry in sent_ranges
+                ):
+                    continue
+
+                chunk.add_entry(first_seen)
 
                 if not self.threatfox_import_offline:
                     if not ioc.last_seen or ioc.last_seen < now_dt:
                         self.helper.log_info(f"Skipping offline IOC: {ioc.value}")
                         continue
 
-                bundle_objects.extend(self.process_row(ioc))
+                chunk.objects.extend(self.process_row(ioc))
+                chunk.rows += 1
 
-            bundle = stix2.Bundle(
-                objects=bundle_objects,
-                allow_custom=True,
-            ).serialize()
+                if chunk.rows >= self.bundle_size:
+                    run_range = self.send_chunk(
+                        chunk, sent_ranges, run_range, state, work_id
+                    )
+                    chunk = Chunk()
 
-            self.helper.log_debug(bundle)
-            if "objects" in bundle:
-                self.helper.send_stix2_bundle(
-                    bundle,
-                    update=self.update_existing_data,
-                    work_id=work_id,
-                )
+            run_range = self.send_chunk(chunk, sent_ranges, run_range, state, work_id)
 
-            if os.path.exists(CSV_PATH):
-                os.remove(CSV_PATH)
+            # Every entry of the export was sent
+            sent_ranges = self.merge_ranges(sent_ranges, run_range)
+            last_processed_entry = max(
+                [last_processed_entry]
+                + [newest_entry for _, newest_entry in sent_ranges]
+            )
+            sent_ranges = []
+            run_range = None
 
         except Exception:  # pylint:disable=broad-exception-caught
             self.helper.log_error(traceback.format_exc())
@@ -290,14 +313,78 @@ class ThreatFox:
         # Store the current timestamp as a last run
         message = f"Connector successfully run, storing last_run as {now_ts}"
         self.helper.log_info(message)
-        self.helper.set_state(
-            {
-                "last_run": now_ts,
-                "last_processed_entry": last_processed_entry_running_max,
-            }
-        )
+        state = {
+            "last_run": now_ts,
+            "last_processed_entry": last_processed_entry,
+        }
+        sent_ranges = self.merge_ranges(sent_ranges, run_range)
+        if sent_ranges:
+            state["sent_ranges"] = sent_ranges
+        self.helper.set_state(state)
         self.helper.api.work.to_processed(work_id, message)
 
+    def send_chunk(
+        self,
+        chunk: Chunk,
+        sent_ranges: List[Tuple[float, float]],
+        run_range: Optional[Tuple[float, float]],
+        state: Dict,
+        work_id: str,
+    ) -> Optional[Tuple[float, float]]:
+        """
+        Send the objects of a chunk and checkpoint its entries as sent, with
+        the ranges sent by the interrupted runs.
+        Return the updated range of the entries sent by this run.
+        """
+
+        if chunk.objects:
+            bundle = stix2.Bundle(
+                objects=chunk.objects,
+                allow_custom=True,
+            ).serialize()
+
+            self.helper.log_debug(bundle)
+            self.helper.send_stix2_bundle(
+                bundle,
+                update=self.update_existing_data,
+                work_id=work_id,
+            )
+
+        if chunk.oldest_entry is None:
+            return run_range
+
+        # The entries of this run are contiguous in the export, the entries
+        # between two chunks were either sent or skipped as already sent
+        if run_range is None:
+            run_range = (chunk.oldest_entry, chunk.newest_entry)
+        else:
+            run_range = (
+                min(run_range[0], chunk.oldest_entry),
+                max(run_range[1], chunk.newest_entry),
+            )
+        state["sent_ranges"] = self.merge_ranges(sent_ranges, run_range)
+        self.helper.set_state(state)
+        return run_range
+
+    @staticmethod
+    def merge_ranges(
+        sent_ranges: List[Tuple[float, float]],
+        run_range: Optional[Tuple[float, float]],
+    ) -> List[Tuple[float, float]]:
+        """
+        Merge the sent ranges which overlap, ranges separated by a gap of
+        unsent entries are kept apart.
+        """
+
+        ranges = sorted(sent_ranges + ([run_range] if run_range else []))
+        merged = []
+        for oldest_entry, newest_entry in ranges:
+            if merged and oldest_entry <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], newest_entry))
+            else:
+                merged.append((oldest_entry, newest_entry))
+        return merged
+
     def download_csv(self) -> Iterable[str]:
         """
         Download the csv_url, and if zipped, extract `full.csv` otherwise
@@ -306,25 +393,28 @@ class ThreatFox:
         """
 
         self.helper.log_info("Fetching Threat Fox dataset")
-        with urllib.request.urlopen(
-            self.threatfox_csv_url,
-            context=ssl.create_default_context(),
-        ) as response:
-            data: bytes = response.read()
+        with tempfile.TemporaryFile() as zipped_file:
+            with urllib.request.urlopen(
+                self.threatfox_csv_url,
+                context=ssl.create_default_context(),
+            ) as response:
+                if response.peek(4)[:4] != b"PK\x03\x04":
+                    # Treat as an unzipped CSV from /recent/
+                    yield from self.read_csv(response)
+                    return
+
+                # Zip archives are indexed at their end, spool them to disk
+                shutil.copyfileobj(response, zipped_file)
 
-        try:
-            zipped_file = io.BytesIO(data)
             with zipfile.ZipFile(zipped_file, "r") as zip_ref:
                 with zip_ref.open("full.csv") as full_file:
-                    csv_data = full_file.read()
-        except zipfile.BadZipFile:
-            # Treat as an unzipped CSV from /recent/
-            csv_data = data
+                    yield from self.read_csv(full_file)
 
-        with open(CSV_PATH, "wb") as fd:
-            fd.write(csv_data)
+    @staticmethod
+    def read_csv(csv_file: io.BufferedIOBase) -> Iterable[str]:
+        """Decode the csv lines as they are read, skipping comments"""
 
-        with open(CSV_PATH, "r", encoding="utf-8") as fd:
+        with io.TextIOWrapper(csv_file, encoding="utf-8", newline="") as fd:
             yield from (line for line in fd if not line.startswith("#"))
 
     def process_row(self, ioc: FeedRow) -> Iterable[Dict]:
@@ -548,6 +638,25 @@ class ThreatFox:
         return stix_rel
 
 
+@dataclass
+class Chunk:
+    """Objects of the entries sent in a single bundle"""
+
+    objects: List[Dict] = field(default_factory=list)
+    rows: int = 0
+    oldest_entry: Optional[float] = None
+    newest_entry: Optional[float] = None
+
+    def add_entry(self, first_seen: float) -> None:
+        """Extend the first_seen range of the chunk"""
+
+        if self.oldest_entry is None:
+            self.oldest_entry = self.newest_entry = first_seen
+        else:
+            self.oldest_entry = min(self.oldest_entry, first_seen)
+            self.newest_entry = max(self.newest_entry, first_seen)
+
+
 # pylint:disable=too-many-instance-attributes
 @dataclass(init=False)
 class FeedRow:
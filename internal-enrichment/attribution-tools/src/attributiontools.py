@@ -26,8 +26,10 @@ from pycti import (
     get_config_variable,
 )
 from stix2 import Bundle, Note, Relationship
+from training_store import TrainingDataStore
 
 TRAINING_DATA_PATH = os.path.dirname(os.path.abspath(__file__)) + "/data/training_data"
+TRAINING_STORE_PATH = f"{TRAINING_DATA_PATH}/intrusionsets_store.json.gz"
 N_MAX_DATASET_FILES = 3
 
 
@@ -101,6 +103,29 @@ class AttributionTools:
             raise ValueError(
                 f"ATTRIBUTIONTOOLS_RELATION_CREATION_PROBABILITY_TRESHOLD invalid number: {self.relation_creation_probability_treshold}. Should be 0-1."
             )
+        ## incremental export of the training data in a local store
+        self.incremental_training_export: bool = get_config_variable(
+            "ATTRIBUTIONTOOLS_INCREMENTAL_TRAINING_EXPORT",
+            ["attributiontools", "incremental_training_export"],
+            config,
+            default=False,
+        )
+        if not isinstance(self.incremental_training_export, bool):
+            raise ValueError(
+                f"ATTRIBUTIONTOOLS_INCREMENTAL_TRAINING_EXPORT is not a boolean: {self.incremental_training_export}"
+            )
+        ## days between two full exports of the training data
+        self.full_training_export_days = get_config_variable(
+            "ATTRIBUTIONTOOLS_FULL_TRAINING_EXPORT_DAYS",
+            ["attributiontools", "full_training_export_days"],
+            config,
+            isNumber=True,
+            default=7,
+        )
+        if self.full_training_export_days < 1:
+            raise ValueError(
+                f"ATTRIBUTIONTOOLS_FULL_TRAINING_EXPORT_DAYS invalid number: {self.full_training_export_days}. Should be > 0."
+            )
         ## Stix ID of relation creator organization (WithSecure)
         self.identity_id = get_config_variable(
             "ATTRIBUTIONTOOLS_CREATOR_ORG_IDENTITY_ID",
@@ -116,6 +141,11 @@ class AttributionTools:
 
         self.dataexport = DataExport(self.client)
 
+        self.training_store = None
+        if self.incremental_training_export:
+            self.training_store = TrainingDataStore(TRAINING_STORE_PATH)
+            self.training_store.load()
+
         self.helper.log_info(f"Model retraining schedule set to {self.cron}")
 
     def _process_message(self, data: Dict):
@@ -260,6 +290,16 @@ class AttributionTools:
         return files
 
     def load_saved_data_and_train_model(self) -> bool:
+        # The store has no db_version until a training on its data completed
+        if (
+            self.training_store is not None
+            and self.training_store.db_version is not None
+        ):
+            self.train_model(
+                self.training_store.training_data(),
+                self.training_store.db_version,
+            )
+            return True
         files = self.get_dataset_files()
         for file in files:
             try:
@@ -288,10 +328,18 @@ class AttributionTools:
         )
 
         # Fetch training data
-        training_data = self.dataexport.export_list(
-            entity_type="Intrusion-Set",
-            n_threads=self.n_query_threads,
-        )
+        if self.training_store is not None:
+            training_data = self.dataexport.export_list_incremental(
+                entity_type="Intrusion-Set",
+                store=self.training_store,
+                full_export_days=self.full_training_export_days,
+                n_threads=self.n_query_threads,
+            )
+        else:
+            training_data = self.dataexport.export_list(
+                entity_type="Intrusion-Set",
+                n_threads=self.n_query_threads,
+            )
 
         # Train and set new model
         db_version = (
@@ -304,21 +352,28 @@ class AttributionTools:
         timestamp_str = f"{finished_time.isoformat(timespec='seconds')}Z"
 
         # Save most recent training data
-        training_data_object = {
-            "created_time": timestamp_str,
-            "db_version": self.attribution_model.db_version,
-            "training_data": training_data,
-        }
-        with open(f"{TRAINING_DATA_PATH}/intrusionsets_{timestamp_str}.json", "w") as f:
-            json.dump(training_data_object, f)
+        if self.training_store is not None:
+            # The exported data is already in the store
+            self.training_store.db_version = self.attribution_model.db_version
+            self.training_store.save()
+        else:
+            training_data_object = {
+                "created_time": timestamp_str,
+                "db_version": self.attribution_model.db_version,
+                "training_data": training_data,
+            }
+            with open(
+                f"{TRAINING_DATA_PATH}/intrusionsets_{timestamp_str}.json", "w"
+            ) as f:
+                json.dump(training_data_object, f)
+
+            # Delete old dataset files
+            files = self.get_dataset_files()
+            files_to_be_removed = files[N_MAX_DATASET_FILES:]
+            for file in files_to_be_removed:
+                os.remove(file["path"])
         self.helper.log_info("Training data saved.")
 
-        # Delete old dataset files
-        files = self.get_dataset_files()
-        files_to_be_removed = files[N_MAX_DATASET_FILES:]
-        for file in files_to_be_removed:
-            os.remove(file["path"])
-
         # Announce that training is finished
         message = f"Model training completed at {timestamp_str}. Training took {finished_time - now}."
         self.helper.api.work.to_processed(work_id, message)
@@ -7,6 +7,15 @@ CUSTOM_ATTRIBUTES = """
     parent_types
     name
 """
+CUSTOM_ATTRIBUTES_TIMESTAMPS = """
+    id
+    standard_id
+    entity_type
+    parent_types
+    name
+    created_at
+    updated_at
+"""
 CUSTOM_ATTRIBUTES_NO_NAME = """
     id
     standard_id
@@ -258,3 +267,23 @@ CUSTOM_ATTRIBUTES_RELATIONSHIP = """
         }
     }
 """
+CUSTOM_ATTRIBUTES_RELATIONSHIP_ENDS = """
+    id
+    updated_at
+    from {
+        ... on BasicObject {
+            id
+        }
+        ... on BasicRelationship {
+            id
+        }
+    }
+    to {
+        ... on BasicObject {
+            id
+        }
+        ... on BasicRelationship {
+            id
+        }
+    }
+"""
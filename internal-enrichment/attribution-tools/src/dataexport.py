@@ -1,15 +1,19 @@
 import uuid
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
 
 from custom_attributes import (
     CUSTOM_ATTRIBUTES,
     CUSTOM_ATTRIBUTES_NO_NAME,
     CUSTOM_ATTRIBUTES_OBSERVABLE,
     CUSTOM_ATTRIBUTES_RELATIONSHIP,
+    CUSTOM_ATTRIBUTES_RELATIONSHIP_ENDS,
+    CUSTOM_ATTRIBUTES_TIMESTAMPS,
 )
 from joblib import Parallel, delayed
 from pycti import OpenCTIApiClient
 from pycti.utils.constants import IdentityTypes, LocationTypes, StixCyberObservableTypes
+from training_store import TrainingDataStore
 
 # Spec version
 SPEC_VERSION = "2.1"
@@ -108,6 +112,155 @@ class DataExport:
             if max_marking_definition is not None
             else None
         )
+        entities_list = self.list_entities(
+            entity_type, search, filters, order_by, order_mode
+        )
+
+        # Run fetching of adjacent entities in parallel
+        bundle_list = Parallel(n_jobs=n_threads, prefer="threads")(
+            delayed(self.export_entity_bundle)(entity, max_marking_definition_entity)
+            for entity in entities_list
+        )
+
+        return self.filter_bundles(bundle_list)
+
+    def export_list_incremental(
+        self,
+        entity_type: str,
+        store: TrainingDataStore,
+        full_export_days: int = 7,
+        max_marking_definition: Dict = None,
+        n_threads=4,
+    ) -> list:
+        """exports the entities created or updated since the previous export into the store
+
+        An entity is exported again when its `updated_at` changed or when one of its
+        relationships was created or updated. Entities which no longer exist are removed
+        from the store. Relationship deletions and updates of the related entities don't
+        change these dates, every `full_export_days` all the entities are exported again.
+        :param entity_type: type of the entities to export
+        :type entity_type: str
+        :param store: store of the previous exports, saved once merged
+        :type store: TrainingDataStore
+        :param full_export_days: number of days between two full exports
+        :type full_export_days: int
+        :return: list of bundles, as returned by `export_list`
+        :rtype: list
+        """
+        max_marking_definition_entity = (
+            self.opencti.marking_definition.read(id=max_marking_definition)
+            if max_marking_definition is not None
+            else None
+        )
+        now = datetime.now(timezone.utc)
+        full_export = store.full_export_at is None or now - datetime.fromisoformat(
+            store.full_export_at
+        ) > timedelta(days=full_export_days)
+
+        entities_list = self.list_entities(
+            entity_type, custom_attributes=CUSTOM_ATTRIBUTES_TIMESTAMPS
+        )
+        current_entities = {entity["id"]: entity for entity in entities_list}
+        synced_at = max(
+            [entity["updated_at"] for entity in entities_list]
+            + ([store.synced_at] if store.synced_at else []),
+            default=None,
+        )
+
+        if full_export or store.synced_at is None:
+            updated_ids = set(current_entities)
+        else:
+            updated_ids = {
+                entity_id
+                for entity_id, entity in current_entities.items()
+                if store.get_updated_at(entity_id) != entity["updated_at"]
+            }
+            relationship_ends, relationships_synced_at = (
+                self.list_updated_relationship_ends(entity_type, store.synced_at)
+            )
+            updated_ids |= relationship_ends & current_entities.keys()
+            synced_at = max(filter(None, [synced_at, relationships_synced_at]))
+        removed_ids = store.ids() - current_entities.keys()
+
+        self.opencti.app_logger.info(
+            "Exporting updated entities",
+            {
+                "type": entity_type,
+                "full_export": full_export,
+                "updated": len(updated_ids),
+                "removed": len(removed_ids),
+                "total": len(current_entities),
+            },
+        )
+
+        # Keep the id and dates, generate_export replaces or removes them
+        updated_entities = [
+            (entity, entity["id"], entity["created_at"], entity["updated_at"])
+            for entity in entities_list
+            if entity["id"] in updated_ids
+        ]
+        bundle_list = Parallel(n_jobs=n_threads, prefer="threads")(
+            delayed(self.export_entity_bundle)(entity, max_marking_definition_entity)
+            for entity, _, _, _ in updated_entities
+        )
+        for (_, entity_id, created_at, updated_at), entity_bundle in zip(
+            updated_entities, bundle_list
+        ):
+            store.merge(entity_id, created_at, updated_at, entity_bundle["objects"])
+        store.remove(removed_ids)
+        store.synced_at = synced_at
+        if full_export:
+            store.full_export_at = now.isoformat()
+        store.save()
+
+        return store.training_data()
+
+    def list_updated_relationship_ends(
+        self, entity_type: str, since: str
+    ) -> Tuple[Set[str], Optional[str]]:
+        """lists the entities at either end of the relationships updated since a date
+        :param entity_type: type of the entities at one end of the relationships
+        :type entity_type: str
+        :param since: relationships updated after this date are listed
+        :type since: str
+        :return: ids of the relationship ends, most recent update date
+        :rtype: tuple
+        """
+        filters = {
+            "mode": "and",
+            "filters": [{"key": "updated_at", "values": [since], "operator": "gt"}],
+            "filterGroups": [],
+        }
+        ends = set()
+        synced_at = None
+        for do_list in (
+            self.opencti.stix_core_relationship.list,
+            self.opencti.stix_sighting_relationship.list,
+        ):
+            for types in ({"fromTypes": [entity_type]}, {"toTypes": [entity_type]}):
+                relationships = do_list(
+                    filters=filters,
+                    customAttributes=CUSTOM_ATTRIBUTES_RELATIONSHIP_ENDS,
+                    getAll=True,
+                    **types,
+                )
+                for relationship in relationships:
+                    ends.add(relationship["from"]["id"])
+                    ends.add(relationship["to"]["id"])
+                    synced_at = max(
+                        filter(None, [synced_at, relationship["updated_at"]])
+                    )
+        return ends, synced_at
+
+    def list_entities(
+        self,
+        entity_type: str,
+        search: Dict = None,
+        filters: object = None,
+        order_by: str = "created_at",
+        order_mode: str = "asc",
+        custom_attributes: str = None,
+    ) -> list:
         if entity_type == "StixFile":
             entity_type = "File"
         if IdentityTypes.has_value(entity_type):
@@ -170,8 +323,10 @@ class DataExport:
         do_list, attributes = lister.get(
             entity_type, lambda **kwargs: self.unknown_type({"type": entity_type})
         )
-        entities_list = do_list(
-            customAttributes=attributes,
+        return do_list(
+            customAttributes=(
+                custom_attributes if custom_attributes is not None else attributes
+            ),
             search=search,
             filters=filters,
             orderBy=order_by,
@@ -179,47 +334,49 @@ class DataExport:
             getAll=True,
         )
 
-        def process_entity(entity):
-            """gets the entity and adjacent relations
-            :param entity: entity to be processed
-            """
-            entity_bundle = self.prepare_export(
-                self.generate_export(entity),
-                "full",
-                max_marking_definition_entity,
-            )
-            if entity_bundle is not None:
-                individual_bundle = {
-                    "type": "bundle",
-                    "id": "bundle--" + str(uuid.uuid4()),
-                    "objects": [],
-                }
-                individual_bundle["objects"] = entity_bundle
-                return individual_bundle
-
-        # Run fetching of adjacent entities in parallel
-        bundle_list = Parallel(n_jobs=n_threads, prefer="threads")(
-            delayed(process_entity)(entity) for entity in entities_list
+    def export_entity_bundle(
+        self, entity: Dict, max_marking_definition_entity: Dict = None
+    ) -> Dict:
+        """gets the entity and adjacent relations
+        :param entity: entity to be processed
+        :type entity: dict
+        :return: bundle of the entity
+        :rtype: dict
+        """
+        entity_bundle = self.prepare_export(
+            self.generate_export(entity),
+            "full",
+            max_marking_definition_entity,
         )
+        return {
+            "type": "bundle",
+            "id": "bundle--" + str(uuid.uuid4()),
+            "objects": entity_bundle,
+        }
 
-        # Filter repeated uuids
-        uuids = []
+    def filter_bundles(self, bundle_list: List) -> List:
+        """removes the objects already present in a previous bundle
+        :param bundle_list: list of bundles
+        :type bundle_list: list
+        :return: list of filtered bundles
+        :rtype: list
+        """
+        uuids = set()
         filtered_bundle_list = []
         for entity_bundle in bundle_list:
             entity_objects_filtered = self.filter_objects(
                 uuids, entity_bundle["objects"]
             )
-            for x in entity_objects_filtered:
-                uuids.append(x["id"])
+            uuids.update(x["id"] for x in entity_objects_filtered)
             entity_bundle["objects"] = entity_objects_filtered
             filtered_bundle_list.append(entity_bundle)
 
         return filtered_bundle_list
 
-    def filter_objects(self, uuids: List, objects: List) -> List:
+    def filter_objects(self, uuids: Set, objects: List) -> List:
         """filters objects based on UUIDs
-        :param uuids: list of UUIDs
-        :type uuids: list
+        :param uuids: set of UUIDs
+        :type uuids: set
         :param objects: list of objects to filter
         :type objects: list
         :return: list of filtered objects
@@ -563,9 +720,8 @@ class DataExport:
         if mode == "simple":
             return result
         elif mode == "full":
-            uuids = [entity["id"]]
-            for x in result:
-                uuids.append(x["id"])
+            uuids = {entity["id"]}
+            uuids.update(x["id"] for x in result)
             # Get extra relations (from)
             stix_core_relationships = self.opencti.stix_core_relationship.list(
                 elementId=entity["x_opencti_id"],
@@ -593,8 +749,8 @@ class DataExport:
                     relation_object_bundle = self.filter_objects(
                         uuids, relation_object_data
                     )
-                    uuids = uuids + [x["id"] for x in relation_object_bundle]
-                    result = result + relation_object_bundle
+                    uuids.update(x["id"] for x in relation_object_bundle)
+                    result.extend(relation_object_bundle)
                 else:
                     self.opencti.app_logger.info(
                         "Marking definitions are less than max definition, not exporting the relation AND the target entity",
@@ -630,8 +786,8 @@ class DataExport:
                     relation_object_bundle = self.filter_objects(
                         uuids, relation_object_data
                     )
-                    uuids = uuids + [x["id"] for x in relation_object_bundle]
-                    result = result + relation_object_bundle
+                    uuids.update(x["id"] for x in relation_object_bundle)
+                    result.extend(relation_object_bundle)
                 else:
                     self.opencti.app_logger.info(
                         "Marking definitions are less than max definition, not exporting the relation AND the target entity",
@@ -699,8 +855,8 @@ class DataExport:
                             uuids, stix_entity_object
                         )
 
-                        uuids = uuids + [x["id"] for x in entity_object_bundle]
-                        result = result + entity_object_bundle
+                        uuids.update(x["id"] for x in entity_object_bundle)
+                        result.extend(entity_object_bundle)
                         break
                     except ValueError as e:
                         print("hit a value error:")
@@ -716,8 +872,8 @@ class DataExport:
                 relation_object_bundle = self.filter_objects(
                     uuids, relation_object_data
                 )
-                uuids = uuids + [x["id"] for x in relation_object_bundle]
-                result = result + relation_object_bundle
+                uuids.update(x["id"] for x in relation_object_bundle)
+                result.extend(relation_object_bundle)
             final_result = []
             for entity in result:
                 if entity["type"] == "report" or entity["type"] == "note":
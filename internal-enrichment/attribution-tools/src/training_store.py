@@ -0,0 +1,199 @@
+import gzip
+import json
+import os
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+STORE_VERSION = 1
+
+
+class TrainingDataStore:
+    """Training data kept on disk between trainings, merged with the exported deltas.
+
+    The store is columnar: one column per entity attribute, with the objects of
+    every entity bundle as indexes in a single table of objects. Objects shared by
+    several entities (related entities, marking definitions...) are stored once.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.db_version: Optional[str] = None
+        # Most recent updated_at seen by the export, the next one starts from it
+        self.synced_at: Optional[str] = None
+        self.full_export_at: Optional[str] = None
+        # Entity columns
+        self.entity_ids: List[str] = []
+        self.created_at: List[str] = []
+        self.updated_at: List[str] = []
+        self.object_indexes: List[List[int]] = []
+        # Object table
+        self.object_ids: List[str] = []
+        self.objects: List[Dict] = []
+        self._entity_positions: Dict[str, int] = {}
+        self._object_positions: Dict[str, int] = {}
+
+    def load(self) -> bool:
+        """loads the store from disk
+        :return: `True` if a store was loaded
+        :rtype: bool
+        """
+        if not os.path.isfile(self.path):
+            return False
+        with gzip.open(self.path, "rt") as f:
+            data = json.load(f)
+        if data["version"] != STORE_VERSION:
+            return False
+        self.db_version = data["db_version"]
+        self.synced_at = data["synced_at"]
+        self.full_export_at = data["full_export_at"]
+        entities = data["entities"]
+        self.entity_ids = entities["id"]
+        self.created_at = entities["created_at"]
+        self.updated_at = entities["updated_at"]
+        offsets = entities["object_offsets"]
+        indexes = entities["object_indexes"]
+        self.object_indexes = [
+            indexes[offsets[i] : offsets[i + 1]] for i in range(len(self.entity_ids))
+        ]
+        self.object_ids = data["objects"]["id"]
+        self.objects = data["objects"]["data"]
+        self._entity_positions = {
+            entity_id: i for i, entity_id in enumerate(self.entity_ids)
+        }
+        self._object_positions = {
+            object_id: i for i, object_id in enumerate(self.object_ids)
+        }
+        return True
+
+    def save(self) -> None:
+        """writes the store to disk, objects no longer used by any entity are dropped"""
+        used = sorted({i for indexes in self.object_indexes for i in indexes})
+        new_positions = {old: new for new, old in enumerate(used)}
+        self.object_indexes = [
+            [new_positions[i] for i in indexes] for indexes in self.object_indexes
+        ]
+        self.object_ids = [self.object_ids[i] for i in used]
+        self.objects = [self.objects[i] for i in used]
+        self._object_positions = {
+            object_id: i for i, object_id in enumerate(self.object_ids)
+        }
+
+        offsets = [0]
+        flat_indexes = []
+        for indexes in self.object_indexes:
+            flat_indexes.extend(indexes)
+            offsets.append(len(flat_indexes))
+        data = {
+            "version": STORE_VERSION,
+            "db_version": self.db_version,
+            "synced_at": self.synced_at,
+            "full_export_at": self.full_export_at,
+            "entities": {
+                "id": self.entity_ids,
+                "created_at": self.created_at,
+                "updated_at": self.updated_at,
+                "object_offsets": offsets,
+                "object_indexes": flat_indexes,
+            },
+            "objects": {"id": self.object_ids, "data": self.objects},
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with gzip.open(tmp_path, "wt") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.entity_ids)
+
+    def get_updated_at(self, entity_id: str) -> Optional[str]:
+        position = self._entity_positions.get(entity_id)
+        return None if position is None else self.updated_at[position]
+
+    def ids(self) -> set:
+        return set(self.entity_ids)
+
+    def merge(
+        self, entity_id: str, created_at: str, updated_at: str, objects: List[Dict]
+    ) -> None:
+        """adds or replaces the bundle objects of an entity
+        :param entity_id: OpenCTI id of the entity
+        :type entity_id: str
+        :param created_at: creation date of the entity
+        :type created_at: str
+        :param updated_at: last update date of the entity
+        :type updated_at: str
+        :param objects: objects of the entity bundle
+        :type objects: list
+        """
+        indexes = []
+        for stix_object in objects:
+            if "id" not in stix_object:
+                continue
+            position = self._object_positions.get(stix_object["id"])
+            if position is None:
+                position = len(self.object_ids)
+                self._object_positions[stix_object["id"]] = position
+                self.object_ids.append(stix_object["id"])
+                self.objects.append(stix_object)
+            else:
+                # Most recent export of the object
+                self.objects[position] = stix_object
+            indexes.append(position)
+
+        position = self._entity_positions.get(entity_id)
+        if position is None:
+            self._entity_positions[entity_id] = len(self.entity_ids)
+            self.entity_ids.append(entity_id)
+            self.created_at.append(created_at)
+            self.updated_at.append(updated_at)
+            self.object_indexes.append(indexes)
+        else:
+            self.created_at[position] = created_at
+            self.updated_at[position] = updated_at
+            self.object_indexes[position] = indexes
+
+    def remove(self, entity_ids: Iterable[str]) -> None:
+        """removes the entities, their objects are dropped on the next save"""
+        removed = set(entity_ids)
+        if not removed:
+            return
+        kept = [
+            i for i, entity_id in enumerate(self.entity_ids) if entity_id not in removed
+        ]
+        self.entity_ids = [self.entity_ids[i] for i in kept]
+        self.created_at = [self.created_at[i] for i in kept]
+        self.updated_at = [self.updated_at[i] for i in kept]
+        self.object_indexes = [self.object_indexes[i] for i in kept]
+        self._entity_positions = {
+            entity_id: i for i, entity_id in enumerate(self.entity_ids)
+        }
+
+    def training_data(self) -> List[Dict]:
+        """rebuilds the training data as exported by `DataExport.export_list`
+
+        Entities are ordered by creation date and an object is only kept in the
+        first bundle it appears in.
+        :return: list of bundles, one per entity
+        :rtype: list
+        """
+        order = sorted(
+            range(len(self.entity_ids)),
+            key=lambda i: (self.created_at[i] or "", self.entity_ids[i]),
+        )
+        seen = set()
+        bundles = []
+        for position in order:
+            objects = []
+            for i in self.object_indexes[position]:
+                if self.object_ids[i] not in seen:
+                    objects.append(self.objects[i])
+            seen.update(self.object_ids[i] for i in self.object_indexes[position])
+            bundles.append(
+                {
+                    "type": "bundle",
+                    "id": "bundle--" + str(uuid.uuid4()),
+                    "objects": objects,
+                }
+            )
+        return bundles
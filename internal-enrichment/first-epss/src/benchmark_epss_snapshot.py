@@ -0,0 +1,100 @@
+"""
+Build the EPSS snapshot and compare its lookups with the scores file
+
+    python benchmark_epss_snapshot.py [--cves 300000] [epss_scores-current.csv.gz]
+
+The daily scores file can be given instead of the synthetic one. Every CVE of
+the file must be found in the snapshot with the same score and percentile, the
+script exits with an error otherwise.
+"""
+
+import argparse
+import gzip
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+from internal_enrichment_connector.epss_snapshot import (
+    EpssSnapshot,
+    parse_scores_file,
+)
+
+
+def generate_scores_file(count: int, rng: random.Random) -> bytes:
+    lines = [
+        "#model_version:v2025.03.14,score_date:2025-03-20T00:00:00+0000",
+        "cve,epss,percentile",
+    ]
+    for index in rng.sample(range(27 * 10**7), count):
+        year, number = divmod(index, 10**7)
+        lines.append(
+            f"CVE-{1999 + year}-{number:04d},{rng.random():.5f},{rng.random():.5f}"
+        )
+    return gzip.compress(("\n".join(lines) + "\n").encode())
+
+
+def read_expected(data: bytes) -> dict:
+    expected = {}
+    with gzip.open(io.BytesIO(data), "rt") as lines:
+        for line in lines:
+            if line.startswith("CVE-"):
+                cve_name, epss, percentile = line.strip().split(",")
+                expected[cve_name] = (float(epss), float(percentile))
+    return expected
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file", nargs="?", help="Daily EPSS scores file")
+    parser.add_argument("--cves", type=int, default=300000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            data = f.read()
+    else:
+        data = generate_scores_file(args.cves, random.Random(args.seed))
+    expected = read_expected(data)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "epss.snapshot")
+
+        start = time.perf_counter()
+        score_date, records = parse_scores_file(io.BytesIO(data))
+        EpssSnapshot.write(path, score_date, records)
+        print(
+            f"{len(records)} CVEs of {score_date} written in "
+            f"{time.perf_counter() - start:.2f}s, "
+            f"{os.path.getsize(path) / 1024 / 1024:.1f} MiB"
+        )
+
+        start = time.perf_counter()
+        snapshot = EpssSnapshot.open(path)
+        print(f"snapshot opened in {time.perf_counter() - start:.4f}s")
+
+        start = time.perf_counter()
+        mismatches = [
+            cve_name
+            for cve_name, values in expected.items()
+            if snapshot.get(cve_name) != values
+        ]
+        duration = time.perf_counter() - start
+        print(
+            f"{len(expected)} lookups in {duration:.2f}s, "
+            f"{duration / len(expected) * 1e6:.1f}us per lookup"
+        )
+        missing = snapshot.get("CVE-1990-0001")
+        snapshot.data.close()
+
+    if mismatches or missing is not None:
+        print(f"{len(mismatches)} CVEs differ from the scores file", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -53,3 +53,28 @@ class ConnectorClient:
         except Exception as err:
             error_msg = "[API] Error while parsing data: "
             self.helper.connector_logger.error(error_msg, {"error": {str(err)}})
+
+    def download_scores(self, scores_file) -> bool:
+        """
+        Download the daily EPSS scores file published by FIRST
+        :param scores_file: Binary file object the gzipped CSV is written to
+        :return: True if the file was downloaded
+        """
+        try:
+            with self.session.get(self.config.snapshot_url, stream=True) as response:
+                self.helper.connector_logger.info(
+                    "[API] HTTP Get Request to endpoint",
+                    {"url_path": self.config.snapshot_url},
+                )
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    scores_file.write(chunk)
+            scores_file.seek(0)
+            return True
+
+        except requests.RequestException as err:
+            error_msg = "[API] Error while downloading EPSS scores: "
+            self.helper.connector_logger.error(
+                error_msg, {"url_path": self.config.snapshot_url, "error": str(err)}
+            )
+            return False
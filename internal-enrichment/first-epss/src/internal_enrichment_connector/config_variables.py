@@ -57,3 +57,48 @@ class ConfigConnector:
             None,
             False,
         )
+
+        self.snapshot_path = get_config_variable(
+            "FIRST_EPSS_SNAPSHOT_PATH",
+            ["first_epss", "snapshot_path"],
+            self.load,
+            False,
+            None,
+            False,
+        )
+
+        self.snapshot_url = get_config_variable(
+            "FIRST_EPSS_SNAPSHOT_URL",
+            ["first_epss", "snapshot_url"],
+            self.load,
+            False,
+            "https://epss.cyentia.com/epss_scores-current.csv.gz",
+            False,
+        )
+
+        self.snapshot_interval = get_config_variable(
+            "FIRST_EPSS_SNAPSHOT_INTERVAL",
+            ["first_epss", "snapshot_interval"],
+            self.load,
+            True,
+            6,
+            False,
+        )
+
+        self.sweep_enabled = get_config_variable(
+            "FIRST_EPSS_SWEEP_ENABLED",
+            ["first_epss", "sweep_enabled"],
+            self.load,
+            False,
+            True,
+            False,
+        )
+
+        self.sweep_bundle_size = get_config_variable(
+            "FIRST_EPSS_SWEEP_BUNDLE_SIZE",
+            ["first_epss", "sweep_bundle_size"],
+            self.load,
+            True,
+            1000,
+            False,
+        )
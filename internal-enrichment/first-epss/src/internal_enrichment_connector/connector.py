@@ -1,10 +1,26 @@
-from pycti import OpenCTIConnectorHelper
+import tempfile
+import threading
+import time
+
+from pycti import OpenCTIApiClient, OpenCTIConnectorHelper
 
 from .client_api import ConnectorClient
 from .config_variables import ConfigConnector
 from .converter_to_stix import ConverterToStix
+from .epss_snapshot import EpssSnapshot, parse_scores_file
 from .utils import is_cve_format
 
+VULNERABILITY_ATTRIBUTES = """
+    id
+    name
+    x_opencti_epss_score
+    x_opencti_epss_percentile
+    objectMarking {
+        definition_type
+        definition
+    }
+"""
+
 
 class FirstEPSSConnector:
     """
@@ -61,6 +77,42 @@ class FirstEPSSConnector:
         self.tlp = None
         self.stix_objects_list = []
 
+        # Local daily EPSS scores, enrichments use the API until it is loaded
+        self.snapshot = (
+            EpssSnapshot.open(self.config.snapshot_path)
+            if self.config.snapshot_path
+            else None
+        )
+        # The sweep runs in its own thread, it uses its own client instead of the
+        # helper, whose state (playbook, draft, shared organizations...) is set for
+        # each enrichment message by the listen thread
+        self.sweep_client = (
+            OpenCTIApiClient(
+                url=self.helper.get_opencti_url(),
+                token=self.helper.get_opencti_token(),
+            )
+            if self.config.snapshot_path
+            else None
+        )
+
+    def _get_epss_infos(self, cve_name) -> list:
+        """
+        Get the EPSS values of a CVE from the local snapshot, or from the API
+        :param cve_name: CVE identifier
+        :return: List of dicts with the CVE, its score and percentile
+        """
+
+        snapshot = self.snapshot
+        if snapshot is None:
+            enrichment_response = self.api.get_entity({"cve": cve_name})
+            return enrichment_response["data"]
+
+        values = snapshot.get(cve_name)
+        if values is None:
+            return []
+        epss_score, epss_percentile = values
+        return [{"cve": cve_name, "epss": epss_score, "percentile": epss_percentile}]
+
     def _collect_intelligence(self, cve_name) -> list:
         """
         Collect intelligence from the source and convert into STIX object
@@ -72,8 +124,7 @@ class FirstEPSSConnector:
 
         self.author = self.converter_to_stix.create_author()
 
-        enrichment_response = self.api.get_entity({"cve": cve_name})
-        enrichment_infos = enrichment_response["data"]
+        enrichment_infos = self._get_epss_infos(cve_name)
 
         stix_objects = []
 
@@ -201,11 +252,151 @@ class FirstEPSSConnector:
                 "[CONNECTOR] Unexpected Error occurred", {"error_message": str(err)}
             )
 
+    def refresh_snapshot(self) -> None:
+        """
+        Download the daily EPSS scores and replace the local snapshot when FIRST
+        published a new one
+        :return: None
+        """
+
+        with tempfile.TemporaryFile() as scores_file:
+            if not self.api.download_scores(scores_file):
+                return
+            score_date, records = parse_scores_file(scores_file)
+
+        if self.snapshot is not None and self.snapshot.score_date == score_date:
+            self.helper.connector_logger.info(
+                "[CONNECTOR] EPSS snapshot is up to date", {"score_date": score_date}
+            )
+            return
+        if not records:
+            self.helper.connector_logger.warning(
+                "[CONNECTOR] EPSS scores file is empty, keeping the current snapshot"
+            )
+            return
+
+        EpssSnapshot.write(self.config.snapshot_path, score_date, records)
+        self.snapshot = EpssSnapshot.open(self.config.snapshot_path)
+        self.helper.connector_logger.info(
+            "[CONNECTOR] EPSS snapshot loaded",
+            {"score_date": score_date, "cves": len(records)},
+        )
+
+    def _send_sweep_bundle(self, stix_objects: list) -> None:
+        # Pushed through the API, which takes no work id: the sweep bundles
+        # aren't tracked by a work, the sweep logs its progress instead
+        stix_objects_bundle = self.helper.stix2_create_bundle(
+            stix_objects + [self.converter_to_stix.author]
+        )
+        self.sweep_client.send_bundle_to_api(
+            connector_id=self.helper.connect_id, bundle=stix_objects_bundle
+        )
+
+    def sweep_vulnerabilities(self) -> None:
+        """
+        Update the EPSS values of every Vulnerability in the platform once per
+        snapshot, only the values which changed are sent
+        :return: None
+        """
+
+        snapshot = self.snapshot
+        current_state = self.helper.get_state() or {}
+        if current_state.get("last_sweep_score_date") == snapshot.score_date:
+            return
+
+        self.helper.connector_logger.info(
+            "[CONNECTOR] Starting EPSS sweep", {"score_date": snapshot.score_date}
+        )
+
+        checked = 0
+        updated = 0
+        stix_objects = []
+        after = None
+        while True:
+            result = self.sweep_client.vulnerability.list(
+                first=500,
+                after=after,
+                withPagination=True,
+                customAttributes=VULNERABILITY_ATTRIBUTES,
+            )
+            for vulnerability in result["entities"]:
+                checked += 1
+                values = snapshot.get(vulnerability["name"])
+                if values is None or values == (
+                    vulnerability.get("x_opencti_epss_score"),
+                    vulnerability.get("x_opencti_epss_percentile"),
+                ):
+                    continue
+                if not self._is_marking_allowed(vulnerability):
+                    continue
+
+                epss_score, epss_percentile = values
+                stix_objects.append(
+                    self.converter_to_stix.create_vulnerability(
+                        {
+                            "name": vulnerability["name"],
+                            "x_opencti_epss_score": epss_score,
+                            "x_opencti_epss_percentile": epss_percentile,
+                        },
+                    )
+                )
+                if len(stix_objects) >= self.config.sweep_bundle_size:
+                    self._send_sweep_bundle(stix_objects)
+                    updated += len(stix_objects)
+                    stix_objects = []
+
+            if not result["pagination"]["hasNextPage"]:
+                break
+            after = result["pagination"]["endCursor"]
+
+        if stix_objects:
+            self._send_sweep_bundle(stix_objects)
+            updated += len(stix_objects)
+
+        message = (
+            f"EPSS sweep of {snapshot.score_date} completed: {checked} "
+            f"vulnerabilities checked, {updated} updated"
+        )
+        self.helper.connector_logger.info("[CONNECTOR] " + message)
+
+        current_state = self.helper.get_state() or {}
+        current_state["last_sweep_score_date"] = snapshot.score_date
+        self.helper.set_state(current_state)
+
+    def _is_marking_allowed(self, vulnerability: dict) -> bool:
+        tlp = None
+        for marking_definition in vulnerability.get("objectMarking") or []:
+            if marking_definition["definition_type"] == "TLP":
+                tlp = marking_definition["definition"]
+        return self.helper.check_max_tlp(tlp, self.config.max_tlp)
+
+    def snapshot_loop(self) -> None:
+        """
+        Refresh the snapshot and sweep the vulnerabilities at a regular interval
+        :return: None
+        """
+
+        while True:
+            try:
+                self.refresh_snapshot()
+                if self.snapshot is not None and self.config.sweep_enabled:
+                    self.sweep_vulnerabilities()
+            except Exception as err:
+                self.helper.connector_logger.error(
+                    "[CONNECTOR] Error while refreshing the EPSS snapshot",
+                    {"error_message": str(err)},
+                )
+            time.sleep(self.config.snapshot_interval * 3600)
+
     def run(self) -> None:
         """
         Run the main process in self.helper.listen() method
         The method continuously monitors a message queue associated with a specific connector
         The connector have to listen a specific queue to get and then enrich the information.
         The helper provide an easy way to listen to the events.
+        When a snapshot path is set, the snapshot is refreshed in a background thread.
         """
+        if self.config.snapshot_path:
+            snapshot_thread = threading.Thread(target=self.snapshot_loop, daemon=True)
+            snapshot_thread.start()
         self.helper.listen(message_callback=self.process_message)
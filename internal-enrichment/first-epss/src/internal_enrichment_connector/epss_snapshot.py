@@ -0,0 +1,129 @@
+import gzip
+import io
+import mmap
+import os
+import struct
+
+HEADER = struct.Struct("!4sI32s")
+MAGIC = b"EPS1"
+# CVE year, CVE number, score and percentile as fixed point integers
+RECORD = struct.Struct("!HIII")
+# EPSS values are published with 5 decimals, 9 keep them exact
+SCALE = 10**9
+
+
+def cve_key(cve_name: str):
+    """
+    Convert a CVE identifier to its key in the snapshot
+    :param cve_name: CVE identifier, e.g. CVE-2024-3400
+    :return: Tuple of the CVE year and number, None if it isn't a CVE
+    """
+    parts = cve_name.split("-")
+    if len(parts) != 3 or parts[0].upper() != "CVE":
+        return None
+    try:
+        return int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+def parse_scores_file(scores_file) -> tuple:
+    """
+    Parse the daily EPSS scores file published by FIRST
+    :param scores_file: Binary file object of the gzipped CSV
+    :return: Score date and list of records sorted by CVE
+    """
+    score_date = ""
+    records = []
+    with gzip.open(scores_file, "rt") as lines:
+        for line in lines:
+            if line.startswith("#"):
+                # e.g. #model_version:v2025.03.14,score_date:2025-03-20T00:00:00+0000
+                for field in line[1:].strip().split(","):
+                    name, _, value = field.partition(":")
+                    if name == "score_date":
+                        score_date = value
+                continue
+            cve_name, _, values = line.strip().partition(",")
+            key = cve_key(cve_name)
+            if key is None:
+                # CSV header or empty line
+                continue
+            epss, _, percentile = values.partition(",")
+            records.append(
+                (*key, round(float(epss) * SCALE), round(float(percentile) * SCALE))
+            )
+    records.sort()
+    return score_date, records
+
+
+class EpssSnapshot:
+    """
+    Daily EPSS scores kept in a local file and memory mapped, as CVE sorted
+    packed records of 14 bytes. A lookup is a binary search in the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as snapshot_file:
+            self.data = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, score_date = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an EPSS snapshot")
+        self.score_date = score_date.rstrip(b"\0").decode()
+
+    @classmethod
+    def open(cls, path: str):
+        """
+        Open the snapshot
+        :param path: Path of the snapshot
+        :return: EpssSnapshot, None if there is no snapshot yet
+        """
+        if not os.path.isfile(path):
+            return None
+        return cls(path)
+
+    @staticmethod
+    def write(path: str, score_date: str, records: list) -> None:
+        """
+        Replace the snapshot with the given scores
+        :param path: Path of the snapshot
+        :param score_date: Date of the scores
+        :param records: Records sorted by CVE, as returned by parse_scores_file
+        :return: None
+        """
+        buffer = io.BytesIO()
+        buffer.write(HEADER.pack(MAGIC, len(records), score_date.encode()))
+        for record in records:
+            buffer.write(RECORD.pack(*record))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as snapshot_file:
+            snapshot_file.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, cve_name: str):
+        """
+        Get the EPSS values of a CVE
+        :param cve_name: CVE identifier
+        :return: Tuple of score and percentile, None if the CVE isn't scored
+        """
+        key = cve_key(cve_name)
+        if key is None:
+            return None
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            year, number, score, percentile = RECORD.unpack_from(
+                self.data, HEADER.size + middle * RECORD.size
+            )
+            if (year, number) < key:
+                low = middle + 1
+            elif (year, number) > key:
+                high = middle
+            else:
+                return score / SCALE, percentile / SCALE
+        return None
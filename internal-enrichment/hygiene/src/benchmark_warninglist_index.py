@@ -0,0 +1,87 @@
+"""
+Compare the warning list index with WarningLists.search
+
+    python benchmark_warninglist_index.py [--values 5000] [--compare 200] [--fast] [file]
+
+The index checks every value in a single bulk call. The values are read from
+a file (one per line) or sampled from the warning lists. Both searches must
+return the same lists on the compared values, the script exits with an error
+otherwise.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from pymispwarninglists import WarningLists
+from warninglist_index import WarningListIndex
+
+
+def sample_values(warninglists: WarningLists, count: int, rng: random.Random) -> list:
+    entries = [
+        entry for warninglist in warninglists.values() for entry in warninglist.list
+    ]
+    values = []
+    while len(values) < count:
+        entry = rng.choice(entries)
+        values.append(
+            rng.choice(
+                [
+                    entry,
+                    "sub." + entry,
+                    "http://www." + entry + "/path",
+                    "x" + entry + "x",
+                    "%d.%d.%d.%d" % tuple(rng.randrange(256) for _ in range(4)),
+                    "nothing-%d.example" % rng.randrange(count),
+                ]
+            )
+        )
+    return values
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file", nargs="?", help="Values to search, one per line")
+    parser.add_argument("--values", type=int, default=5000)
+    parser.add_argument("--compare", type=int, default=200)
+    parser.add_argument("--fast", action="store_true", help="Disable slow search")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    slow_search = not args.fast
+
+    start = time.perf_counter()
+    warninglists = WarningLists(slow_search=slow_search)
+    print(f"{len(warninglists)} lists loaded in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    index = WarningListIndex(warninglists, slow_search=slow_search)
+    print(f"index built in {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(args.seed)
+    if args.file:
+        with open(args.file, "r") as f:
+            values = [line.strip() for line in f if line.strip()]
+    else:
+        values = sample_values(warninglists, args.values, rng)
+
+    start = time.perf_counter()
+    results = index.search_many(values)
+    duration = time.perf_counter() - start
+    hits = sum(1 for value in values if results[value])
+    print(f"index: {len(values)} values, {hits} hits in {duration:.2f}s")
+
+    compared = rng.sample(values, min(args.compare, len(values)))
+    start = time.perf_counter()
+    for value in compared:
+        expected = [warninglist.name for warninglist in warninglists.search(value)]
+        if [warninglist.name for warninglist in results[value]] != expected:
+            print(f"Index and search differ for {value!r}", file=sys.stderr)
+            return 1
+    duration = time.perf_counter() - start
+    print(f"search: {len(compared)} values in {duration:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
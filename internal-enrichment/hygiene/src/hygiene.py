@@ -11,6 +11,7 @@ from pycti import (
     get_config_variable,
 )
 from pymispwarninglists import WarningLists
+from warninglist_index import WarningListIndex
 
 # At the moment it is not possible to map lists to their upstream path.
 # Thus we need to have our own mapping here.
@@ -139,7 +140,10 @@ class HygieneConnector:
 
         self.helper.log_info(f"Warning lists slow search: {warninglists_slow_search}")
 
-        self.warninglists = WarningLists(slow_search=warninglists_slow_search)
+        # The index does the slow search, the lists are only loaded
+        self.warninglists = WarningListIndex(
+            WarningLists(), slow_search=warninglists_slow_search
+        )
 
         # Create Hygiene Tag
         self.label_hygiene = self.helper.api.label.read_or_create_unchecked(
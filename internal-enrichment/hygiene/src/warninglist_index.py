@@ -0,0 +1,185 @@
+from collections import deque
+from contextlib import suppress
+from ipaddress import (
+    AddressValueError,
+    IPv4Address,
+    IPv6Address,
+    NetmaskValueError,
+    ip_network,
+)
+from typing import Dict, Iterable, List
+from urllib.parse import urlparse
+
+from pymispwarninglists import WarningLists
+
+
+class WarningListIndex:
+    """
+    Precompiled index of the MISP warning lists.
+
+    The results are the same as `WarningLists.search`, in the same order, but
+    each search is a few hash lookups instead of a scan of every list:
+    - exact values (and every list without slow search) in a single hash table
+    - CIDR blocks in one hash table per prefix length
+    - hostnames and their suffixes in hash tables, looked up for each
+      parent domain of the searched hostname
+    - substrings in an Aho-Corasick automaton
+    """
+
+    def __init__(self, warninglists: WarningLists, slow_search: bool = False):
+        self.lists = list(warninglists.values())
+        self.slow_search = slow_search
+
+        exact = {}
+        cidr_exact = {}
+        # (version, prefix length) -> network address >> host bits -> positions
+        networks = {}
+        hostname_exact = {}
+        hostname_suffixes = {}
+        substrings = {}
+        for position, warninglist in enumerate(self.lists):
+            # Without slow search, every list is searched exactly. With it,
+            # regex lists never match.
+            if not slow_search or warninglist.type == "string":
+                self._add_all(exact, warninglist.set, position)
+            elif warninglist.type == "cidr":
+                self._add_all(cidr_exact, warninglist.set, position)
+                for value in warninglist.list:
+                    with suppress(ValueError):
+                        network = ip_network(value)
+                        host_bits = network.max_prefixlen - network.prefixlen
+                        self._add_all(
+                            networks.setdefault(
+                                (network.version, network.prefixlen), {}
+                            ),
+                            (int(network.network_address) >> host_bits,),
+                            position,
+                        )
+            elif warninglist.type == "hostname":
+                self._add_all(hostname_exact, warninglist.set, position)
+                self._add_all(
+                    hostname_suffixes,
+                    {value.lstrip(".") for value in warninglist.list},
+                    position,
+                )
+            elif warninglist.type == "substring":
+                self._add_all(substrings, warninglist.set, position)
+
+        self.exact = exact
+        self.cidr_exact = cidr_exact
+        self.networks = {
+            version: [
+                (max_prefixlen - prefixlen, addresses)
+                for (network_version, prefixlen), addresses in sorted(networks.items())
+                if network_version == version
+            ]
+            for version, max_prefixlen in ((4, 32), (6, 128))
+        }
+        self.hostname_exact = hostname_exact
+        self.hostname_suffixes = hostname_suffixes
+        self.substrings = SubstringAutomaton(substrings)
+
+    def search(self, value: str) -> list:
+        """Return the warning lists matching the value."""
+        positions = set(self.exact.get(value, ()))
+
+        if self.slow_search:
+            positions.update(self._search_cidr(value))
+            positions.update(self._search_hostname(value))
+            positions.update(self.substrings.search(value))
+
+        return [self.lists[position] for position in sorted(positions)]
+
+    def search_many(self, values: Iterable[str]) -> Dict[str, list]:
+        """Return the warning lists matching each distinct value."""
+        results = {}
+        for value in values:
+            if value not in results:
+                results[value] = self.search(value)
+        return results
+
+    def _search_cidr(self, value: str) -> Iterable[int]:
+        ip = None
+        with suppress(AddressValueError, NetmaskValueError):
+            ip = IPv4Address(value)
+        if ip is None:
+            with suppress(AddressValueError, NetmaskValueError):
+                ip = IPv6Address(value)
+        if ip is None:
+            # The value isn't an IP address, lists are searched exactly
+            return self.cidr_exact.get(value, ())
+
+        address = int(ip)
+        positions = []
+        for host_bits, addresses in self.networks[ip.version]:
+            positions.extend(addresses.get(address >> host_bits, ()))
+        return positions
+
+    def _search_hostname(self, value: str) -> Iterable[int]:
+        parsed_url = urlparse(value)
+        if parsed_url.hostname:
+            value = parsed_url.hostname
+
+        positions = list(self.hostname_exact.get(value, ()))
+        # value ends with "." + suffix for every suffix after a dot
+        dot = value.find(".")
+        while dot != -1:
+            positions.extend(self.hostname_suffixes.get(value[dot + 1 :], ()))
+            dot = value.find(".", dot + 1)
+        return positions
+
+    @staticmethod
+    def _add_all(table: dict, keys: Iterable, position: int) -> None:
+        # Keys of a single list share the same tuple of positions
+        positions = (position,)
+        for key in keys:
+            found = table.get(key)
+            table[key] = positions if found is None else found + positions
+
+
+class SubstringAutomaton:
+    """Aho-Corasick automaton returning the lists of the substrings found."""
+
+    def __init__(self, patterns: Dict[str, tuple]):
+        self.goto: List[dict] = [{}]
+        fail = [0]
+        outputs: List[set] = [set()]
+
+        for pattern, positions in patterns.items():
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    fail.append(0)
+                    outputs.append(set())
+                node = next_node
+            outputs[node].update(positions)
+
+        # Breadth first, so the failure of a node is complete before its children
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                state = fail[node]
+                while state and char not in self.goto[state]:
+                    state = fail[state]
+                fail[child] = self.goto[state].get(char, 0)
+                outputs[child] |= outputs[fail[child]]
+                queue.append(child)
+
+        self.fail = fail
+        self.outputs = [frozenset(output) for output in outputs]
+
+    def search(self, value: str) -> set:
+        # An empty substring is found in every value
+        positions = set(self.outputs[0])
+        node = 0
+        for char in value:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            positions |= self.outputs[node]
+        return positions
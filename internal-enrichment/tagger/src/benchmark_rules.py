@@ -0,0 +1,153 @@
+"""
+Compare the compiled rules with a rule by rule evaluation on a synthetic report
+
+    python benchmark_rules.py [--rules 200] [--objects 10000] [definitions.json]
+
+Both evaluations must find the same labels, the script exits with an error
+otherwise.
+"""
+
+import argparse
+import json
+import random
+import re
+import string
+import sys
+import time
+
+from connector import (
+    CONTAINER_TYPE_LIST,
+    TaggerConnector,
+    compile_definitions,
+    load_re_flags,
+)
+
+ENTITY_TYPES = ["Malware", "Intrusion-Set", "Vulnerability", "System", "Indicator"]
+
+
+def generate_definitions(count, rng):
+    rules = []
+    for index in range(count):
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(6))
+        rule = {
+            "label": f"label-{index % (count // 2 or 1)}",
+            "search": rng.choice([word, f"{word}|CVE-20{index % 25:02d}", f"^{word}"]),
+            "attributes": rng.sample(
+                ["name", "description", "objectLabel", "objects-type", "objects-name"],
+                2,
+            ),
+        }
+        if rng.random() < 0.5:
+            rule["flags"] = ["IGNORECASE"]
+        if rng.random() < 0.05:
+            rule["search"] = f"({word})-\\1"
+        rules.append(rule)
+    rules.append(
+        {"label": "with_systems", "search": "[Ss]ystem", "attributes": ["objects-type"]}
+    )
+    return [{"scopes": ["Report"], "rules": rules}]
+
+
+def generate_report(definitions, count, rng):
+    words = [
+        re.sub(r"[^a-z]", "", rule["search"].split("|")[0])
+        for definition in definitions
+        for rule in definition["rules"]
+    ]
+    objects = []
+    for index in range(count):
+        name = "".join(rng.choice(string.ascii_lowercase) for _ in range(12))
+        if rng.random() < 0.01:
+            name = rng.choice(words).upper() + name
+        objects.append(
+            {"entity_type": rng.choice(ENTITY_TYPES[:-2]), "name": name}
+            if rng.random() < 0.8
+            else {"entity_type": "Indicator", "observable_value": name}
+        )
+    return {
+        "entity_type": "Report",
+        "standard_id": "report--00000000-0000-0000-0000-000000000000",
+        "name": "Weekly report " + rng.choice(words),
+        "description": " ".join(rng.choice(words) for _ in range(3)),
+        "objectLabel": [{"value": rng.choice(words)}],
+        "objects": objects,
+    }
+
+
+def rule_by_rule_labels(definitions, entity):
+    labels = set()
+    for definition in definitions:
+        for scope in definition["scopes"]:
+            if entity["entity_type"].lower() != scope.lower():
+                continue
+            for rule in definition["rules"]:
+                flags = load_re_flags(rule)
+                for attribute in rule["attributes"]:
+                    if attribute.lower() in ["objects-type", "objects-name"]:
+                        if entity["entity_type"].lower() not in CONTAINER_TYPE_LIST:
+                            continue
+                        values = [
+                            (
+                                obj["entity_type"]
+                                if attribute.lower() == "objects-type"
+                                else obj.get("name", obj.get("observable_value"))
+                            )
+                            for obj in entity.get("objects") or []
+                        ]
+                    elif attribute.lower() == "objectlabel":
+                        values = [obj["value"] for obj in entity.get(attribute) or []]
+                    else:
+                        values = [entity.get(attribute)]
+                    for value in values:
+                        if value is not None and re.search(
+                            rule["search"], value, flags=flags
+                        ):
+                            labels.add(rule["label"])
+                            break
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("definitions", nargs="?", help="Definitions JSON file")
+    parser.add_argument("--rules", type=int, default=200)
+    parser.add_argument("--objects", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.definitions:
+        with open(args.definitions, "r") as f:
+            definitions = json.load(f)
+    else:
+        definitions = generate_definitions(args.rules, rng)
+    report = generate_report(definitions, args.objects, rng)
+
+    start = time.perf_counter()
+    expected = rule_by_rule_labels(definitions, report)
+    print(f"rule by rule: {len(expected)} labels in {time.perf_counter() - start:.2f}s")
+
+    # Only the rule evaluation is measured, the labels are collected locally
+    connector = TaggerConnector.__new__(TaggerConnector)
+    start = time.perf_counter()
+    connector.definitions = definitions
+    connector.matchers = compile_definitions(definitions)
+    compile_time = time.perf_counter() - start
+    found = []
+    connector.add_labels = lambda entity, labels: found.append(labels)
+    start = time.perf_counter()
+    connector._process_message({"enrichment_entity": report})
+    labels = found[0] if found else set()
+    print(
+        f"compiled: {len(labels)} labels in {time.perf_counter() - start:.2f}s, "
+        f"compiled in {compile_time:.2f}s"
+    )
+
+    if labels != expected:
+        print("Compiled and rule by rule labels differ", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,17 @@ from pycti import OpenCTIConnectorHelper, get_config_variable
 CONTAINER_TYPE_LIST = ["report", "grouping", "case-incident", "case-rfi", "case-rft"]
 
 
+# Flags which can be scoped to a part of a combined pattern
+SCOPED_FLAGS = {
+    re.IGNORECASE: "i",
+    re.MULTILINE: "m",
+    re.DOTALL: "s",
+    re.ASCII: "a",
+}
+
+OBJECTS_ATTRIBUTES = ["objects-type", "objects-name"]
+
+
 def load_re_flags(rule):
     """Load the regular expression flags from a rule definition."""
 
@@ -20,103 +31,164 @@ def load_re_flags(rule):
     return flags
 
 
+class RuleMatcher:
+    """Rules searched in the same attribute of the same entity type."""
+
+    def __init__(self):
+        self.rules = []
+        self.labels = set()
+        self.standalone_rules = []
+        self.scoped_patterns = []
+        self.prefilter = None
+
+    def add(self, label, search, flags):
+        regex = re.compile(search, flags=flags)
+        self.rules.append((label, regex))
+        self.labels.add(label)
+
+        # Patterns without groups are combined in a single alternation, which
+        # tells at once whether any of them can match.
+        scoped_flags = "".join(
+            letter for flag, letter in SCOPED_FLAGS.items() if flags & flag
+        )
+        if regex.groups == 0 and not flags & ~(sum(SCOPED_FLAGS) | re.UNICODE):
+            scoped_pattern = f"(?{scoped_flags}:{search})" if scoped_flags else search
+            try:
+                re.compile(scoped_pattern)
+                self.scoped_patterns.append(f"(?:{scoped_pattern})")
+                return
+            except re.error:
+                pass
+        self.standalone_rules.append((label, regex))
+
+    def compile(self):
+        if self.scoped_patterns:
+            self.prefilter = re.compile("|".join(self.scoped_patterns))
+
+    def match(self, value, labels):
+        """Add the labels of the rules matching the value."""
+
+        if self.prefilter is None or self.prefilter.search(value) is not None:
+            rules = self.rules
+        else:
+            rules = self.standalone_rules
+
+        for label, regex in rules:
+            if label not in labels and regex.search(value):
+                labels.add(label)
+
+    def done(self, labels):
+        """Whether the labels of every rule are already found."""
+
+        return self.labels <= labels
+
+
+def compile_definitions(definitions):
+    """
+    Index the rules of the definitions by entity type, then by attribute,
+    with their patterns compiled.
+    """
+
+    matchers = {}
+    for definition in definitions:
+        for scope in definition["scopes"]:
+            attributes = matchers.setdefault(scope.lower(), {})
+            for rule in definition["rules"]:
+                flags = load_re_flags(rule)
+                for attribute in rule["attributes"]:
+                    attributes.setdefault(attribute, RuleMatcher()).add(
+                        rule["label"], rule["search"], flags
+                    )
+
+    for attributes in matchers.values():
+        for matcher in attributes.values():
+            matcher.compile()
+
+    return matchers
+
+
 class TaggerConnector:
     def __init__(self):
         self.helper = OpenCTIConnectorHelper({})
         self.definitions = json.loads(get_config_variable("TAGGER_DEFINITIONS", []))
+        self.matchers = compile_definitions(self.definitions)
+        self.label_ids = {}
 
     def start(self):
         self.helper.listen(message_callback=self._process_message)
 
     def _process_message(self, data: Dict) -> str:
         enrichment_entity = data["enrichment_entity"]
-
-        for definition in self.definitions:
-            for scope in definition["scopes"]:
-                entity_type = scope.lower()
-
-                #  Check if enrichment entity is supported
-                if enrichment_entity["entity_type"].lower() != entity_type:
-                    continue
-
-                for rule in definition["rules"]:
-                    flags = load_re_flags(rule)
-
-                    for attribute in rule["attributes"]:
-                        if attribute.lower() in ["objects-type", "objects-name"]:
-                            attr = enrichment_entity.get("objects")
-                        else:
-                            attr = enrichment_entity.get(attribute)
-                        if attr is None:
-                            continue
-
-                        # Handles the case where the attribute is the list of labels
-                        if attribute.lower() == "objectlabel":
-                            for obj in attr:
-                                if not re.search(
-                                    rule["search"], obj["value"], flags=flags
-                                ):
-                                    continue
-
-                                self.add_label(
-                                    enrichment_entity["standard_id"], rule["label"]
-                                )
-                                break
-
-                            continue
-
-                        # Checks that the entity is a container
-                        if (
-                            enrichment_entity["entity_type"].lower()
-                            in CONTAINER_TYPE_LIST
-                        ):
-
-                            # Handles the case where the attribute is the list of objects
-                            if attribute.lower() == "objects-type":
-                                for obj in attr:
-                                    if not re.search(
-                                        rule["search"], obj["entity_type"], flags=flags
-                                    ):
-                                        continue
-
-                                    self.add_label(
-                                        enrichment_entity["standard_id"], rule["label"]
-                                    )
-                                    break
-
-                                continue
-
-                            elif attribute.lower() == "objects-name":
-                                for obj in attr:
-
-                                    name = obj.get(
-                                        "name", obj.get("observable_value", None)
-                                    )
-                                    if name is None:
-                                        continue
-
-                                    if not re.search(rule["search"], name, flags=flags):
-                                        continue
-
-                                    self.add_label(
-                                        enrichment_entity["standard_id"], rule["label"]
-                                    )
-                                    break
-
-                                continue
-
-                        if not re.search(rule["search"], attr, flags=flags):
-                            continue
-
-                        self.add_label(enrichment_entity["standard_id"], rule["label"])
-                        break
-
-    def add_label(self, entity, label):
-        """Send the API call to apply the label on the entity."""
-
-        self.helper.api.stix_domain_object.add_label(
+        entity_type = enrichment_entity["entity_type"].lower()
+
+        #  Check if enrichment entity is supported
+        attributes = self.matchers.get(entity_type)
+        if attributes is None:
+            return
+
+        labels = set()
+        objects_matchers = []
+        for attribute, matcher in attributes.items():
+            # Contained objects are searched at once below
+            if attribute.lower() in OBJECTS_ATTRIBUTES:
+                # Checks that the entity is a container
+                if entity_type in CONTAINER_TYPE_LIST:
+                    objects_matchers.append((attribute.lower(), matcher))
+                continue
+
+            attr = enrichment_entity.get(attribute)
+            if attr is None:
+                continue
+
+            # Handles the case where the attribute is the list of labels
+            if attribute.lower() == "objectlabel":
+                for obj in attr:
+                    matcher.match(obj["value"], labels)
+                continue
+
+            matcher.match(attr, labels)
+
+        # Handles the case where the attribute is the list of objects, in a
+        # single pass over the objects
+        if objects_matchers:
+            for obj in enrichment_entity.get("objects") or []:
+                name = obj.get("name", obj.get("observable_value", None))
+                for attribute, matcher in objects_matchers:
+                    if attribute == "objects-type":
+                        matcher.match(obj["entity_type"], labels)
+                    elif name is not None:
+                        matcher.match(name, labels)
+
+                if all(matcher.done(labels) for _, matcher in objects_matchers):
+                    break
+
+        if labels:
+            self.add_labels(enrichment_entity["standard_id"], labels)
+
+    def get_label_id(self, label):
+        """Read the label, creating it if needed, and cache its id."""
+
+        if label not in self.label_ids:
+            opencti_label = self.helper.api.label.read_or_create_unchecked(value=label)
+            if opencti_label is None:
+                self.helper.connector_logger.error(
+                    "The label could not be created", {"label": label}
+                )
+                return None
+            self.label_ids[label] = opencti_label["id"]
+        return self.label_ids[label]
+
+    def add_labels(self, entity, labels):
+        """Send a single API call to apply all the labels on the entity."""
+
+        label_ids = [self.get_label_id(label) for label in sorted(labels)]
+        label_ids = [label_id for label_id in label_ids if label_id is not None]
+        if not label_ids:
+            return
+
+        self.helper.api.stix_domain_object.update_field(
             id=entity,
-            label_name=label,
+            input=[{"key": "objectLabel", "value": label_ids, "operation": "add"}],
         )
 
 
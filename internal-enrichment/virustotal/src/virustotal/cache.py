@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Virustotal cache module."""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Least recently used cache whose entries expire after a delay."""
+
+    def __init__(self, max_size: int, ttl: int) -> None:
+        """
+        Initialize the cache.
+
+        Parameters
+        ----------
+        max_size : int
+            Maximum number of entries, the least recently used are dropped.
+        ttl : int
+            Seconds after which an entry is dropped.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        # Key -> (expiration time, value), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Retrieve a value.
+
+        Parameters
+        ----------
+        key : str
+            Key of the value.
+
+        Returns
+        -------
+        object or None
+            The value, None if it is not cached or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value) -> None:
+        """
+        Store a value.
+
+        Parameters
+        ----------
+        key : str
+            Key of the value.
+        value : object
+            Value to cache.
+        """
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
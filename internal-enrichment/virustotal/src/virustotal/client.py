@@ -3,6 +3,7 @@
 import base64
 import hashlib
 import json
+import threading
 import time
 import urllib.parse
 
@@ -12,11 +13,55 @@ from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
 
+class RateLimiter:
+    """Token bucket shared by all the requests sent to VirusTotal."""
+
+    def __init__(self, requests_per_minute: int, burst: int = 1) -> None:
+        """
+        Initialize the limiter.
+
+        Parameters
+        ----------
+        requests_per_minute : int
+            Quota of the API key, 0 to disable the limiter.
+        burst : int
+            Number of requests which can be sent at once.
+        """
+        self.rate = requests_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Wait until a request can be sent."""
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            # Take the token now and wait for it outside of the lock
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
 class VirusTotalClient:
     """VirusTotal client."""
 
+    # Number of times the status of an analysis is checked before giving up
+    ANALYSIS_ATTEMPTS = 10
+
     def __init__(
-        self, helper: OpenCTIConnectorHelper, base_url: str, token: str
+        self,
+        helper: OpenCTIConnectorHelper,
+        base_url: str,
+        token: str,
+        requests_per_minute: int = 0,
     ) -> None:
         """Initialize Virustotal client."""
         self.helper = helper
@@ -27,6 +72,17 @@ class VirusTotalClient:
             "x-apikey": token,
             "accept": "application/json",
         }
+        self.limiter = RateLimiter(requests_per_minute)
+
+        # Connections are kept open and reused by all the requests.
+        retry_strategy = Retry(
+            total=3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS"],
+        )
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=10)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
 
     def _query(self, url):
         """
@@ -47,18 +103,10 @@ class VirusTotalClient:
         JSON or None
             The result of the query, as JSON or None in case of failure.
         """
-        # Configure the adapter for the retry strategy.
-        retry_strategy = Retry(
-            total=3,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS"],
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        http = requests.Session()
-        http.mount("https://", adapter)
         response = None
+        self.limiter.acquire()
         try:
-            response = http.get(
+            response = self.session.get(
                 url, headers=self.headers | {"content-type": "application/json"}
             )
             response.raise_for_status()
@@ -113,8 +161,9 @@ class VirusTotalClient:
             if additional_headers is None
             else self.headers | additional_headers
         )
+        self.limiter.acquire()
         try:
-            response = requests.post(
+            response = self.session.post(
                 url, data=data, files=files, headers=headers, timeout=60
             )
             response.raise_for_status()
@@ -273,6 +322,45 @@ class VirusTotalClient:
             "data"
         ]["id"]
 
+    def get_analysis_status(self, analysis_id) -> str:
+        """
+        Retrieve the status of an analysis.
+
+        Parameters
+        ----------
+        analysis_id : str
+            The ID returned by VirusTotal for the analysis job of an upload
+
+        Returns
+        -------
+        str
+            Status of the analysis, `completed` once it is finished.
+        """
+        url = f"{self.url}/analyses/{analysis_id}"
+        return self._query(url)["data"]["attributes"]["status"]
+
+    @staticmethod
+    def analysis_retry_delay(upload_type, attempt) -> int:
+        """
+        Delay before checking the status of an analysis again.
+
+        Parameters
+        ----------
+        upload_type : str
+            The type of the upload (artifact || URL)
+        attempt : int
+            Number of times the status was already checked, starting at 0.
+
+        Returns
+        -------
+        int
+            Delay in seconds.
+        """
+        retry_delay = 30 if upload_type == "artifact" else 2  # in seconds
+        minimum_retry_delay = 60 if upload_type == "artifact" else 1  # in seconds
+        maximum_retry_delay = 180 if upload_type == "artifact" else 10  # in seconds
+        return min((attempt * retry_delay + minimum_retry_delay), maximum_retry_delay)
+
     def check_upload_status(self, upload_type, name, analysis_id):
         """
         Wait for the uploaded queued artifact or URL to finish being analyzed
@@ -286,17 +374,11 @@ class VirusTotalClient:
         analysis_id : str
             The ID returned by VirusTotal for the analysis job of the upload
         """
-        url = f"{self.url}/analyses/{analysis_id}"
-        retry_delay = 30 if upload_type == "artifact" else 2  # in seconds
-        minimum_retry_delay = 60 if upload_type == "artifact" else 1  # in seconds
-        maximum_retry_delay = 180 if upload_type == "artifact" else 10  # in seconds
-        total_attempts = 10
+        total_attempts = self.ANALYSIS_ATTEMPTS
         i = 0
         while i < total_attempts:
-            current_status = self._query(url)["data"]["attributes"]["status"]
-            current_retry_delay = min(
-                (i * retry_delay + minimum_retry_delay), maximum_retry_delay
-            )
+            current_status = self.get_analysis_status(analysis_id)
+            current_retry_delay = self.analysis_retry_delay(upload_type, i)
             i += 1
             if not current_status == "completed":
                 self.helper.log_debug(
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Virustotal cache unittest."""
+import unittest
+from unittest.mock import patch
+
+from virustotal.cache import TTLCache
+
+
+class TTLCacheTest(unittest.TestCase):
+    def test_least_recently_used_dropped(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expired_entry_dropped(self):
+        cache = TTLCache(max_size=10, ttl=60)
+        with patch("virustotal.cache.time.monotonic", return_value=1000):
+            cache.set("a", 1)
+        with patch("virustotal.cache.time.monotonic", return_value=1059):
+            self.assertEqual(cache.get("a"), 1)
+        with patch("virustotal.cache.time.monotonic", return_value=1060):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 """Virustotal client unittest."""
 import unittest
+from unittest.mock import MagicMock, patch
 
-from virustotal.client import VirusTotalClient
+from virustotal.client import RateLimiter, VirusTotalClient
+from virustotal.tracker import AnalysisTracker
 
 
 class VirusTotalClientTest(unittest.TestCase):
@@ -11,3 +13,58 @@ class VirusTotalClientTest(unittest.TestCase):
             VirusTotalClient.base64_encode_no_padding("http://myetherevvalliet.com/"),
             "aHR0cDovL215ZXRoZXJldnZhbGxpZXQuY29tLw",
         )
+
+
+class RateLimiterTest(unittest.TestCase):
+    @patch("virustotal.client.time.sleep")
+    @patch("virustotal.client.time.monotonic", return_value=100)
+    def test_requests_are_spaced(self, monotonic, sleep):
+        limiter = RateLimiter(requests_per_minute=4)
+        limiter.acquire()
+        sleep.assert_not_called()
+        limiter.acquire()
+        sleep.assert_called_once_with(15)
+
+    @patch("virustotal.client.time.sleep")
+    def test_disabled(self, sleep):
+        limiter = RateLimiter(requests_per_minute=0)
+        for _ in range(10):
+            limiter.acquire()
+        sleep.assert_not_called()
+
+
+class AnalysisTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.helper = MagicMock()
+        self.helper.get_state.return_value = None
+        self.client = MagicMock()
+        self.client.ANALYSIS_ATTEMPTS = 2
+        self.client.analysis_retry_delay.return_value = 0
+        self.tracker = AnalysisTracker(self.helper, self.client)
+
+    def test_completed_analysis_asks_enrichment(self):
+        self.tracker.park("observable-id", "URL", "http://example.com", "analysis")
+        self.client.get_analysis_status.return_value = "queued"
+        self.tracker.check()
+        self.assertIn("observable-id", self.tracker.pending)
+        self.helper.api.stix_cyber_observable.ask_for_enrichment.assert_not_called()
+
+        self.client.get_analysis_status.return_value = "completed"
+        self.tracker.check()
+        self.assertEqual(self.tracker.pending, {})
+        self.helper.api.stix_cyber_observable.ask_for_enrichment.assert_called_once_with(
+            id="observable-id", connector_id=self.helper.connect_id
+        )
+        self.assertTrue(self.tracker.pop_resumed("observable-id"))
+        self.assertFalse(self.tracker.pop_resumed("observable-id"))
+
+    def test_analysis_dropped_after_attempts(self):
+        self.tracker.park("observable-id", "URL", "http://example.com", "analysis")
+        self.client.get_analysis_status.return_value = "queued"
+        self.tracker.check()
+        self.tracker.check()
+        self.assertEqual(self.tracker.pending, {})
+        self.helper.api.stix_cyber_observable.ask_for_enrichment.assert_not_called()
+        self.assertEqual(
+            self.helper.set_state.call_args.args[0], {"pending_analyses": {}}
+        )
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Virustotal analysis tracker module."""
+import threading
+import time
+
+from pycti import OpenCTIConnectorHelper
+
+from .client import VirusTotalClient
+
+
+class AnalysisTracker:
+    """
+    Uploads waiting for their VirusTotal analysis.
+
+    Instead of blocking an enrichment until VirusTotal analyzed an upload, the
+    analysis is parked here and its status is checked in the background. Once
+    the analysis is completed, the enrichment of the observable is asked again
+    to OpenCTI and finds the VirusTotal report. Parked analyses are kept in the
+    connector state to survive a restart.
+    """
+
+    _STATE_KEY = "pending_analyses"
+
+    def __init__(
+        self, helper: OpenCTIConnectorHelper, client: VirusTotalClient
+    ) -> None:
+        """Initialize the tracker."""
+        self.helper = helper
+        self.client = client
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        # Entity id -> analysis id, upload type and name, attempts, next check
+        state = self.helper.get_state() or {}
+        self.pending = state.get(self._STATE_KEY, {})
+        # Entities whose enrichment was asked again after their analysis
+        self.resumed = set()
+
+    def park(self, entity_id, upload_type, name, analysis_id) -> None:
+        """
+        Track the analysis of an upload.
+
+        Parameters
+        ----------
+        entity_id : str
+            Id of the uploaded observable in OpenCTI.
+        upload_type : str
+            The type of the upload (artifact || URL)
+        name : str
+            The name of the upload
+        analysis_id : str
+            The ID returned by VirusTotal for the analysis job of the upload
+        """
+        with self.lock:
+            self.pending[entity_id] = {
+                "analysis_id": analysis_id,
+                "upload_type": upload_type,
+                "name": name,
+                "attempts": 0,
+                "next_check": time.time()
+                + self.client.analysis_retry_delay(upload_type, 0),
+            }
+            self._save()
+        self.helper.log_info(
+            f"[VirusTotal] Uploaded {upload_type} {name} parked until its analysis completes"
+        )
+
+    def pop_resumed(self, entity_id) -> bool:
+        """
+        Check whether an enrichment was asked by the tracker.
+
+        Parameters
+        ----------
+        entity_id : str
+            Id of the observable in OpenCTI.
+
+        Returns
+        -------
+        bool
+            True if the analysis of this observable completed.
+        """
+        with self.lock:
+            if entity_id in self.resumed:
+                self.resumed.discard(entity_id)
+                return True
+            return False
+
+    def start(self) -> None:
+        """Start checking the parked analyses in the background."""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop checking the parked analyses."""
+        self.stop_event.set()
+
+    def _run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                self.check()
+            except Exception as err:
+                self.helper.log_error(f"[VirusTotal] Error checking analyses: {err}")
+            self.stop_event.wait(1)
+
+    def check(self) -> None:
+        """Check the status of the analyses which are due."""
+        with self.lock:
+            now = time.time()
+            due = [
+                (entity_id, dict(analysis))
+                for entity_id, analysis in self.pending.items()
+                if analysis["next_check"] <= now
+            ]
+
+        for entity_id, analysis in due:
+            # Requests go through the client limiter shared with the enrichments
+            try:
+                status = self.client.get_analysis_status(analysis["analysis_id"])
+            except Exception as err:
+                self.helper.log_error(
+                    f"[VirusTotal] Error checking the analysis of {analysis['name']}: {err}"
+                )
+                status = None
+            attempts = analysis["attempts"] + 1
+            if status == "completed":
+                self.helper.log_info(
+                    f"[VirusTotal] Analysis of {analysis['upload_type']} "
+                    f"{analysis['name']} completed, asking for its enrichment"
+                )
+                with self.lock:
+                    self.pending.pop(entity_id, None)
+                    self.resumed.add(entity_id)
+                    self._save()
+                self.helper.api.stix_cyber_observable.ask_for_enrichment(
+                    id=entity_id, connector_id=self.helper.connect_id
+                )
+            elif attempts >= self.client.ANALYSIS_ATTEMPTS:
+                self.helper.log_error(
+                    f"The uploaded {analysis['upload_type']} {analysis['name']} was "
+                    f"not analyzed by VirusTotal before the timeout was reached. Please "
+                    f"try enriching the {analysis['upload_type']} again at a later time."
+                )
+                with self.lock:
+                    self.pending.pop(entity_id, None)
+                    self._save()
+            else:
+                with self.lock:
+                    if entity_id in self.pending:
+                        self.pending[entity_id]["attempts"] = attempts
+                        self.pending[entity_id][
+                            "next_check"
+                        ] = time.time() + self.client.analysis_retry_delay(
+                            analysis["upload_type"], attempts
+                        )
+                        self._save()
+
+    def _save(self) -> None:
+        state = self.helper.get_state() or {}
+        state[self._STATE_KEY] = self.pending
+        self.helper.set_state(state)
@@ -8,8 +8,10 @@ import yaml
 from pycti import Identity, OpenCTIConnectorHelper, get_config_variable
 
 from .builder import VirusTotalBuilder
+from .cache import TTLCache
 from .client import VirusTotalClient
 from .indicator_config import IndicatorConfig
+from .tracker import AnalysisTracker
 
 
 class VirusTotalConnector:
@@ -44,10 +46,46 @@ class VirusTotalConnector:
             confidence=self.helper.connect_confidence_level,
         )
 
-        self.client = VirusTotalClient(self.helper, self._API_URL, token)
+        self.client = VirusTotalClient(
+            self.helper,
+            self._API_URL,
+            token,
+            get_config_variable(
+                "VIRUSTOTAL_REQUESTS_PER_MINUTE",
+                ["virustotal", "requests_per_minute"],
+                config,
+                isNumber=True,
+                default=0,
+            ),
+        )
 
         # Cache to store YARA rulesets.
-        self.yara_cache = {}
+        self.yara_cache = TTLCache(
+            get_config_variable(
+                "VIRUSTOTAL_YARA_CACHE_SIZE",
+                ["virustotal", "yara_cache_size"],
+                config,
+                isNumber=True,
+                default=1000,
+            ),
+            get_config_variable(
+                "VIRUSTOTAL_YARA_CACHE_TTL",
+                ["virustotal", "yara_cache_ttl"],
+                config,
+                isNumber=True,
+                default=86400,
+            ),
+        )
+
+        # Park the uploads instead of waiting for their analysis.
+        self.tracker = None
+        if get_config_variable(
+            "VIRUSTOTAL_ASYNC_ANALYSIS",
+            ["virustotal", "async_analysis"],
+            config,
+            default=False,
+        ):
+            self.tracker = AnalysisTracker(self.helper, self.client)
 
         # File/Artifact specific settings
         self.file_create_note_full_report = get_config_variable(
@@ -119,16 +157,42 @@ class VirusTotalConnector:
             YARA ruleset object.
         """
         self.helper.log_debug(f"[VirusTotal] Retrieving ruleset {ruleset_id}")
-        if ruleset_id in self.yara_cache:
+        ruleset = self.yara_cache.get(ruleset_id)
+        if ruleset is not None:
             self.helper.log_debug(f"Retrieving YARA ruleset {ruleset_id} from cache.")
-            ruleset = self.yara_cache[ruleset_id]
         else:
             self.helper.log_debug(f"Retrieving YARA ruleset {ruleset_id} from API.")
             ruleset = self.client.get_yara_ruleset(ruleset_id)
-            self.yara_cache[ruleset_id] = ruleset
+            self.yara_cache.set(ruleset_id, ruleset)
         return ruleset
 
+    def _park_analysis(self, upload_type, name, analysis_id, opencti_entity):
+        """
+        Park an upload until VirusTotal analyzed it, if enabled.
+
+        Playbooks need the result of the enrichment, they keep waiting.
+
+        Returns
+        -------
+        str or None
+            Message of the enrichment, None if the analysis must be awaited.
+        """
+        if self.tracker is None or self.helper.playbook is not None:
+            return None
+        self.tracker.park(opencti_entity["id"], upload_type, name, analysis_id)
+        self.helper.metric.state("idle")
+        return (
+            f"The uploaded {upload_type} {name} is being analyzed by VirusTotal, "
+            f"it will be enriched again once the analysis completes"
+        )
+
+    def _analysis_resumed(self, opencti_entity) -> bool:
+        return self.tracker is not None and self.tracker.pop_resumed(
+            opencti_entity["id"]
+        )
+
     def _process_file(self, stix_objects, stix_entity, opencti_entity):
+        resumed = self._analysis_resumed(opencti_entity)
         json_data = self.client.get_file_info(self.resolve_default_value(stix_entity))
         assert json_data
         if (
@@ -136,6 +200,7 @@ class VirusTotalConnector:
             and json_data["error"]["code"] == "NotFoundError"
             and self.file_upload_unseen_artifacts
             and opencti_entity["entity_type"] == "Artifact"
+            and not resumed
         ):
             message = f"The file {self.resolve_default_value(stix_entity)} was not found in VirusTotal repositories. Beginning upload and analysis"
             self.helper.api.work.to_received(self.helper.work_id, message)
@@ -165,6 +230,14 @@ class VirusTotalConnector:
                 raise ValueError(
                     "[VirusTotal] Error uploading artifact to VirusTotal"
                 ) from err
+            message = self._park_analysis(
+                "artifact",
+                self.resolve_default_value(stix_entity),
+                analysis_id,
+                opencti_entity,
+            )
+            if message is not None:
+                return message
             try:
                 self.client.check_upload_status(
                     "artifact", self.resolve_default_value(stix_entity), analysis_id
@@ -350,12 +423,14 @@ class VirusTotalConnector:
         return builder.send_bundle()
 
     def _process_url(self, stix_objects, stix_entity, opencti_entity):
+        resumed = self._analysis_resumed(opencti_entity)
         json_data = self.client.get_url_info(opencti_entity["observable_value"])
         assert json_data
         if (
             "error" in json_data
             and json_data["error"]["code"] == "NotFoundError"
             and self.url_upload_unseen
+            and not resumed
         ):
             message = f"The URL {opencti_entity['observable_value']} was not found in VirusTotal repositories. Beginning upload and analysis"
             self.helper.api.work.to_received(self.helper.work_id, message)
@@ -366,6 +441,11 @@ class VirusTotalConnector:
                 raise ValueError(
                     "[VirusTotal] Error uploading URL to VirusTotal"
                 ) from err
+            message = self._park_analysis(
+                "URL", opencti_entity["observable_value"], analysis_id, opencti_entity
+            )
+            if message is not None:
+                return message
             try:
                 self.client.check_upload_status(
                     "URL", opencti_entity["observable_value"], analysis_id
@@ -438,4 +518,6 @@ class VirusTotalConnector:
     def start(self):
         """Start the main loop."""
         self.helper.metric.state("idle")
+        if self.tracker is not None:
+            self.tracker.start()
         self.helper.listen(message_callback=self._process_message)
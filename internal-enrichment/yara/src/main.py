@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 import time
@@ -12,6 +13,218 @@ from pycti import (
 )
 from stix2 import TLP_WHITE, Bundle, Relationship
 
+YARA_INDICATOR_FILTER = {"key": "pattern_type", "values": ["yara"]}
+
+
+class YaraRuleset:
+    """
+    Single compiled ruleset holding every YARA Indicator, one namespace per
+    indicator id
+
+    The indicators are listed once, later refreshes only fetch the indicators
+    updated since the most recent `updated_at` seen and the ruleset is only
+    compiled again when a rule changed. Deleted indicators cannot be detected
+    that way, everything is listed again every `full_refresh_interval` seconds.
+    The compiled rules can be saved with `yara.save` to be loaded on restart.
+    """
+
+    def __init__(
+        self,
+        helper: OpenCTIConnectorHelper,
+        full_refresh_interval: int,
+        ruleset_path: str = None,
+    ):
+        self.helper = helper
+        self.full_refresh_interval = full_refresh_interval
+        self.ruleset_path = ruleset_path
+
+        # Indicator id -> id, name, standard_id, pattern
+        self.indicators = {}
+        # Ids of the indicators whose rule does not compile
+        self.invalid = set()
+        self.rules = None
+        self.cursor = None
+        self.last_full_refresh = None
+
+        if self.ruleset_path is not None and os.path.isfile(self.ruleset_path):
+            self._load()
+
+    def get_rules(self):
+        """
+        Refreshes the indicators and returns the compiled ruleset.
+
+        :return: Compiled rules, None if there is no valid YARA Indicator.
+        """
+        full = (
+            self.last_full_refresh is None
+            or time.time() - self.last_full_refresh >= self.full_refresh_interval
+        )
+        started_at = time.time()
+        if full:
+            changed = self._refresh_full(self._list_indicators(None))
+            self.last_full_refresh = started_at
+        else:
+            changed = self._refresh(self._list_indicators(self.cursor))
+
+        if changed:
+            self._compile()
+            if self.ruleset_path is not None:
+                self._save()
+        elif full and self.ruleset_path is not None:
+            self._save_metadata()
+        return self.rules
+
+    def get_indicator(self, indicator_id: str) -> dict:
+        return self.indicators.get(indicator_id)
+
+    def _list_indicators(self, cursor: str) -> list:
+        self.helper.log_debug("Getting YARA Indicators in OpenCTI")
+
+        filters = [YARA_INDICATOR_FILTER]
+        if cursor is not None:
+            filters.append({"key": "updated_at", "values": [cursor], "operator": "gte"})
+
+        indicators = []
+        data = {"pagination": {"hasNextPage": True, "endCursor": None}}
+        customAttributes = """
+        id
+        name
+        standard_id
+        pattern
+        pattern_type
+        updated_at
+        """
+        while data["pagination"]["hasNextPage"]:
+            after = data["pagination"]["endCursor"]
+            data = self.helper.api.indicator.list(
+                first=1000,
+                after=after,
+                filters={
+                    "mode": "and",
+                    "filters": filters,
+                    "filterGroups": [],
+                },
+                orderBy="created_at",
+                orderMode="asc",
+                withPagination=True,
+                customAttributes=customAttributes,
+            )
+            indicators.extend(data["entities"])
+        return indicators
+
+    def _refresh_full(self, indicators: list) -> bool:
+        previous = self.indicators
+        self.indicators = {}
+        self.cursor = None
+        changed = self._refresh(indicators, previous)
+        # Deleted indicators
+        removed = previous.keys() - self.indicators.keys()
+        self.invalid -= removed
+        return changed or len(removed) > 0
+
+    def _refresh(self, indicators: list, previous: dict = None) -> bool:
+        if previous is None:
+            previous = self.indicators
+
+        changed = False
+        for indicator in indicators:
+            updated_at = indicator.get("updated_at")
+            if updated_at is not None and (
+                self.cursor is None or updated_at > self.cursor
+            ):
+                self.cursor = updated_at
+
+            item = {
+                "id": indicator["id"],
+                "name": indicator["name"],
+                "standard_id": indicator["standard_id"],
+                "pattern": indicator["pattern"],
+            }
+            known = previous.get(item["id"])
+            self.indicators[item["id"]] = item
+            if known is not None and known["pattern"] == item["pattern"]:
+                continue
+
+            # Rules are checked one by one so that one bad rule does not fail the ruleset
+            changed = True
+            try:
+                yara.compile(source=item["pattern"])
+                self.invalid.discard(item["id"])
+            except yara.Error:
+                self.helper.log_error(f"Encountered YARA syntax error {item['name']}")
+                self.invalid.add(item["id"])
+        return changed
+
+    def _compile(self) -> None:
+        sources = {
+            indicator_id: indicator["pattern"]
+            for indicator_id, indicator in self.indicators.items()
+            if indicator_id not in self.invalid
+        }
+        if len(sources) == 0:
+            self.rules = None
+            return
+
+        self.helper.log_info(f"Compiling {len(sources)} YARA rules")
+        try:
+            self.rules = yara.compile(sources=sources)
+        except yara.Error as e:
+            # Keep the previous ruleset
+            self.helper.log_error(f"Unable to compile the YARA ruleset: {e}")
+
+    def _metadata_path(self) -> str:
+        return self.ruleset_path + ".json"
+
+    def _save(self) -> None:
+        try:
+            if self.rules is None:
+                if os.path.isfile(self.ruleset_path):
+                    os.remove(self.ruleset_path)
+            else:
+                temporary_path = self.ruleset_path + ".tmp"
+                self.rules.save(temporary_path)
+                os.replace(temporary_path, self.ruleset_path)
+        except (OSError, yara.Error) as e:
+            self.helper.log_warning(f"Unable to save the YARA ruleset: {e}")
+            return
+        self._save_metadata()
+
+    def _save_metadata(self) -> None:
+        metadata = {
+            "last_full_refresh": self.last_full_refresh,
+            "cursor": self.cursor,
+            "invalid": sorted(self.invalid),
+            "indicators": list(self.indicators.values()),
+        }
+        temporary_path = self._metadata_path() + ".tmp"
+        try:
+            with open(temporary_path, "w") as f:
+                json.dump(metadata, f)
+            os.replace(temporary_path, self._metadata_path())
+        except OSError as e:
+            self.helper.log_warning(f"Unable to save the YARA ruleset: {e}")
+
+    def _load(self) -> None:
+        try:
+            with open(self._metadata_path(), "r") as f:
+                metadata = json.load(f)
+            rules = yara.load(self.ruleset_path)
+        except (OSError, ValueError, yara.Error) as e:
+            self.helper.log_warning(f"Unable to load the YARA ruleset: {e}")
+            return
+
+        self.rules = rules
+        self.last_full_refresh = metadata["last_full_refresh"]
+        self.cursor = metadata["cursor"]
+        self.invalid = set(metadata["invalid"])
+        self.indicators = {
+            indicator["id"]: indicator for indicator in metadata["indicators"]
+        }
+        self.helper.log_info(
+            f"YARA ruleset loaded from {self.ruleset_path} with "
+            f"{len(self.indicators)} indicators"
+        )
+
 
 class YaraConnector:
     def __init__(self):
@@ -28,6 +241,17 @@ class YaraConnector:
         self.octi_api_url = get_config_variable(
             "OPENCTI_URL", ["opencti", "url"], config
         )
+        self.ruleset = YaraRuleset(
+            self.helper,
+            get_config_variable(
+                "YARA_FULL_REFRESH",
+                ["yara", "full_refresh"],
+                config,
+                isNumber=True,
+                default=3600,
+            ),
+            get_config_variable("YARA_RULESET_PATH", ["yara", "ruleset_path"], config),
+        )
 
     def _get_artifact_contents(self, artifact) -> list[bytes]:
         """
@@ -58,69 +282,37 @@ class YaraConnector:
             self.helper.log_debug("No associated files found in Artifact")
         return files_contents
 
-    def _get_yara_indicators(self) -> list:
-        self.helper.log_debug("Getting all YARA Indicators in OpenCTI")
-
-        data = {"pagination": {"hasNextPage": True, "endCursor": None}}
-        customAttributes = """
-        id
-        name
-        standard_id
-        pattern
-        pattern_type
-        """
-        while data["pagination"]["hasNextPage"]:
-            after = data["pagination"]["endCursor"]
-            data = self.helper.api.indicator.list(
-                first=1000,
-                after=after,
-                filters={
-                    "mode": "and",
-                    "filters": [{"key": "pattern_type", "values": ["yara"]}],
-                    "filterGroups": [],
-                },
-                orderBy="created_at",
-                orderMode="asc",
-                withPagination=True,
-                customAttributes=customAttributes,
-            )
-        return data["entities"]
-
-    def _scan_artifact(self, artifact, yara_indicators) -> None:
+    def _scan_artifact(self, artifact, rules) -> None:
         self.helper.log_debug("Scanning Artifact contents with YARA")
 
         artifact_contents = self._get_artifact_contents(artifact)
 
         bundle_objects = []
+        matched_indicators = set()
         for artifact_content in artifact_contents:
-            for indicator in yara_indicators:
-                try:
-                    rule_content = indicator["pattern"]
-                    rule = yara.compile(source=rule_content)
-                except yara.SyntaxError:
-                    self.helper.log_error(
-                        f"Encountered YARA syntax error {indicator['name']}"
-                    )
+            # The namespace of every rule is the id of its indicator
+            for result in rules.match(data=artifact_content, timeout=60):
+                indicator = self.ruleset.get_indicator(result.namespace)
+                if indicator is None or indicator["id"] in matched_indicators:
                     continue
+                matched_indicators.add(indicator["id"])
 
-                results = rule.match(data=artifact_content, timeout=60)
-                if results:
-                    relationship = Relationship(
-                        id=StixCoreRelationship.generate_id(
-                            "related-to",
-                            artifact["standard_id"],
-                            indicator["standard_id"],
-                        ),
-                        relationship_type="related-to",
-                        object_marking_refs=[TLP_WHITE],
-                        source_ref=artifact["standard_id"],
-                        target_ref=indicator["standard_id"],
-                        description="YARA rule matched for this Artifact",
-                    )
-                    bundle_objects.append(relationship)
-                    self.helper.log_debug(
-                        f"Created Relationship from Artifact to YARA Indicator {indicator['name']}"
-                    )
+                relationship = Relationship(
+                    id=StixCoreRelationship.generate_id(
+                        "related-to",
+                        artifact["standard_id"],
+                        indicator["standard_id"],
+                    ),
+                    relationship_type="related-to",
+                    object_marking_refs=[TLP_WHITE],
+                    source_ref=artifact["standard_id"],
+                    target_ref=indicator["standard_id"],
+                    description="YARA rule matched for this Artifact",
+                )
+                bundle_objects.append(relationship)
+                self.helper.log_debug(
+                    f"Created Relationship from Artifact to YARA Indicator {indicator['name']}"
+                )
 
         if any(bundle_objects):
             bundle = Bundle(objects=bundle_objects).serialize()
@@ -132,11 +324,11 @@ class YaraConnector:
         artifact = data["enrichment_entity"]
 
         response = "Done"
-        yara_indicators = self._get_yara_indicators()
-        if any(yara_indicators):
-            rule_count = len(yara_indicators)
+        rules = self.ruleset.get_rules()
+        if rules is not None:
+            rule_count = len(self.ruleset.indicators) - len(self.ruleset.invalid)
             self.helper.log_debug(f"Scanning an Artifact with {rule_count} rules")
-            self._scan_artifact(artifact, yara_indicators)
+            self._scan_artifact(artifact, rules)
         else:
             self.helper.log_debug("No YARA Indicators to match")
             response = "No YARA Indicators to match"
@@ -1,12 +1,35 @@
 import csv
 import io
+import itertools
 import json
 import os
 import sys
+import tempfile
 import time
+from types import SimpleNamespace
 
 import yaml
-from pycti import OpenCTIConnectorHelper, get_config_variable
+from pycti import OpenCTIConnectorHelper, OpenCTIStix2, get_config_variable
+
+# Number of entities fetched per request in streaming mode
+PAGE_SIZE = 500
+# Size above which the exported file is written to disk instead of memory
+SPOOL_MAX_SIZE = 10 * 1024 * 1024
+
+
+class _ListerResolver:
+    """
+    OpenCTI client given to OpenCTIStix2, so that export_entities_list returns
+    the lister it selects for an entity type instead of calling it
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.app_logger = api.app_logger
+
+    def __getattr__(self, name):
+        entity_api = getattr(self.api, name)
+        return SimpleNamespace(list=lambda **kwargs: entity_api.list)
 
 
 class ExportFileCsv:
@@ -26,10 +49,73 @@ class ExportFileCsv:
             False,
             ";",
         )
+        self.export_file_csv_streaming = get_config_variable(
+            "EXPORT_FILE_CSV_STREAMING",
+            ["export-file-csv", "streaming"],
+            config,
+            False,
+            False,
+        )
 
-    def export_dict_list_to_csv(self, data):
-        output = io.StringIO()
-        headers = sorted(set().union(*(d.keys() for d in data)))
+    def _list_pages(self, do_list, pagination_key="withPagination", **kwargs):
+        """
+        Iterate over the entities of a list query, one page at a time
+        :return: Generator of entity lists
+        """
+        after = None
+        while True:
+            result = do_list(
+                first=PAGE_SIZE, after=after, **{pagination_key: True}, **kwargs
+            )
+            yield result["entities"]
+            if not result["pagination"]["hasNextPage"]:
+                break
+            after = result["pagination"]["endCursor"]
+
+    def _list_selection_pages(self, filters):
+        """
+        Paginated version of the selected entities listing
+        :return: Generator of entity lists
+        """
+        # This lister reads with_pagination instead of withPagination
+        return self._list_pages(
+            self.helper.api_impersonate.opencti_stix_object_or_stix_relationship.list,
+            pagination_key="with_pagination",
+            filters=filters,
+        )
+
+    def _list_query_pages(
+        self, entity_type, search, filters, order_by, order_mode, with_files=False
+    ):
+        """
+        Paginated version of stix2.export_entities_list. The lister of the
+        entity type is the one export_entities_list selects, the default
+        ordering is the one it applies when listing all the entities
+        :return: Generator of entity lists, None for an unknown entity type
+        """
+        do_list = OpenCTIStix2(
+            _ListerResolver(self.helper.api_impersonate)
+        ).export_entities_list(entity_type, getAll=False)
+        if do_list is None:
+            return None
+
+        if order_by is None or order_by == "_score":
+            order_by = "created_at"
+            if order_mode is None:
+                order_mode = "desc"
+
+        return self._list_pages(
+            do_list,
+            search=search,
+            filters=filters,
+            orderBy=order_by,
+            orderMode=order_mode,
+            withFiles=with_files,
+        )
+
+    @staticmethod
+    def _csv_headers(keys):
+        headers = sorted(keys)
         if "hashes" in headers:
             headers = headers + [
                 "hashes.MD5",
@@ -38,55 +124,14 @@ class ExportFileCsv:
                 "hashes_SHA-512",
                 "hashes_SSDEEP",
             ]
+        return headers
+
+    def export_dict_list_to_csv(self, data):
+        output = io.StringIO()
+        headers = self._csv_headers(set().union(*(d.keys() for d in data)))
         csv_data = [headers]
         for d in data:
-            row = []
-            for h in headers:
-                if h.startswith("hashes_") and "hashes" in d:
-                    hashes = {}
-                    for hash in d["hashes"]:
-                        hashes[hash["algorithm"]] = hash["hash"]
-                    if h.split("_")[1] in hashes:
-                        row.append(hashes[h.split("_")[1]])
-                    else:
-                        row.append("")
-                elif h not in d:
-                    row.append("")
-                elif isinstance(d[h], str):
-                    row.append(d[h])
-                elif isinstance(d[h], int):
-                    row.append(str(d[h]))
-                elif isinstance(d[h], float):
-                    row.append(str(d[h]))
-                elif isinstance(d[h], list):
-                    if len(d[h]) > 0 and isinstance(d[h][0], str):
-                        row.append(",".join(d[h]))
-                    elif len(d[h]) > 0 and isinstance(d[h][0], dict):
-                        rrow = []
-                        for r in d[h]:
-                            if "name" in r:
-                                rrow.append(r["name"])
-                            elif "definition" in r:
-                                rrow.append(r["definition"])
-                            elif "value" in r:
-                                rrow.append(r["value"])
-                            elif "observable_value" in r:
-                                rrow.append(r["observable_value"])
-                        row.append(",".join(rrow))
-                    else:
-                        row.append("")
-                elif isinstance(d[h], dict):
-                    if "name" in d[h]:
-                        row.append(d[h]["name"])
-                    elif "value" in d[h]:
-                        row.append(d[h]["value"])
-                    elif "observable_value" in d[h]:
-                        row.append(d[h]["observable_value"])
-                    else:
-                        row.append("")
-                else:
-                    row.append("")
-            csv_data.append(row)
+            csv_data.append(self._csv_row(headers, d))
         writer = csv.writer(
             output,
             delimiter=self.export_file_csv_delimiter,
@@ -96,13 +141,102 @@ class ExportFileCsv:
         writer.writerows(csv_data)
         return output.getvalue()
 
+    def export_dict_iterator_to_csv(self, data):
+        """
+        Write the entities to a CSV file without holding them in memory. The
+        entities are spooled to disk as JSON lines while the headers are
+        collected, then converted to rows.
+        :return: CSV file, positioned at its start
+        """
+        keys = set()
+        output = tempfile.SpooledTemporaryFile(
+            max_size=SPOOL_MAX_SIZE, mode="w+", newline="", encoding="utf-8"
+        )
+        with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as entities_file:
+            for d in data:
+                keys.update(d.keys())
+                entities_file.write(json.dumps(d) + "\n")
+            headers = self._csv_headers(keys)
+            writer = csv.writer(
+                output,
+                delimiter=self.export_file_csv_delimiter,
+                quotechar='"',
+                quoting=csv.QUOTE_ALL,
+            )
+            writer.writerow(headers)
+            entities_file.seek(0)
+            for line in entities_file:
+                writer.writerow(self._csv_row(headers, json.loads(line)))
+        output.seek(0)
+        return output
+
+    @staticmethod
+    def _csv_row(headers, d):
+        row = []
+        for h in headers:
+            if h.startswith("hashes_") and "hashes" in d:
+                hashes = {}
+                for hash in d["hashes"]:
+                    hashes[hash["algorithm"]] = hash["hash"]
+                if h.split("_")[1] in hashes:
+                    row.append(hashes[h.split("_")[1]])
+                else:
+                    row.append("")
+            elif h not in d:
+                row.append("")
+            elif isinstance(d[h], str):
+                row.append(d[h])
+            elif isinstance(d[h], int):
+                row.append(str(d[h]))
+            elif isinstance(d[h], float):
+                row.append(str(d[h]))
+            elif isinstance(d[h], list):
+                if len(d[h]) > 0 and isinstance(d[h][0], str):
+                    row.append(",".join(d[h]))
+                elif len(d[h]) > 0 and isinstance(d[h][0], dict):
+                    rrow = []
+                    for r in d[h]:
+                        if "name" in r:
+                            rrow.append(r["name"])
+                        elif "definition" in r:
+                            rrow.append(r["definition"])
+                        elif "value" in r:
+                            rrow.append(r["value"])
+                        elif "observable_value" in r:
+                            rrow.append(r["observable_value"])
+                    row.append(",".join(rrow))
+                else:
+                    row.append("")
+            elif isinstance(d[h], dict):
+                if "name" in d[h]:
+                    row.append(d[h]["name"])
+                elif "value" in d[h]:
+                    row.append(d[h]["value"])
+                elif "observable_value" in d[h]:
+                    row.append(d[h]["observable_value"])
+                else:
+                    row.append("")
+            else:
+                row.append("")
+        return row
+
     def _export_list(self, data, entities_list, list_filters):
+        if self.export_file_csv_streaming:
+            csv_data = self.export_dict_iterator_to_csv(entities_list)
+        else:
+            csv_data = self.export_dict_list_to_csv(entities_list)
+        try:
+            self._push_list_export(data, csv_data, list_filters)
+        finally:
+            if self.export_file_csv_streaming:
+                csv_data.close()
+
+    def _push_list_export(self, data, csv_data, list_filters):
         file_name = data["file_name"]
         export_type = data["export_type"]
         file_markings = data["file_markings"]
         entity_id = data.get("entity_id")
         entity_type = data["entity_type"]
-        csv_data = self.export_dict_list_to_csv(entities_list)
         self.helper.log_info(
             "Uploading: " + entity_type + "/" + export_type + " to " + file_name
         )
@@ -246,9 +380,14 @@ class ExportFileCsv:
         # = Only simple
         if export_scope == "selection":
             list_filters = "selected_ids"
-            entities_list = self.helper.api_impersonate.opencti_stix_object_or_stix_relationship.list(
-                filters=main_filter, getAll=True
-            )
+            if self.export_file_csv_streaming:
+                entities_list = itertools.chain.from_iterable(
+                    self._list_selection_pages(main_filter)
+                )
+            else:
+                entities_list = self.helper.api_impersonate.opencti_stix_object_or_stix_relationship.list(
+                    filters=main_filter, getAll=True
+                )
             self._export_list(data, entities_list, list_filters)
 
         # Query export without object_refs/relationships
@@ -276,14 +415,28 @@ class ExportFileCsv:
                 "filters": [],
             }
 
-            entities_list = self.helper.api_impersonate.stix2.export_entities_list(
-                entity_type=entity_type,
-                search=list_params.get("search"),
-                filters=export_query_filter,
-                orderBy=list_params.get("orderBy"),
-                orderMode=list_params.get("orderMode"),
-                getAll=True,
+            pages = (
+                self._list_query_pages(
+                    entity_type,
+                    list_params.get("search"),
+                    export_query_filter,
+                    list_params.get("orderBy"),
+                    list_params.get("orderMode"),
+                )
+                if self.export_file_csv_streaming
+                else None
             )
+            if pages is not None:
+                entities_list = itertools.chain.from_iterable(pages)
+            else:
+                entities_list = self.helper.api_impersonate.stix2.export_entities_list(
+                    entity_type=entity_type,
+                    search=list_params.get("search"),
+                    filters=export_query_filter,
+                    orderBy=list_params.get("orderBy"),
+                    orderMode=list_params.get("orderMode"),
+                    getAll=True,
+                )
             list_filters = json.dumps(list_params)
             self._export_list(data, entities_list, list_filters)
 
@@ -1,10 +1,33 @@
 import json
 import os
 import sys
+import tempfile
 import time
+from types import SimpleNamespace
+import uuid
 
 import yaml
-from pycti import OpenCTIConnectorHelper
+from pycti import OpenCTIConnectorHelper, OpenCTIStix2, get_config_variable
+
+# Number of entities fetched per request in streaming mode
+PAGE_SIZE = 500
+# Size above which the exported file is written to disk instead of memory
+SPOOL_MAX_SIZE = 10 * 1024 * 1024
+
+
+class _ListerResolver:
+    """
+    OpenCTI client given to OpenCTIStix2, so that export_entities_list returns
+    the lister it selects for an entity type instead of calling it
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.app_logger = api.app_logger
+
+    def __getattr__(self, name):
+        entity_api = getattr(self.api, name)
+        return SimpleNamespace(list=lambda **kwargs: entity_api.list)
 
 
 class ExportFileStix:
@@ -17,14 +40,129 @@ class ExportFileStix:
             else {}
         )
         self.helper = OpenCTIConnectorHelper(config)
+        self.export_file_stix_streaming = get_config_variable(
+            "EXPORT_FILE_STIX_STREAMING",
+            ["export-file-stix", "streaming"],
+            config,
+            False,
+            False,
+        )
+
+    def _list_pages(self, do_list, pagination_key="withPagination", **kwargs):
+        """
+        Iterate over the entities of a list query, one page at a time
+        :return: Generator of entity lists
+        """
+        after = None
+        while True:
+            result = do_list(
+                first=PAGE_SIZE, after=after, **{pagination_key: True}, **kwargs
+            )
+            yield result["entities"]
+            if not result["pagination"]["hasNextPage"]:
+                break
+            after = result["pagination"]["endCursor"]
+
+    def _list_selection_pages(self, filters):
+        """
+        Paginated version of the selected entities listing
+        :return: Generator of entity lists
+        """
+        # This lister reads with_pagination instead of withPagination
+        return self._list_pages(
+            self.helper.api_impersonate.opencti_stix_object_or_stix_relationship.list,
+            pagination_key="with_pagination",
+            filters=filters,
+        )
+
+    def _list_query_pages(
+        self, entity_type, search, filters, order_by, order_mode, with_files=False
+    ):
+        """
+        Paginated version of stix2.export_entities_list. The lister of the
+        entity type is the one export_entities_list selects, the default
+        ordering is the one it applies when listing all the entities
+        :return: Generator of entity lists, None for an unknown entity type
+        """
+        do_list = OpenCTIStix2(
+            _ListerResolver(self.helper.api_impersonate)
+        ).export_entities_list(entity_type, getAll=False)
+        if do_list is None:
+            return None
+
+        if order_by is None or order_by == "_score":
+            order_by = "created_at"
+            if order_mode is None:
+                order_mode = "desc"
+
+        return self._list_pages(
+            do_list,
+            search=search,
+            filters=filters,
+            orderBy=order_by,
+            orderMode=order_mode,
+            withFiles=with_files,
+        )
+
+    def _export_pages_to_bundle(self, pages, export_type, access_filter):
+        """
+        Export each page of entities and append its objects to a bundle written
+        in a temporary file, skipping the objects already exported by a
+        previous page.
+        :return: Bundle file, positioned at its start
+        """
+        output = tempfile.SpooledTemporaryFile(
+            max_size=SPOOL_MAX_SIZE, mode="w+", encoding="utf-8"
+        )
+        output.write(
+            '{\n    "type": "bundle",\n    "id": "bundle--'
+            + str(uuid.uuid4())
+            + '",\n    "objects": ['
+        )
+        uuids = set()
+        for entities_list in pages:
+            bundle = self.helper.api_impersonate.stix2.export_selected(
+                entities_list, export_type, access_filter
+            )
+            for stix_object in bundle["objects"]:
+                if stix_object["id"] in uuids:
+                    continue
+                output.write(",\n" if len(uuids) > 0 else "\n")
+                output.write(json.dumps(stix_object, indent=4))
+                uuids.add(stix_object["id"])
+        output.write("\n    ]\n}")
+        output.seek(0)
+        return output
+
+    def _read_pages(self, pages, entity_type):
+        for stix_objects in pages:
+            entities_list = []
+            for stix_object_result in stix_objects:
+                if entity_type == "stix-core-relationship":
+                    current_entity_type = "stix-core-relationship"
+                else:
+                    current_entity_type = stix_object_result["entity_type"]
+                do_read = self.helper.api.stix2.get_reader(current_entity_type)
+                # Reader, we can safely read as max marking was handled by stix_object_or_stix_relationship.list
+                entities_list.append(do_read(id=stix_object_result["id"]))
+            yield entities_list
 
     def _export_list(self, data, bundle, list_filters):
+        if isinstance(bundle, dict):
+            self._push_list_export(data, json.dumps(bundle, indent=4), list_filters)
+            return
+        # Bundle file written in streaming mode
+        try:
+            self._push_list_export(data, bundle, list_filters)
+        finally:
+            bundle.close()
+
+    def _push_list_export(self, data, json_bundle, list_filters):
         entity_id = data.get("entity_id")
         entity_type = data["entity_type"]
         file_name = data["file_name"]
         export_type = data["export_type"]
         file_markings = data["file_markings"]
-        json_bundle = json.dumps(bundle, indent=4)
         self.helper.connector_logger.info(
             "Uploading",
             {
@@ -121,23 +259,19 @@ class ExportFileStix:
         # Selection must be uploaded in the list panel
         if export_scope == "selection":
             list_filters = "selected_ids"
-            entities_list = []
-            stix_objects = self.helper.api_impersonate.opencti_stix_object_or_stix_relationship.list(
-                filters=main_filter, getAll=True
-            )
-            for stix_object_result in stix_objects:
-                if entity_type == "stix-core-relationship":
-                    current_entity_type = "stix-core-relationship"
-                else:
-                    current_entity_type = stix_object_result["entity_type"]
-                do_read = self.helper.api.stix2.get_reader(current_entity_type)
-                # Reader, we can safely read as max marking was handled by stix_object_or_stix_relationship.list
-                entity_data = do_read(id=stix_object_result["id"])
-                entities_list.append(entity_data)
-
-            bundle = self.helper.api_impersonate.stix2.export_selected(
-                entities_list, export_type, access_filter
-            )
+            if self.export_file_stix_streaming:
+                pages = self._list_selection_pages(main_filter)
+                bundle = self._export_pages_to_bundle(
+                    self._read_pages(pages, entity_type), export_type, access_filter
+                )
+            else:
+                stix_objects = self.helper.api_impersonate.opencti_stix_object_or_stix_relationship.list(
+                    filters=main_filter, getAll=True
+                )
+                entities_list = next(self._read_pages([stix_objects], entity_type))
+                bundle = self.helper.api_impersonate.stix2.export_selected(
+                    entities_list, export_type, access_filter
+                )
             self._export_list(data, bundle, list_filters)
         # Selection must be uploaded in the list panel
         if export_scope == "query":
@@ -150,15 +284,35 @@ class ExportFileStix:
                     "file_name": file_name,
                 },
             )
-            bundle = self.helper.api_impersonate.stix2.export_list(
-                entity_type,
-                list_params.get("search"),
-                list_params.get("filters"),
-                list_params.get("orderBy"),
-                list_params.get("orderMode"),
-                export_type,
-                access_filter,  # To restrict markings
+            filter_groups = []
+            if list_params.get("filters") is not None:
+                filter_groups.append(list_params.get("filters"))
+            if access_filter is not None:
+                filter_groups.append(access_filter)
+            pages = (
+                self._list_query_pages(
+                    entity_type,
+                    list_params.get("search"),
+                    {"mode": "and", "filterGroups": filter_groups, "filters": []},
+                    list_params.get("orderBy"),
+                    list_params.get("orderMode"),
+                    with_files=(export_type == "full"),
+                )
+                if self.export_file_stix_streaming
+                else None
             )
+            if pages is not None:
+                bundle = self._export_pages_to_bundle(pages, export_type, access_filter)
+            else:
+                bundle = self.helper.api_impersonate.stix2.export_list(
+                    entity_type,
+                    list_params.get("search"),
+                    list_params.get("filters"),
+                    list_params.get("orderBy"),
+                    list_params.get("orderMode"),
+                    export_type,
+                    access_filter,  # To restrict markings
+                )
             list_filters = json.dumps(list_params)
             self._export_list(data, bundle, list_filters)
 
@@ -1,10 +1,33 @@
+import itertools
 import json
 import os
 import sys
+import tempfile
 import time
+from types import SimpleNamespace
 
 import yaml
-from pycti import OpenCTIConnectorHelper
+from pycti import OpenCTIConnectorHelper, OpenCTIStix2, get_config_variable
+
+# Number of entities fetched per request in streaming mode
+PAGE_SIZE = 500
+# Size above which the exported file is written to disk instead of memory
+SPOOL_MAX_SIZE = 10 * 1024 * 1024
+
+
+class _ListerResolver:
+    """
+    OpenCTI client given to OpenCTIStix2, so that export_entities_list returns
+    the lister it selects for an entity type instead of calling it
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.app_logger = api.app_logger
+
+    def __getattr__(self, name):
+        entity_api = getattr(self.api, name)
+        return SimpleNamespace(list=lambda **kwargs: entity_api.list)
 
 
 class ExportFileTxt:
@@ -17,6 +40,86 @@ class ExportFileTxt:
             else {}
         )
         self.helper = OpenCTIConnectorHelper(config)
+        self.export_file_txt_streaming = get_config_variable(
+            "EXPORT_FILE_TXT_STREAMING",
+            ["export-file-txt", "streaming"],
+            config,
+            False,
+            False,
+        )
+
+    def _list_pages(self, do_list, pagination_key="withPagination", **kwargs):
+        """
+        Iterate over the entities of a list query, one page at a time
+        :return: Generator of entity lists
+        """
+        after = None
+        while True:
+            result = do_list(
+                first=PAGE_SIZE, after=after, **{pagination_key: True}, **kwargs
+            )
+            yield result["entities"]
+            if not result["pagination"]["hasNextPage"]:
+                break
+            after = result["pagination"]["endCursor"]
+
+    def _list_selection_pages(self, filters):
+        """
+        Paginated version of the selected entities listing
+        :return: Generator of entity lists
+        """
+        # This lister reads with_pagination instead of withPagination
+        return self._list_pages(
+            self.helper.api_impersonate.opencti_stix_object_or_stix_relationship.list,
+            pagination_key="with_pagination",
+            filters=filters,
+        )
+
+    def _list_query_pages(
+        self, entity_type, search, filters, order_by, order_mode, with_files=False
+    ):
+        """
+        Paginated version of stix2.export_entities_list. The lister of the
+        entity type is the one export_entities_list selects, the default
+        ordering is the one it applies when listing all the entities
+        :return: Generator of entity lists, None for an unknown entity type
+        """
+        do_list = OpenCTIStix2(
+            _ListerResolver(self.helper.api_impersonate)
+        ).export_entities_list(entity_type, getAll=False)
+        if do_list is None:
+            return None
+
+        if order_by is None or order_by == "_score":
+            order_by = "created_at"
+            if order_mode is None:
+                order_mode = "desc"
+
+        return self._list_pages(
+            do_list,
+            search=search,
+            filters=filters,
+            orderBy=order_by,
+            orderMode=order_mode,
+            withFiles=with_files,
+        )
+
+    def _values_to_text(self, values):
+        """
+        Join the values with new lines, in a temporary file in streaming mode
+        :return: Text or text file positioned at its start
+        """
+        if not self.export_file_txt_streaming:
+            return "\n".join(values)
+        output = tempfile.SpooledTemporaryFile(
+            max_size=SPOOL_MAX_SIZE, mode="w+", encoding="utf-8"
+        )
+        for index, value in enumerate(values):
+            if index > 0:
+                output.write("\n")
+            output.write(value)
+        output.seek(0)
+        return output
 
     def _process_message(self, data):
         file_name = data["file_name"]
@@ -77,51 +180,57 @@ class ExportFileTxt:
                 else:
                     export_query_filter = access_filter
 
-                entities_list = self.helper.api_impersonate.stix2.export_entities_list(
-                    entity_type=entity_type,
-                    search=list_params.get("search"),
-                    filters=export_query_filter,
-                    orderBy=list_params.get("orderBy"),
-                    orderMode=list_params.get("orderMode"),
-                    getAll=True,
+                pages = (
+                    self._list_query_pages(
+                        entity_type,
+                        list_params.get("search"),
+                        export_query_filter,
+                        list_params.get("orderBy"),
+                        list_params.get("orderMode"),
+                    )
+                    if self.export_file_txt_streaming
+                    else None
                 )
+                if pages is not None:
+                    entities_list = itertools.chain.from_iterable(pages)
+                else:
+                    entities_list = (
+                        self.helper.api_impersonate.stix2.export_entities_list(
+                            entity_type=entity_type,
+                            search=list_params.get("search"),
+                            filters=export_query_filter,
+                            orderBy=list_params.get("orderBy"),
+                            orderMode=list_params.get("orderMode"),
+                            getAll=True,
+                        )
+                    )
                 self.helper.log_info("Uploading: " + entity_type + " to " + file_name)
                 list_filters = json.dumps(list_params)
 
             if entities_list is not None:
                 if entity_type == "Stix-Cyber-Observable":
-                    observable_values = [
+                    values = (
                         f["observable_value"]
                         for f in entities_list
                         if "observable_value" in f
-                    ]
-                    observable_values_bytes = "\n".join(observable_values)
-                    self.helper.api.stix_cyber_observable.push_list_export(
-                        entity_id,
-                        entity_type,
-                        file_name,
-                        file_markings,
-                        observable_values_bytes,
-                        list_filters,
                     )
-                elif entity_type == "Stix-Core-Object":
-                    entities_values = [f["name"] for f in entities_list if "name" in f]
-                    entities_values_bytes = "\n".join(entities_values)
-                    self.helper.api.stix_core_object.push_list_export(
-                        entity_id,
-                        entity_type,
-                        file_name,
-                        file_markings,
-                        entities_values_bytes,
-                        list_filters,
+                    push_list_export = (
+                        self.helper.api.stix_cyber_observable.push_list_export
                     )
+                elif entity_type == "Stix-Core-Object":
+                    values = (f["name"] for f in entities_list if "name" in f)
+                    push_list_export = self.helper.api.stix_core_object.push_list_export
                 else:
                     if entity_type == "Malware-Analysis":
-                        for entity in entities_list:
-                            entity["name"] = entity["result_name"]
-                    entities_values = [f["name"] for f in entities_list if "name" in f]
-                    entities_values_bytes = "\n".join(entities_values)
-                    self.helper.api.stix_domain_object.push_list_export(
+                        values = (f["result_name"] for f in entities_list)
+                    else:
+                        values = (f["name"] for f in entities_list if "name" in f)
+                    push_list_export = (
+                        self.helper.api.stix_domain_object.push_list_export
+                    )
+                entities_values_bytes = self._values_to_text(values)
+                try:
+                    push_list_export(
                         entity_id,
                         entity_type,
                         file_name,
@@ -129,6 +238,9 @@ class ExportFileTxt:
                         entities_values_bytes,
                         list_filters,
                     )
+                finally:
+                    if self.export_file_txt_streaming:
+                        entities_values_bytes.close()
                 self.helper.log_info("Export done: " + entity_type + " to " + file_name)
             else:
                 raise ValueError("An error occurred, the list is empty")
@@ -0,0 +1,130 @@
+"""
+Compare the regex and automaton entity matching on a synthetic corpus or on
+text files
+
+    python benchmark_entity_matcher.py [--entities 30000] [--words 200000] [file ...]
+
+Both methods must return the same matches, the script exits with an error
+otherwise.
+"""
+
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from typing import Dict, List
+
+from reportimporter.entity_matcher import EntityMatcher
+from reportimporter.models import Entity
+
+
+def generate_names(count: int, rng: random.Random) -> List[str]:
+    names = set()
+    while len(names) < count:
+        words = [
+            "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(3, 9)))
+            for _ in range(rng.randint(1, 3))
+        ]
+        name = rng.choice([" ", "-", "."]).join(words)
+        if rng.random() < 0.1:
+            name += rng.choice(["(", "+", "/", "!"]) + str(rng.randint(0, 99))
+        names.add(name)
+    return sorted(names)
+
+
+def generate_text(names: List[str], words: int, rng: random.Random) -> str:
+    tokens = []
+    for _ in range(words):
+        if rng.random() < 0.02:
+            name = rng.choice(names)
+            tokens.append(name.upper() if rng.random() < 0.2 else name)
+        else:
+            tokens.append(
+                "".join(
+                    rng.choice(string.ascii_lowercase)
+                    for _ in range(rng.randint(2, 10))
+                )
+            )
+    return " ".join(tokens)
+
+
+def build_entities(names: List[str], rng: random.Random) -> List[Entity]:
+    entities = []
+    for index, name in enumerate(names):
+        # Some names are exact match values, as configured with exact_match_fields
+        flags = 0 if rng.random() < 0.1 else re.IGNORECASE
+        entities.append(
+            Entity(
+                name="Intrusion-Set",
+                stix_class="IntrusionSet",
+                stix_id=f"intrusion-set--{index}",
+                values=[name],
+                regex=[re.compile(f"\\b{re.escape(name)}\\b", flags)],
+            )
+        )
+    return entities
+
+
+def match_regex(entities: List[Entity], data: str) -> Dict[int, List]:
+    matches = {}
+    for index, entity in enumerate(entities):
+        found = [
+            (match.group(), match.span())
+            for regex in entity.regex
+            for match in regex.finditer(data)
+        ]
+        if found:
+            matches[index] = found
+    return matches
+
+
+def match_automaton(matcher: EntityMatcher, data: str) -> Dict[int, List]:
+    return {index: found for index, found in enumerate(matcher.find(data)) if found}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Text files to search")
+    parser.add_argument("--entities", type=int, default=30000)
+    parser.add_argument("--words", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = generate_names(args.entities, rng)
+    entities = build_entities(names, rng)
+    if args.files:
+        texts = []
+        for file_path in args.files:
+            with open(file_path, "r", errors="replace") as f:
+                texts.append(f.read())
+    else:
+        texts = [generate_text(names, args.words, rng)]
+
+    start = time.perf_counter()
+    matcher = EntityMatcher(entities)
+    build_time = time.perf_counter() - start
+    print(f"{len(entities)} entities, automaton built in {build_time:.2f}s")
+
+    regex_time = automaton_time = 0.0
+    for text in texts:
+        start = time.perf_counter()
+        expected = match_regex(entities, text)
+        regex_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = match_automaton(matcher, text)
+        automaton_time += time.perf_counter() - start
+
+        if result != expected:
+            print("Automaton and regex matches differ", file=sys.stderr)
+            return 1
+
+    print(f"regex: {regex_time:.2f}s, automaton: {automaton_time:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
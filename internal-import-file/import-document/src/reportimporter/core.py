@@ -23,6 +23,8 @@ from reportimporter.constants import (
     RESULT_FORMAT_MATCH,
     RESULT_FORMAT_TYPE,
 )
+from reportimporter.entity_cache import EntityCache
+from reportimporter.entity_matcher import EntityMatcher
 from reportimporter.models import Entity, EntityConfig, Observable
 from reportimporter.report_parser import ReportParser
 from reportimporter.util import MyConfigParser
@@ -65,8 +67,79 @@ class ReportImporter:
         else:
             raise FileNotFoundError(f"{entity_config_file} was not found")
 
+        self.entity_cache = None
+        if get_config_variable(
+            "IMPORT_DOCUMENT_ENTITY_CACHE",
+            ["import_document", "entity_cache"],
+            config,
+            default=False,
+        ):
+            self.entity_cache = EntityCache(
+                self.helper,
+                self.entity_config,
+                get_config_variable(
+                    "IMPORT_DOCUMENT_ENTITY_CACHE_FULL_REFRESH",
+                    ["import_document", "entity_cache_full_refresh"],
+                    config,
+                    isNumber=True,
+                    default=86400,
+                ),
+                get_config_variable(
+                    "IMPORT_DOCUMENT_ENTITY_CACHE_SNAPSHOT",
+                    ["import_document", "entity_cache_snapshot"],
+                    config,
+                ),
+            )
+
+        self.entity_matcher = get_config_variable(
+            "IMPORT_DOCUMENT_ENTITY_MATCHER",
+            ["import_document", "entity_matcher"],
+            config,
+            default="regex",
+        )
+        if self.entity_matcher not in ["regex", "automaton"]:
+            raise ValueError(
+                f"Entity matcher must be 'regex' or 'automaton': {self.entity_matcher}"
+            )
+        self.single_pass = get_config_variable(
+            "IMPORT_DOCUMENT_SINGLE_PASS",
+            ["import_document", "single_pass"],
+            config,
+            default=False,
+        )
+        self.pdf_workers = get_config_variable(
+            "IMPORT_DOCUMENT_PDF_WORKERS",
+            ["import_document", "pdf_workers"],
+            config,
+            isNumber=True,
+            default=1,
+        )
+        # Last entity list and the automaton built from it
+        self._automaton_entities = []
+        self._automaton = None
+
         self.file = None
 
+    def _create_parser(self, entity_indicators: List[Entity]) -> ReportParser:
+        automaton = None
+        if self.entity_matcher == "automaton":
+            # The entity cache returns the same entities while nothing changed
+            if len(entity_indicators) != len(self._automaton_entities) or any(
+                a is not b for a, b in zip(entity_indicators, self._automaton_entities)
+            ):
+                self._automaton = EntityMatcher(entity_indicators)
+                self._automaton_entities = entity_indicators
+            automaton = self._automaton
+
+        return ReportParser(
+            self.helper,
+            entity_indicators,
+            self.observable_config,
+            automaton,
+            single_pass=self.single_pass,
+            pdf_workers=self.pdf_workers,
+        )
+
     def _process_message(self, data: Dict) -> str:
         self.helper.log_info("Processing new message")
         self.file = None
@@ -90,7 +163,7 @@ class ReportImporter:
         entity_indicators = self._collect_stix_objects(self.entity_config)
 
         # Parse content
-        parser = ReportParser(self.helper, entity_indicators, self.observable_config)
+        parser = self._create_parser(entity_indicators)
         if data["file_id"].startswith("import/global"):
             file_data = open(file_name, "rb").read()
             file_data_encoded = base64.b64encode(file_data)
@@ -126,7 +199,7 @@ class ReportImporter:
         entity_indicators = self._collect_stix_objects(self.entity_config)
 
         # Parse content
-        parser = ReportParser(self.helper, entity_indicators, self.observable_config)
+        parser = self._create_parser(entity_indicators)
         parsed_data = parser.parse(raw_text_to_analyze)
 
         parsed_result = self._extract_elements_id(parsed_data)
@@ -204,7 +277,7 @@ class ReportImporter:
         entity_indicators = self._collect_stix_objects(self.entity_config)
 
         # Parse report
-        parser = ReportParser(self.helper, entity_indicators, self.observable_config)
+        parser = self._create_parser(entity_indicators)
 
         if data["file_id"].startswith("import/global"):
             file_data = open(file_name, "rb").read()
@@ -267,6 +340,9 @@ class ReportImporter:
     def _collect_stix_objects(
         self, entity_config_list: List[EntityConfig]
     ) -> List[Entity]:
+        if self.entity_cache is not None:
+            return self.entity_cache.get_entities()
+
         base_func = self.helper.api
         entity_list = []
         for entity_config in entity_config_list:
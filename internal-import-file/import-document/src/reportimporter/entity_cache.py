@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from pycti import OpenCTIConnectorHelper
+from reportimporter.models import Entity, EntityConfig
+
+
+class EntityCache(object):
+    """
+    Process-wide dictionary of the OpenCTI entities searched in documents
+
+    The entities of every entity config are listed once, later refreshes only
+    fetch the entities updated since the most recent `updated_at` seen. As
+    deletions cannot be detected that way, everything is listed again every
+    `full_refresh_interval` seconds. The listed entities can be saved to a
+    snapshot file so that a restarted connector starts with a warm cache.
+    """
+
+    def __init__(
+        self,
+        helper: OpenCTIConnectorHelper,
+        entity_config_list: List[EntityConfig],
+        full_refresh_interval: int,
+        snapshot_path: Optional[str] = None,
+    ):
+        self.helper = helper
+        self.entity_config_list = entity_config_list
+        self.full_refresh_interval = full_refresh_interval
+        self.snapshot_path = snapshot_path
+        self.lock = threading.Lock()
+
+        # Entity config name -> standard id -> listed fields / converted entity
+        self.items: Dict[str, Dict[str, Dict]] = {}
+        self.entities: Dict[str, Dict[str, Entity]] = {}
+        # Entity config name -> most recent updated_at listed
+        self.cursors: Dict[str, str] = {}
+        self.last_full_refresh = None
+
+        if self.snapshot_path is not None and os.path.isfile(self.snapshot_path):
+            self._load_snapshot()
+
+    def get_entities(self) -> List[Entity]:
+        with self.lock:
+            if (
+                self.last_full_refresh is None
+                or time.time() - self.last_full_refresh >= self.full_refresh_interval
+            ):
+                changed = self._refresh(full=True)
+            else:
+                changed = self._refresh(full=False)
+            if changed and self.snapshot_path is not None:
+                self._save_snapshot()
+
+            return [
+                entity
+                for entity_config in self.entity_config_list
+                for entity in self.entities[entity_config.name].values()
+            ]
+
+    def _refresh(self, full: bool) -> bool:
+        changed = False
+        started_at = time.time()
+        for entity_config in self.entity_config_list:
+            if full:
+                self.items[entity_config.name] = {}
+                self.entities[entity_config.name] = {}
+                self.cursors.pop(entity_config.name, None)
+            entries = self._list(entity_config, self.cursors.get(entity_config.name))
+            for entry in entries:
+                # The cursor is inclusive, entities updated at the cursor are listed again
+                changed = self._update(entity_config, entry) or changed
+            changed = changed or full
+
+        if full:
+            self.last_full_refresh = started_at
+            self.helper.log_info(
+                "Entity cache loaded with "
+                + str(sum(len(entities) for entities in self.entities.values()))
+                + " entities"
+            )
+        return changed
+
+    def _list(self, entity_config: EntityConfig, cursor: Optional[str]) -> List[Dict]:
+        filters = entity_config.filter
+        if cursor is not None:
+            cursor_filter = {
+                "mode": "and",
+                "filters": [
+                    {"key": "updated_at", "values": [cursor], "operator": "gte"}
+                ],
+                "filterGroups": [],
+            }
+            filters = (
+                cursor_filter
+                if filters is None
+                else {
+                    "mode": "and",
+                    "filters": [],
+                    "filterGroups": [filters, cursor_filter],
+                }
+            )
+
+        try:
+            custom_function = getattr(self.helper.api, entity_config.stix_class)
+        except AttributeError:
+            e = "Selected parser format is not supported: {}".format(
+                entity_config.stix_class
+            )
+            raise NotImplementedError(e)
+
+        return custom_function.list(
+            getAll=True,
+            filters=filters,
+            customAttributes=entity_config.custom_attributes + "\nupdated_at",
+        )
+
+    def _update(self, entity_config: EntityConfig, entry: Dict) -> bool:
+        changed = False
+        updated_at = entry.get("updated_at")
+        cursor = self.cursors.get(entity_config.name)
+        if updated_at is not None and (cursor is None or updated_at > cursor):
+            self.cursors[entity_config.name] = updated_at
+            changed = True
+
+        standard_id = entry.get("standard_id")
+        item = {field: entry.get(field) for field in entity_config.fields}
+        item["standard_id"] = standard_id
+        if self.items[entity_config.name].get(standard_id) == item:
+            return changed
+        self.items[entity_config.name][standard_id] = item
+        self._convert(entity_config, item)
+        return True
+
+    def _convert(self, entity_config: EntityConfig, item: Dict) -> None:
+        converted = entity_config.convert_to_entity([item], self.helper)
+        if len(converted) > 0:
+            self.entities[entity_config.name][item["standard_id"]] = converted[0]
+        else:
+            self.entities[entity_config.name].pop(item["standard_id"], None)
+
+    @staticmethod
+    def _signature(entity_config: EntityConfig) -> Dict:
+        # Listed and converted entities depend on the whole entity config
+        return json.loads(entity_config.json(exclude={"regex"}))
+
+    def _load_snapshot(self) -> None:
+        try:
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            self.helper.log_warning(f"Unable to read entity cache snapshot: {e}")
+            return
+
+        signatures = [
+            self._signature(entity_config) for entity_config in self.entity_config_list
+        ]
+        if snapshot.get("signatures") != signatures:
+            self.helper.log_info("Entity configuration changed, ignoring snapshot")
+            return
+
+        for entity_config in self.entity_config_list:
+            self.items[entity_config.name] = {}
+            self.entities[entity_config.name] = {}
+            for item in snapshot["items"][entity_config.name]:
+                self.items[entity_config.name][item["standard_id"]] = item
+                self._convert(entity_config, item)
+        self.cursors = snapshot["cursors"]
+        self.last_full_refresh = snapshot["last_full_refresh"]
+        self.helper.log_info(
+            "Entity cache restored from snapshot " + str(self.snapshot_path)
+        )
+
+    def _save_snapshot(self) -> None:
+        snapshot = {
+            "signatures": [
+                self._signature(entity_config)
+                for entity_config in self.entity_config_list
+            ],
+            "last_full_refresh": self.last_full_refresh,
+            "cursors": self.cursors,
+            "items": {name: list(items.values()) for name, items in self.items.items()},
+        }
+        temporary_path = self.snapshot_path + ".tmp"
+        try:
+            with open(temporary_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(temporary_path, self.snapshot_path)
+        except OSError as e:
+            self.helper.log_warning(f"Unable to write entity cache snapshot: {e}")
@@ -0,0 +1,174 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+import _sre
+from reportimporter.models import Entity
+
+try:
+    # Characters matched together by re.IGNORECASE besides their lower case
+    from re._casefix import _EXTRA_CASES
+except ImportError:  # Python < 3.11
+    from sre_compile import _ignorecase_fixes as _EXTRA_CASES
+
+# Entity regexes are built as \b<escaped value>\b by EntityConfig.convert_to_entity
+ENTITY_REGEX = re.compile(r"\\b(.*)\\b", re.DOTALL)
+ESCAPED_CHAR = re.compile(r"\\(.)", re.DOTALL)
+
+
+class _FoldTable(dict):
+    """
+    Lazily filled `str.translate` table folding every character like
+    `re.IGNORECASE` does: its simple lower case mapping, then one representative
+    of the characters `re` also treats as equal (e.g. "ı" and "i", "ſ" and "s").
+    Every character is folded to a single one, unlike `str.lower` ("İ").
+    """
+
+    def __missing__(self, code: int) -> int:
+        lower = _sre.unicode_tolower(code)
+        folded = min((lower,) + _EXTRA_CASES.get(lower, ()))
+        self[code] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+
+
+def _fold(text: str) -> str:
+    """
+    Fold a text for case insensitive matching without changing its length, so
+    that positions in the folded text are positions in the original one
+    """
+    if text.isascii():
+        return text.lower()
+    return text.translate(_FOLD_TABLE)
+
+
+def _is_word(char: str) -> bool:
+    # Same definition as \w for str patterns
+    return char.isalnum() or char == "_"
+
+
+def _is_boundary(data: str, position: int) -> bool:
+    # Same definition as \b for str patterns
+    before = position > 0 and _is_word(data[position - 1])
+    after = position < len(data) and _is_word(data[position])
+    return before != after
+
+
+class EntityMatcher(object):
+    """
+    Aho-Corasick automaton finding the values of all the entities in a single
+    pass over a text
+
+    Every entity regex `\\bvalue\\b` is turned back into its value. All values
+    are searched case insensitively, case sensitive values are then compared to
+    the text, and the word boundaries are checked on the text around each
+    occurrence. Occurrences of a value overlapping a previous one are dropped,
+    as `finditer` would do, so that `find` returns the same matches as running
+    every regex of every entity.
+    """
+
+    def __init__(self, entity_list: List[Entity]):
+        self.entity_count = len(entity_list)
+        # Entities with a regex which is not a plain value are matched with their regexes
+        self.regex_entities = set()
+        # Pattern index -> (entity index, value, ignore case)
+        self.patterns: List[Tuple[int, str, bool]] = []
+        self.lengths: List[int] = []
+
+        # Automaton nodes: transitions, failure link, patterns ending at the node
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+
+        for entity_index, entity in enumerate(entity_list):
+            values = []
+            for regex in entity.regex:
+                pattern = ENTITY_REGEX.fullmatch(regex.pattern)
+                if pattern is None:
+                    self.regex_entities.add(entity_index)
+                    break
+                value = ESCAPED_CHAR.sub(r"\1", pattern.group(1))
+                if value == "" or re.escape(value) != pattern.group(1):
+                    self.regex_entities.add(entity_index)
+                    break
+                values.append((value, bool(regex.flags & re.IGNORECASE)))
+
+            if entity_index in self.regex_entities:
+                continue
+            for value, ignore_case in values:
+                self._add(len(self.patterns), _fold(value))
+                self.patterns.append((entity_index, value, ignore_case))
+                self.lengths.append(len(value))
+
+        self._build_failure_links()
+
+    def _add(self, pattern_index: int, value: str) -> None:
+        node = 0
+        for char in value:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = next_node
+        self.output[node].append(pattern_index)
+
+    def _build_failure_links(self) -> None:
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, next_node in self.goto[node].items():
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_node] = self.goto[fail].get(char, 0)
+                # Patterns which are a suffix of this one end at the same position
+                self.output[next_node] = (
+                    self.output[next_node] + self.output[self.fail[next_node]]
+                )
+                queue.append(next_node)
+
+    def find(self, data: str) -> List[Optional[List[Tuple[str, Tuple[int, int]]]]]:
+        """
+        Find the entity values in a text
+        :return: For each entity, its (match, span) ordered like the results of
+        its regexes, None if the entity must be matched with its regexes
+        """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        lengths = self.lengths
+
+        # Pattern index -> start positions of its occurrences
+        occurrences: Dict[int, List[int]] = {}
+        node = 0
+        for position, char in enumerate(_fold(data)):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern_index in output[node]:
+                occurrences.setdefault(pattern_index, []).append(
+                    position + 1 - lengths[pattern_index]
+                )
+
+        matches = [
+            None if entity_index in self.regex_entities else []
+            for entity_index in range(self.entity_count)
+        ]
+        for pattern_index in sorted(occurrences):
+            entity_index, value, ignore_case = self.patterns[pattern_index]
+            previous_end = 0
+            for start in occurrences[pattern_index]:
+                end = start + len(value)
+                if start < previous_end:
+                    continue
+                if not ignore_case and data[start:end] != value:
+                    continue
+                if not _is_boundary(data, start) or not _is_boundary(data, end):
+                    continue
+                matches[entity_index].append((data[start:end], (start, end)))
+                previous_end = end
+
+        return matches
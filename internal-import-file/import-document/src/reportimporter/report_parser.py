@@ -1,13 +1,17 @@
 import io
 import logging
+import multiprocessing
 import os
-from typing import IO, Dict, Iterable, List, Pattern, Tuple
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Dict, Iterable, List, Optional, Pattern, Tuple
 
 import chardet
 import ioc_finder
 from bs4 import BeautifulSoup
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LAParams, LTTextContainer
+from pdfminer.pdfpage import PDFPage
 from pycti import OpenCTIConnectorHelper
 from reportimporter.constants import (
     ENTITY_CLASS,
@@ -24,9 +28,110 @@ from reportimporter.constants import (
     RESULT_FORMAT_RANGE,
     RESULT_FORMAT_TYPE,
 )
+from reportimporter.entity_matcher import EntityMatcher
 from reportimporter.models import Entity, Observable
 from reportimporter.util import library_mapping
 
+# Pages extracted by each task of the PDF worker pool
+PDF_PAGES_PER_TASK = 10
+# Joins the texts parsed in a single pass, no pattern matches across it
+SEGMENT_SEPARATOR = "\n"
+
+
+def _append_text_recursively(page_element, parsed_texts: List[str]) -> None:
+    if isinstance(page_element, Iterable):
+        for sub_element in page_element:
+            if isinstance(sub_element, LTTextContainer):
+                parsed_texts.append(sub_element.get_text())
+            else:
+                _append_text_recursively(sub_element, parsed_texts)
+
+
+def _extract_pdf_texts(
+    pdf_data: bytes, page_numbers: List[int], defang: bool
+) -> List[str]:
+    """
+    Extract the text containers of some pages of a PDF, in a worker process
+    :return: Texts without newlines, defanged if requested
+    """
+    parsed_texts = []
+    pages_layouts = extract_pages(
+        io.BytesIO(pdf_data),
+        page_numbers=page_numbers,
+        laparams=LAParams(all_texts=True),
+    )
+    for page_layout in pages_layouts:
+        _append_text_recursively(page_layout, parsed_texts)
+
+    # Parsing with newlines has been deprecated
+    texts = [parsed_text.replace("\n", "") for parsed_text in parsed_texts]
+    if defang:
+        texts = [ioc_finder.prepare_text(text) for text in texts]
+    return texts
+
+
+class _SegmentLocator(object):
+    """
+    Maps the positions in texts joined by SEGMENT_SEPARATOR to their text
+    """
+
+    def __init__(self, segments: List[str]):
+        self.segments = segments
+        self.data = SEGMENT_SEPARATOR.join(segments)
+        self.bounds = self._bounds(segments)
+        self._lowered = None
+
+    @staticmethod
+    def _bounds(segments: List[str]) -> Tuple[List[int], List[int]]:
+        starts = []
+        ends = []
+        position = 0
+        for segment in segments:
+            starts.append(position)
+            ends.append(position + len(segment))
+            position += len(segment) + len(SEGMENT_SEPARATOR)
+        return starts, ends
+
+    def locate(
+        self,
+        span: Tuple[int, int],
+        bounds: Optional[Tuple[List[int], List[int]]] = None,
+    ) -> Optional[Tuple[int, Tuple[int, int]]]:
+        """
+        :return: Index of the text and span in this text, None if the span
+        isn't inside a single text
+        """
+        starts, ends = self.bounds if bounds is None else bounds
+        start, end = span
+        index = bisect_right(starts, start) - 1
+        if index < 0 or end > ends[index]:
+            return None
+        return index, (start - starts[index], end - starts[index])
+
+    def first_starts(self, value: str, lower: bool = False) -> Dict[int, int]:
+        """
+        :return: Text index -> start of the first occurrence of the value in the
+        text, or in the lower case text
+        """
+        if lower:
+            if self._lowered is None:
+                lowered = [segment.lower() for segment in self.segments]
+                self._lowered = (
+                    SEGMENT_SEPARATOR.join(lowered),
+                    self._bounds(lowered),
+                )
+            data, bounds = self._lowered
+        else:
+            data, bounds = self.data, self.bounds
+        first_starts = {}
+        position = data.find(value)
+        while position != -1:
+            located = self.locate((position, position + len(value)), bounds)
+            if located is not None:
+                first_starts.setdefault(located[0], located[1][0])
+            position = data.find(value, position + 1)
+        return first_starts
+
 
 class ReportParser(object):
     """
@@ -38,10 +143,19 @@ class ReportParser(object):
         helper: OpenCTIConnectorHelper,
         entity_list: List[Entity],
         observable_list: List[Observable],
+        entity_matcher: Optional[EntityMatcher] = None,
+        single_pass: bool = False,
+        pdf_workers: int = 1,
     ):
         self.helper = helper
         self.entity_list = entity_list
         self.observable_list = observable_list
+        # Automaton built from entity_list, the entity regexes are used if None
+        self.entity_matcher = entity_matcher
+        # Parse all the texts of a document at once instead of one by one
+        self.single_pass = single_pass
+        # Processes extracting the pages of a PDF, extracted in this process if 1
+        self.pdf_workers = pdf_workers
 
         # Disable INFO logging by pdfminer
         logging.getLogger("pdfminer").setLevel(logging.WARNING)
@@ -78,45 +192,192 @@ class ReportParser(object):
             OBSERVABLE_CLASS, observable.stix_target, ind_match, match_range
         )
 
-    def parse(self, data: str) -> Dict[str, Dict]:
+    def parse(self, data: str, defanged: bool = False) -> Dict[str, Dict]:
         list_matches = {}
 
         # Defang text
-        data = ioc_finder.prepare_text(data)
+        if not defanged:
+            data = ioc_finder.prepare_text(data)
 
         for observable in self.observable_list:
             list_matches.update(self._extract_observable(observable, data))
 
-        for entity in self.entity_list:
-            list_matches = self._extract_entity(entity, list_matches, data)
+        if self.entity_matcher is None:
+            for entity in self.entity_list:
+                list_matches = self._extract_entity(entity, list_matches, data)
+        else:
+            entity_matches = self.entity_matcher.find(data)
+            for entity, matches in zip(self.entity_list, entity_matches):
+                # An entity without match leaves the matches unchanged
+                if matches is None or len(matches) > 0:
+                    list_matches = self._extract_entity(
+                        entity, list_matches, data, matches
+                    )
 
         self.helper.log_debug(f"Text: '{data}' -> extracts {list_matches}")
         return list_matches
 
-    def _parse_pdf(self, file_data: IO) -> Dict[str, Dict]:
+    def _parse_segments(self, segments: List[str]) -> Dict[str, Dict]:
+        """
+        Parse defanged texts in a single pass over their concatenation
+
+        The observables and entities are searched once in the concatenation,
+        their occurrences are then mapped back to their text and every text is
+        processed like `parse` would (omitted entities, observables replaced by
+        entities), the results being merged in the texts order.
+        :return: Matches, without the ones spanning several texts
+        """
+        locator = _SegmentLocator(segments)
+        data = locator.data
+
+        observable_matches = [
+            self._find_segments_observable(observable, data, locator)
+            for observable in self.observable_list
+        ]
+
+        if self.entity_matcher is None:
+            entity_matches = [None] * len(self.entity_list)
+        else:
+            entity_matches = self.entity_matcher.find(data)
+        segments_entity_matches = []
+        for entity, matches in zip(self.entity_list, entity_matches):
+            if matches is None:
+                matches = (
+                    (match.group(), match.span())
+                    for regex in entity.regex
+                    for match in regex.finditer(data)
+                )
+            segment_matches = {}
+            for match, match_span in matches:
+                located = locator.locate(match_span)
+                if located is not None:
+                    index, local_span = located
+                    segment_matches.setdefault(index, []).append((match, local_span))
+            segments_entity_matches.append(segment_matches)
+
         parse_info = {}
-        parsed_texts = []
+        for index, segment in enumerate(segments):
+            list_matches = {}
+            for segment_matches in observable_matches:
+                list_matches.update(segment_matches.get(index, {}))
+            for entity, segment_matches in zip(
+                self.entity_list, segments_entity_matches
+            ):
+                if index in segment_matches:
+                    list_matches = self._extract_entity(
+                        entity, list_matches, segment, segment_matches[index]
+                    )
+            parse_info.update(list_matches)
+        return parse_info
+
+    def _find_segments_observable(
+        self, observable: Observable, data: str, locator: "_SegmentLocator"
+    ) -> Dict[int, Dict]:
+        """
+        Same as `_extract_observable` for each text, searching their concatenation
+        :return: Text index -> observable matches of the text
+        """
+        segment_matches = {}
+        # Value -> whitelisted, the filters are applied once per value
+        whitelisted = {}
+
+        def post_parse(ind_match, match_range: Tuple) -> Dict:
+            if ind_match not in whitelisted:
+                whitelisted[ind_match] = self._is_whitelisted(
+                    observable.filter_regex, ind_match
+                )
+            if whitelisted[ind_match]:
+                return {}
+            return self._format_match(
+                OBSERVABLE_CLASS, observable.stix_target, ind_match, match_range
+            )
 
-        def append_text_recursively(page_element):
-            if isinstance(page_element, Iterable):
-                for sub_element in page_element:
-                    if isinstance(sub_element, LTTextContainer):
-                        parsed_texts.append(sub_element.get_text())
-                    else:
-                        append_text_recursively(sub_element)
+        if observable.detection_option == OBSERVABLE_DETECTION_CUSTOM_REGEX:
+            for regex in observable.regex:
+                for match in regex.finditer(data):
+                    located = locator.locate(match.span())
+                    if located is None:
+                        continue
+                    index, local_span = located
+                    ind_match = post_parse(match.group(), local_span)
+                    if ind_match:
+                        segment_matches.setdefault(index, {})[match.group()] = ind_match
 
-        try:
+        elif observable.detection_option == OBSERVABLE_DETECTION_LIBRARY:
+            lookup_function = self.library_lookup.get(observable.stix_target, None)
+            if not lookup_function:
+                self.helper.log_error(
+                    f"Selected library function is not implemented: {observable.iocfinder_function}"
+                )
+                return {}
+
+            for match in lookup_function(data):
+                match_str = str(match)
+                # First occurrence in each text, in lower case if not found as is
+                starts = locator.first_starts(match_str)
+                if match_str == match_str.lower():
+                    for index, start in locator.first_starts(match_str, True).items():
+                        starts.setdefault(index, start)
+                if len(starts) == 0:
+                    self.helper.log_error(
+                        f"The extracted text '{match_str}' is not part of the original text. "
+                        f"Please open a GitHub issue to report this problem!"
+                    )
+                    continue
+                for index, start in starts.items():
+                    ind_match = post_parse(match, (start, len(match_str) + start))
+                    if ind_match:
+                        segment_matches.setdefault(index, {})[match] = ind_match
+
+        return segment_matches
+
+    def _extract_pdf_texts(self, file_data: IO) -> List[str]:
+        if self.pdf_workers <= 1:
+            parsed_texts = []
             pages_layouts = extract_pages(file_data, laparams=LAParams(all_texts=True))
+            for page_layout in pages_layouts:
+                _append_text_recursively(page_layout, parsed_texts)
+            # Parsing with newlines has been deprecated
+            texts = [parsed_text.replace("\n", "") for parsed_text in parsed_texts]
+            if self.single_pass:
+                texts = [ioc_finder.prepare_text(text) for text in texts]
+            return texts
+
+        pdf_data = file_data.read()
+        page_count = sum(1 for _ in PDFPage.get_pages(io.BytesIO(pdf_data)))
+        texts = []
+        # Forking would copy the helper threads and their locks
+        with ProcessPoolExecutor(
+            max_workers=self.pdf_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _extract_pdf_texts,
+                    pdf_data,
+                    list(range(first, min(first + PDF_PAGES_PER_TASK, page_count))),
+                    self.single_pass,
+                )
+                for first in range(0, page_count, PDF_PAGES_PER_TASK)
+            ]
+            # Keep the page order
+            for future in futures:
+                texts.extend(future.result())
+        return texts
+
+    def _parse_pdf(self, file_data: IO) -> Dict[str, Dict]:
+        parse_info = {}
+
+        try:
             # TODO also extract information from images using OCR
             # https://pdfminersix.readthedocs.io/en/latest/topic/converting_pdf_to_text.html#topic-pdf-to-text-layout
+            parsed_texts = self._extract_pdf_texts(file_data)
 
-            for page_layout in pages_layouts:
-                append_text_recursively(page_layout)
-
-            for parsed_text in parsed_texts:
-                # Parsing with newlines has been deprecated
-                no_newline_text = parsed_text.replace("\n", "")
-                parse_info.update(self.parse(no_newline_text))
+            if self.single_pass:
+                parse_info.update(self._parse_segments(parsed_texts))
+            else:
+                for parsed_text in parsed_texts:
+                    parse_info.update(self.parse(parsed_text))
 
         except Exception as e:
             logging.exception(f"Pdf Parsing Error: {e}")
@@ -137,8 +398,15 @@ class ReportParser(object):
         parse_info = {}
         soup = BeautifulSoup(file_data, "html.parser")
         buf = io.StringIO(soup.get_text(separator=" "))
-        for text in buf.readlines():
-            parse_info.update(self.parse(text))
+        if self.single_pass:
+            parse_info.update(
+                self._parse_segments(
+                    [ioc_finder.prepare_text(text) for text in buf.readlines()]
+                )
+            )
+        else:
+            for text in buf.readlines():
+                parse_info.update(self.parse(text))
         return parse_info
 
     def run_raw_parser(self, file_path: str, file_type: str) -> Dict:
@@ -240,7 +508,13 @@ class ReportParser(object):
 
         return list_matches
 
-    def _extract_entity(self, entity: Entity, list_matches: Dict, data: str) -> Dict:
+    def _extract_entity(
+        self,
+        entity: Entity,
+        list_matches: Dict,
+        data: str,
+        matches: Optional[List[Tuple[str, Tuple]]] = None,
+    ) -> Dict:
         regex_list = entity.regex
 
         observable_keys = []
@@ -248,14 +522,18 @@ class ReportParser(object):
         match_dict = {}
         match_key = ""
 
-        # Run all regexes for entity X
-        for regex in regex_list:
-            for match in regex.finditer(data):
-                match_key = match.group()
-                if match_key in match_dict:
-                    match_dict[match_key].append(match.span())
-                else:
-                    match_dict[match_key] = [match.span()]
+        # Run all regexes for entity X, unless the matches were found by the automaton
+        if matches is None:
+            matches = (
+                (match.group(), match.span())
+                for regex in regex_list
+                for match in regex.finditer(data)
+            )
+        for match_key, match_span in matches:
+            if match_key in match_dict:
+                match_dict[match_key].append(match_span)
+            else:
+                match_dict[match_key] = [match_span]
 
         # No maches for this entity
         if len(match_dict) == 0:
@@ -0,0 +1,57 @@
+import os
+import re
+import sys
+
+import pytest
+
+# Addition of the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from reportimporter.entity_matcher import EntityMatcher  # noqa: E402
+from reportimporter.models import Entity  # noqa: E402
+
+
+def build_entity(value: str, flags: int = re.IGNORECASE) -> Entity:
+    # Same regex as EntityConfig.convert_to_entity
+    return Entity(
+        name="Location",
+        stix_class="Location",
+        stix_id="location--" + value,
+        values=[value],
+        regex=[re.compile(f"\\b{re.escape(value)}\\b", flags)],
+    )
+
+
+def match_regex(entities, data):
+    return [
+        [
+            (match.group(), match.span())
+            for regex in entity.regex
+            for match in regex.finditer(data)
+        ]
+        for entity in entities
+    ]
+
+
+@pytest.mark.parametrize(
+    "values,data",
+    [
+        (["İstanbul"], "visit istanbul now"),
+        (["istanbul"], "visit İstanbul now"),
+        (["ſtraße", "Kelvin"], "STRASSE straße KELVIN Kelvin"),
+        (["µg", "ǅemal"], "5 μg of ǆemal"),
+        (["ﬁle"], "file ﬁle FILE"),
+    ],
+)
+def test_same_matches_as_regex(values, data):
+    entities = [build_entity(value) for value in values] + [
+        build_entity(value, 0) for value in values
+    ]
+    assert EntityMatcher(entities).find(data) == match_regex(entities, data)
+
+
+def test_dotted_capital_i():
+    entity = build_entity("İstanbul")
+    assert EntityMatcher([entity]).find("visit istanbul now") == [
+        [("istanbul", (6, 14))]
+    ]
@@ -0,0 +1,77 @@
+import io
+import os
+import re
+import sys
+from unittest.mock import Mock
+
+import pytest
+
+# Addition of the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from reportimporter.core import ReportImporter  # noqa: E402
+from reportimporter.entity_matcher import EntityMatcher  # noqa: E402
+from reportimporter.models import Entity, Observable  # noqa: E402
+from reportimporter.report_parser import ReportParser  # noqa: E402
+
+CONFIG_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../src/reportimporter/config")
+)
+
+HTML_DOCUMENT = """
+<html><body>
+<p>Emotet samples were downloaded from emotet.com and from 198.51.100.7</p>
+<p>The operators also used payload.exe and T1059.001</p>
+<p>Another emotet.com server, unrelated to the group</p>
+<p>payload.exe was renamed, see Payload.exe and Admin@Example.org</p>
+<p>Contact admin@example.org about APT28 and fancy bear activity</p>
+<p>emotet</p>
+</body></html>
+"""
+
+
+def build_entity(name, stix_id, values, omit_match_in=()):
+    return Entity(
+        name=name,
+        stix_class=name,
+        stix_id=stix_id,
+        values=values,
+        regex=[
+            re.compile(f"\\b{re.escape(value)}\\b", re.IGNORECASE) for value in values
+        ],
+        omit_match_in=list(omit_match_in),
+    )
+
+
+ENTITIES = [
+    build_entity(
+        "Malware", "malware--emotet", ["Emotet"], omit_match_in=["Domain-Name.value"]
+    ),
+    build_entity("Tool", "tool--payload", ["payload.exe"]),
+    build_entity("Intrusion-Set", "intrusion-set--apt28", ["APT28", "Fancy Bear"]),
+]
+
+
+def build_parser(single_pass, automaton):
+    observables = ReportImporter._parse_config(
+        os.path.join(CONFIG_PATH, "observable_config.ini"), Observable
+    )
+    return ReportParser(
+        Mock(),
+        ENTITIES,
+        observables,
+        EntityMatcher(ENTITIES) if automaton else None,
+        single_pass=single_pass,
+    )
+
+
+@pytest.mark.parametrize("automaton", [False, True])
+def test_single_pass_same_as_per_block(automaton):
+    per_block = build_parser(False, automaton)._parse_html(io.StringIO(HTML_DOCUMENT))
+    single_pass = build_parser(True, automaton)._parse_html(io.StringIO(HTML_DOCUMENT))
+
+    assert single_pass == per_block
+    # The entity is omitted in the domain but found elsewhere, the domain is kept
+    assert per_block["emotet"]["match"] == "malware--emotet"
+    # Ranges are in the last text the observable was found in
+    assert per_block["emotet.com"]["range"] == (9, 19)
@@ -72,6 +72,43 @@ OPENCTISTIX2 = {
 FILETYPES = ["file-name", "file-md5", "file-sha1", "file-sha256"]
 
 
+class BundleBuilder:
+    """
+    Ordered list of STIX objects indexed by key and by uuid.
+
+    Membership checks and uuid lookups are O(1), so building the bundle of
+    an event with tens of thousands of attributes stays linear.
+    """
+
+    def __init__(self, objects=None):
+        self.objects = []
+        self._keys = set()
+        self._by_uuid = {}
+        for stix_object in objects or []:
+            self.add(stix_object)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, stix_object, key=None):
+        """Append the object unless its key (default: its id) is already known"""
+        key = stix_object["id"] if key is None else key
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self.objects.append(stix_object)
+        stix_id = stix_object["id"]
+        # Keep the first object seen for a uuid, like a linear scan would
+        self._by_uuid.setdefault(stix_id[stix_id.index("--") + 2 :], stix_object)
+        return True
+
+    def get_by_uuid(self, uuid):
+        return self._by_uuid.get(uuid)
+
+
 class MispImportFile:
     def __init__(self):
         # Instantiate the connector helper from config
@@ -1589,14 +1626,11 @@ class MispImportFile:
             }
 
     def _find_type_by_uuid(self, uuid, bundle_objects):
-        # filter by uuid
-        i_result = list(filter(lambda o: o.id.endswith("--" + uuid), bundle_objects))
-
-        if len(i_result) > 0:
-            uuid = i_result[0]["id"]
+        entity = bundle_objects.get_by_uuid(uuid)
+        if entity is not None:
             return {
-                "entity": i_result[0],
-                "type": uuid[: uuid.index("--")],
+                "entity": entity,
+                "type": entity["id"][: entity["id"].index("--")],
             }
         return None
 
@@ -1634,13 +1668,7 @@ class MispImportFile:
                 raise ValueError("The list of is too long.")
 
         ### Default variables
-        added_markings = []
-        added_entities = []
-        added_object_refs = []
-        added_sightings = []
         added_files = []
-        added_observables = []
-        added_relationships = []
 
         ### Pre-process
         # Author
@@ -1820,13 +1848,11 @@ class MispImportFile:
             # TODO Extend observable
 
         ### Prepare the bundle
-        bundle_objects = [author]
-        object_refs = []
+        bundle_objects = BundleBuilder([author])
+        object_refs = BundleBuilder()
         # Add event markings
         for event_marking in event_markings:
-            if event_marking["id"] not in added_markings:
-                bundle_objects.append(event_marking)
-                added_markings.append(event_marking["id"])
+            bundle_objects.add(event_marking)
         # Add event elements
         all_event_elements = (
             event_elements["intrusion_sets"]
@@ -1837,44 +1863,26 @@ class MispImportFile:
             + event_elements["countries"]
         )
         for event_element in all_event_elements:
-            if event_element["id"] not in added_object_refs:
-                object_refs.append(event_element)
-                added_object_refs.append(event_element["id"])
-            if event_element["id"] not in added_entities:
-                bundle_objects.append(event_element)
-                added_entities.append(event_element["id"])
+            object_refs.add(event_element)
+            bundle_objects.add(event_element)
         # Add indicators
         for indicator in indicators:
             if indicator["indicator"] is not None:
-                if indicator["indicator"]["id"] not in added_object_refs:
-                    object_refs.append(indicator["indicator"])
-                    added_object_refs.append(indicator["indicator"]["id"])
-                if indicator["indicator"]["id"] not in added_entities:
-                    bundle_objects.append(indicator["indicator"])
-                    added_entities.append(indicator["indicator"]["id"])
+                object_refs.add(indicator["indicator"])
+                bundle_objects.add(indicator["indicator"])
             if indicator["observable"] is not None:
-                if indicator["observable"]["id"] not in added_object_refs:
-                    object_refs.append(indicator["observable"])
-                    added_object_refs.append(indicator["observable"]["id"])
-                if indicator["observable"]["id"] not in added_entities:
-                    bundle_objects.append(indicator["observable"])
-                    added_entities.append(indicator["observable"]["id"])
+                object_refs.add(indicator["observable"])
+                bundle_objects.add(indicator["observable"])
 
             # Add attribute markings
             for attribute_marking in indicator["markings"]:
-                if attribute_marking["id"] not in added_markings:
-                    bundle_objects.append(attribute_marking)
-                    added_markings.append(attribute_marking["id"])
+                bundle_objects.add(attribute_marking)
             # Add attribute sightings identities
             for attribute_identity in indicator["identities"]:
-                if attribute_identity["id"] not in added_entities:
-                    bundle_objects.append(attribute_identity)
-                    added_entities.append(attribute_identity["id"])
+                bundle_objects.add(attribute_identity)
             # Add attribute sightings
             for attribute_sighting in indicator["sightings"]:
-                if attribute_sighting["id"] not in added_sightings:
-                    bundle_objects.append(attribute_sighting)
-                    added_sightings.append(attribute_sighting["id"])
+                bundle_objects.add(attribute_sighting)
             # Add attribute elements
             all_attribute_elements = (
                 indicator["attribute_elements"]["intrusion_sets"]
@@ -1885,12 +1893,8 @@ class MispImportFile:
                 + indicator["attribute_elements"]["countries"]
             )
             for attribute_element in all_attribute_elements:
-                if attribute_element["id"] not in added_object_refs:
-                    object_refs.append(attribute_element)
-                    added_object_refs.append(attribute_element["id"])
-                if attribute_element["id"] not in added_entities:
-                    bundle_objects.append(attribute_element)
-                    added_entities.append(attribute_element["id"])
+                object_refs.add(attribute_element)
+                bundle_objects.add(attribute_element)
             # Add attribute relationships
             for relationship in indicator["relationships"]:
                 indicators_relationships.append(relationship)
@@ -1900,12 +1904,8 @@ class MispImportFile:
             objects_relationships.append(indicator_relationship)
         # Add MISP objects_observables
         for object_observable in objects_observables:
-            if object_observable["id"] not in added_object_refs:
-                object_refs.append(object_observable)
-                added_object_refs.append(object_observable["id"])
-            if object_observable["id"] not in added_observables:
-                bundle_objects.append(object_observable)
-                added_observables.append(object_observable["id"])
+            object_refs.add(object_observable)
+            bundle_objects.add(object_observable)
 
         # Link all objects with each other, now so we can find the correct entity type prefix in bundle_objects
         for object in event["Event"].get("Object", []):
@@ -1936,24 +1936,11 @@ class MispImportFile:
                         )
         # Add object_relationships
         for object_relationship in objects_relationships:
-            if (
-                object_relationship["source_ref"] + object_relationship["target_ref"]
-                not in added_object_refs
-            ):
-                object_refs.append(object_relationship)
-                added_object_refs.append(
-                    object_relationship["source_ref"]
-                    + object_relationship["target_ref"]
-                )
-            if (
+            relationship_key = (
                 object_relationship["source_ref"] + object_relationship["target_ref"]
-                not in added_relationships
-            ):
-                bundle_objects.append(object_relationship)
-                added_relationships.append(
-                    object_relationship["source_ref"]
-                    + object_relationship["target_ref"]
-                )
+            )
+            object_refs.add(object_relationship, key=relationship_key)
+            bundle_objects.add(object_relationship, key=relationship_key)
 
         # Create the report if needed
         # Report in STIX must have at least one object_refs
@@ -1961,7 +1948,7 @@ class MispImportFile:
             # Report in STIX lib must have at least one object_refs
             if len(object_refs) == 0:
                 # Put a fake ID in the report
-                object_refs.append(
+                object_refs.objects.append(
                     "intrusion-set--fc5ee88d-7987-4c00-991e-a863e9aa8a0e"
                 )
             report = stix2.Report(
@@ -1998,7 +1985,7 @@ class MispImportFile:
                 created_by_ref=author["id"],
                 object_marking_refs=event_markings,
                 labels=event_tags,
-                object_refs=object_refs,
+                object_refs=object_refs.objects,
                 external_references=event_external_references,
                 confidence=self.helper.connect_confidence_level,
                 custom_properties={
@@ -2006,7 +1993,7 @@ class MispImportFile:
                 },
                 allow_custom=True,
             )
-            bundle_objects.append(report)
+            bundle_objects.add(report)
             for note in event["Event"].get("EventReport", []):
                 note = stix2.Note(
                     id=Note.generate_id(
@@ -2029,8 +2016,10 @@ class MispImportFile:
                     object_refs=[report],
                     allow_custom=True,
                 )
-                bundle_objects.append(note)
-        return stix2.Bundle(objects=bundle_objects, allow_custom=True).serialize()
+                bundle_objects.add(note)
+        return stix2.Bundle(
+            objects=bundle_objects.objects, allow_custom=True
+        ).serialize()
 
     def _process_message(self, data):
         file_fetch = data["file_fetch"]
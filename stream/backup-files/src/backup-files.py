@@ -2,9 +2,13 @@
 # OpenCTI Backup Files         #
 ################################
 import datetime
+import gzip
 import json
 import os
 import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import yaml
 from dateutil import parser
@@ -17,6 +21,61 @@ def round_time(dt, round_to=60):
     return dt + datetime.timedelta(0, rounding - seconds, -dt.microsecond)
 
 
+class SegmentWriter:
+    """
+    Appends backup records as compact JSON lines to rolling segment files.
+
+    Segments are named after the hour bucket of the stream event and rolled when
+    the bucket changes or the segment exceeds `max_size` bytes. Each record is
+    written as its own gzip member, so a segment is a regular gzip file and a
+    record can be read back by seeking to its offset. Every segment has an index
+    file listing `id<TAB>event<TAB>offset` for each record it contains.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.bucket = None
+        self.segment = None
+        self.index = None
+
+    def _next_name(self, bucket):
+        sequence = 1
+        for name in os.listdir(self.path):
+            if name.startswith(bucket + "-") and name.endswith(".jsonl.gz"):
+                sequence = max(sequence, int(name[len(bucket) + 1 : -9]) + 1)
+        return bucket + "-" + str(sequence).zfill(6)
+
+    def _roll(self, bucket):
+        self.close()
+        name = self._next_name(bucket)
+        self.bucket = bucket
+        self.segment = open(os.path.join(self.path, name + ".jsonl.gz"), "ab")
+        self.index = open(os.path.join(self.path, name + ".idx"), "a")
+
+    def append(self, bucket, entity_id, event, record):
+        if (
+            self.segment is None
+            or bucket != self.bucket
+            or self.segment.tell() >= self.max_size
+        ):
+            self._roll(bucket)
+        offset = self.segment.tell()
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        self.segment.write(gzip.compress(line.encode("utf-8")))
+        self.segment.flush()
+        self.index.write(entity_id + "\t" + event + "\t" + str(offset) + "\n")
+        self.index.flush()
+
+    def close(self):
+        if self.segment is not None:
+            os.fsync(self.segment.fileno())
+            self.segment.close()
+            self.index.close()
+            self.segment = None
+            self.index = None
+
+
 class BackupFilesConnector:
     def __init__(self, conf_data):
         config_file_path = os.path.dirname(os.path.abspath(__file__)) + "/config.yml"
@@ -34,6 +93,35 @@ class BackupFilesConnector:
         self.backup_path = get_config_variable(
             "BACKUP_PATH", ["backup", "path"], config
         )
+        self.backup_format = get_config_variable(
+            "BACKUP_FORMAT", ["backup", "format"], config, default="files"
+        )
+        self.backup_segment_max_size = get_config_variable(
+            "BACKUP_SEGMENT_MAX_SIZE",
+            ["backup", "segment_max_size"],
+            config,
+            isNumber=True,
+            default=104857600,
+        )
+        self.backup_files_workers = get_config_variable(
+            "BACKUP_FILES_WORKERS",
+            ["backup", "files_workers"],
+            config,
+            isNumber=True,
+            default=4,
+        )
+        if self.backup_format not in ["files", "segments"]:
+            raise ValueError(
+                "Backup format must be 'files' or 'segments' - " + self.backup_format
+            )
+        self.known_dirs = set()
+        self.segment_writer = None
+        # Events of the segments format whose files are being fetched, in stream order
+        self.pending = deque()
+        self.pending_lock = threading.Lock()
+        self.executor = None
+        # Error of the first failed event of the segments format, the stream stops on it
+        self.write_error = None
 
     def _enrich_with_files(self, current):
         entity = current
@@ -56,10 +144,10 @@ class BackupFilesConnector:
         return entity
 
     def write_files(self, date_range, entity_id, bundle):
-        path = self.backup_path + "/opencti_data"
-        if not os.path.exists(path + "/" + date_range):
-            os.mkdir(path + "/" + date_range)
-        path = path + "/" + date_range
+        path = self.backup_path + "/opencti_data/" + date_range
+        if date_range not in self.known_dirs:
+            os.makedirs(path, exist_ok=True)
+            self.known_dirs.add(date_range)
         with open(path + "/" + entity_id + ".json", "w") as file:
             json.dump(bundle, file, indent=4)
 
@@ -70,6 +158,77 @@ class BackupFilesConnector:
         if os.path.isfile(path + "/" + entity_id + ".json"):
             os.unlink(path + "/" + entity_id + ".json")
 
+    def _write_segments(self):
+        """
+        Write the records of the events whose files are fetched, in stream order,
+        and record the last written event so the stream can resume from it.
+        Writing stops at the first failed event, which is retried on restart.
+        """
+        with self.pending_lock:
+            if self.write_error is not None:
+                return
+            last_event_id = None
+            while len(self.pending) > 0 and self.pending[0][1].done():
+                msg_id, future = self.pending[0]
+                try:
+                    bucket, entity_id, event, record = future.result()
+                    self.segment_writer.append(bucket, entity_id, event, record)
+                except Exception as e:
+                    self.helper.log_error(
+                        "Backup failed for event " + msg_id + ": " + str(e)
+                    )
+                    self.write_error = e
+                    break
+                self.pending.popleft()
+                last_event_id = msg_id
+            if last_event_id is not None:
+                state = self.helper.get_state()
+                # The state can be None if reset from the UI
+                if state is not None:
+                    state["written_event_id"] = last_event_id
+                    self.helper.set_state(state)
+
+    def _build_record(self, msg_id, event, date_range, data):
+        if event != "delete":
+            data = self._enrich_with_files(data)
+        record = {"event": event, "id": data["id"], "date_range": date_range}
+        if event != "delete":
+            record["bundle"] = {"type": "bundle", "objects": [data]}
+        # Buckets are based on the event time, which is the prefix of the event id
+        event_time = datetime.datetime.fromtimestamp(
+            int(msg_id.split("-")[0]) / 1000, tz=datetime.timezone.utc
+        )
+        self.helper.log_info(
+            "Backup processed event "
+            + msg_id
+            + " in "
+            + date_range
+            + " / "
+            + data["id"]
+        )
+        return event_time.strftime("%Y%m%dT%H0000Z"), data["id"], event, record
+
+    def _raise_write_error(self):
+        # Stop the stream, it resumes from the last written event on restart
+        if self.write_error is not None:
+            raise self.write_error
+
+    def _process_segments_message(self, msg, date_range, data):
+        self._raise_write_error()
+        future = self.executor.submit(
+            self._build_record, msg.id, msg.event, date_range, data
+        )
+        with self.pending_lock:
+            self.pending.append((msg.id, future))
+            oldest = self.pending[0][1]
+            in_flight = len(self.pending)
+        future.add_done_callback(lambda _: self._write_segments())
+        # Bound the number of events waiting for their files
+        if in_flight > self.backup_files_workers:
+            wait([oldest])
+            self._write_segments()
+            self._raise_write_error()
+
     def _process_message(self, msg):
         if msg.event == "create" or msg.event == "update" or msg.event == "delete":
             data = json.loads(msg.data)
@@ -84,6 +243,9 @@ class BackupFilesConnector:
             )
             created_at = parser.parse(creation_date)
             date_range = round_time(created_at).strftime("%Y%m%dT%H%M%SZ")
+            if self.backup_format == "segments":
+                self._process_segments_message(msg, date_range, data["data"])
+                return
             if msg.event == "create":
                 bundle = {
                     "type": "bundle",
@@ -113,7 +275,22 @@ class BackupFilesConnector:
         # Check if the directory exists
         if not os.path.exists(self.backup_path):
             raise ValueError("Backup path does not exist - " + self.backup_path)
-        if not os.path.exists(self.backup_path + "/opencti_data"):
+        if self.backup_format == "segments":
+            segments_path = self.backup_path + "/opencti_segments"
+            os.makedirs(segments_path, exist_ok=True)
+            self.segment_writer = SegmentWriter(
+                segments_path, self.backup_segment_max_size
+            )
+            self.executor = ThreadPoolExecutor(
+                max_workers=max(1, self.backup_files_workers)
+            )
+            # The stream position is stored as soon as an event is received,
+            # resume from the last event written to a segment instead
+            state = self.helper.get_state()
+            if state is not None and "written_event_id" in state:
+                state["start_from"] = state["written_event_id"]
+                self.helper.set_state(state)
+        elif not os.path.exists(self.backup_path + "/opencti_data"):
             os.mkdir(self.backup_path + "/opencti_data")
         self.helper.listen_stream(self._process_message)
 
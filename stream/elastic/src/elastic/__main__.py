@@ -94,6 +94,8 @@ def __process_config(argv={}, config={}) -> dict:
                 "reduced_privileges": os.environ.get(
                     "ELASTICSEARCH_REDUCED_PRIVILEGES", None
                 ),
+                "bulk_size": os.environ.get("ELASTICSEARCH_BULK_SIZE", None),
+                "bulk_interval": os.environ.get("ELASTICSEARCH_BULK_INTERVAL", None),
             }
         },
         "elastic": {
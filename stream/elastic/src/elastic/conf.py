@@ -38,6 +38,8 @@ defaults: dict = {
             "api_key": None,
             "index": "opencti-{now/d}",
             "reduced_privileges": "false",
+            "bulk_size": 1,
+            "bulk_interval": 5,
         },
         "include_labels": False,
     },
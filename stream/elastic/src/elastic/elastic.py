@@ -44,6 +44,10 @@ class ElasticConnector:
         _settings = self.helper.api.query(query)["data"]["settings"]
         self.config["opencti.platform_url"] = _settings.get("platform_url", None)
 
+        # Id of the last stream event handled, it is recorded in the state as
+        # `flushed_event_id` once all its writes reached Elasticsearch
+        self.last_event_id: str = None
+
         self._connect_elasticsearch()
 
         if self.config["connector.mode"] == "ecs":
@@ -162,14 +166,51 @@ class ElasticConnector:
             f"[PROCESS] Message (id: {event_id}, date: {timestamp}, data: {data})"
         )
 
-        if msg.event == "create":
-            return self.handle_create(timestamp, data)
+        # Hold the buffer lock so an interval flush cannot run between the
+        # handling of the event and the bookkeeping of its id
+        with self.import_manager.bulk.lock:
+            if msg.event == "create":
+                self.handle_create(timestamp, data)
+
+            if msg.event == "update":
+                self.handle_update(timestamp, data)
+
+            if msg.event == "delete":
+                self.handle_delete(timestamp, data)
 
-        if msg.event == "update":
-            return self.handle_update(timestamp, data)
+            self.last_event_id = event_id
+            if self.import_manager.bulk.pending == 0:
+                self._store_flushed_event_id(event_id)
 
-        if msg.event == "delete":
-            return self.handle_delete(timestamp, data)
+    def _store_flushed_event_id(self, event_id: str) -> None:
+        state = self.helper.get_state()
+        # The state can be None if reset from the UI
+        if state is not None:
+            state["flushed_event_id"] = event_id
+            self.helper.set_state(state)
+
+    def _flush(self) -> None:
+        bulk = self.import_manager.bulk
+        with bulk.lock:
+            if bulk.pending > 0 and bulk.flush() and self.last_event_id is not None:
+                self._store_flushed_event_id(self.last_event_id)
+
+    def _rewind_stream(self) -> None:
+        """
+        The live stream position is stored by the helper as soon as an event is
+        handled, while its writes may still be buffered. Restart from the last
+        event known to be flushed so that buffered writes lost on a crash are
+        replayed. Replayed writes are idempotent as documents are keyed by id.
+        """
+        state = self.helper.get_state()
+        if state is None or state.get("flushed_event_id", None) is None:
+            return
+        if state.get("start_from", None) != state["flushed_event_id"]:
+            logger.info(
+                f"Resuming live stream from last flushed event {state['flushed_event_id']}"
+            )
+            state["start_from"] = state["flushed_event_id"]
+            self.helper.set_state(state)
 
     def start(self) -> None:
         self.shutdown_event.clear()
@@ -177,16 +218,24 @@ class ElasticConnector:
         if self.config["connector.mode"] == "ecs":
             self.sightings_manager.start()
 
+        self._rewind_stream()
+
         # Look out, this doesn't block
         self.helper.listen_stream(self._process_message)
 
         try:
-            # Just wait here until someone presses ctrl+c
-            self.shutdown_event.wait()
+            # Just wait here until someone presses ctrl+c, flushing buffered
+            # writes when the stream is idle
+            while not self.shutdown_event.wait(
+                timeout=self.import_manager.bulk.interval
+            ):
+                if self.import_manager.bulk.is_due():
+                    self._flush()
         except KeyboardInterrupt:
             self.shutdown_event.set()
 
         logger.info("Shutting down")
+        self._flush()
 
         if self.config["connector.mode"] == "ecs":
             self.sightings_manager.join(timeout=3)
@@ -1,4 +1,6 @@
 import re
+import threading
+import time
 import urllib.parse
 import warnings
 from datetime import datetime, timezone
@@ -6,12 +8,12 @@ from logging import getLogger
 
 from arrow import Arrow
 from datemath import dm
-from elasticsearch import Elasticsearch, NotFoundError, RequestError
+from elasticsearch import Elasticsearch, NotFoundError, helpers
 from pycti import OpenCTIConnectorHelper
 from scalpl import Cut
 
 from . import DM_DEFAULT_FMT, LOGGER_NAME, RE_DATEMATH
-from .utils import remove_nones
+from .utils import add_branch, remove_nones
 
 logger = getLogger(LOGGER_NAME)
 
@@ -33,6 +35,102 @@ entity_field_mapping = {
 }
 
 
+# Painless script of the indicator updates: the changed fields are merged into
+# the stored document, except threatintel.indicator which is replaced as a
+# whole so that the fields removed in OpenCTI are removed from the document
+UPDATE_SCRIPT = """
+void merge(Map target, Map source) {
+  for (def entry : source.entrySet()) {
+    def value = target.get(entry.getKey());
+    if (value instanceof Map && entry.getValue() instanceof Map) {
+      merge(value, entry.getValue());
+    } else {
+      target.put(entry.getKey(), entry.getValue());
+    }
+  }
+}
+merge(ctx._source, params.doc);
+if (params.doc.threatintel?.indicator != null) {
+  ctx._source.threatintel.indicator = params.doc.threatintel.indicator;
+}
+"""
+
+
+class BulkIndexer(object):
+    """
+    Buffers Elasticsearch write actions and submits them with the bulk API once
+    `size` actions are pending or `interval` seconds elapsed since the last flush.
+    Actions are sent in the order they were added, so a create followed by an
+    update or a delete of the same document behaves as with single requests.
+    """
+
+    def __init__(
+        self, elasticsearch_client: Elasticsearch, size: int = 1, interval: float = 5
+    ):
+        self.es_client: Elasticsearch = elasticsearch_client
+        self.size: int = max(1, int(size))
+        self.interval: float = float(interval)
+        self.actions: list[dict] = []
+        self.lock: threading.RLock = threading.RLock()
+        self.last_flush: float = time.monotonic()
+
+    @property
+    def pending(self) -> int:
+        return len(self.actions)
+
+    def is_due(self) -> bool:
+        return time.monotonic() - self.last_flush >= self.interval
+
+    def add(self, action: dict) -> bool:
+        """
+        Buffer an action, flushing the buffer if it is full or due.
+        :return: True if the buffer has been flushed
+        """
+        with self.lock:
+            self.actions.append(action)
+            if len(self.actions) >= self.size or self.is_due():
+                return self.flush()
+        return False
+
+    def flush(self) -> bool:
+        """
+        Submit all the buffered actions. Document level errors are logged and
+        dropped, if the request itself fails the actions are kept for the next flush.
+        :return: True if the buffer is empty after the flush
+        """
+        with self.lock:
+            if len(self.actions) == 0:
+                self.last_flush = time.monotonic()
+                return True
+
+            logger.debug(f"Flushing {len(self.actions)} actions to Elasticsearch")
+            try:
+                _, errors = helpers.bulk(
+                    self.es_client,
+                    self.actions,
+                    max_retries=3,
+                    raise_on_error=False,
+                )
+            except Exception as err:
+                logger.error(
+                    f"Unable to flush {len(self.actions)} actions to Elasticsearch: {err}"
+                )
+                return False
+
+            for error in errors:
+                op_type, item = next(iter(error.items()))
+                if item.get("status") == 404:
+                    logger.warning(
+                        f"Document not found to {op_type} at /{item.get('_index')}/_doc/{item.get('_id')}. Skipping"
+                    )
+                else:
+                    logger.error(f"Unable to {op_type} document: {item}")
+
+            self.actions = []
+            self.last_flush = time.monotonic()
+            return True
+
+
 class StixManager(object):
     def __init__(
         self,
@@ -48,6 +146,11 @@ class StixManager(object):
         self.idx: str = self.config.get("output.elasticsearch.index")
         self.idx_pattern: str = self.config.get("setup.template.pattern")
         self.pattern: re.Pattern = re.compile(RE_DATEMATH)
+        self.bulk: BulkIndexer = BulkIndexer(
+            self.es_client,
+            self.config.get("output.elasticsearch.bulk_size", 1),
+            self.config.get("output.elasticsearch.bulk_interval", 5),
+        )
 
         self._setup_elasticsearch_index()
 
@@ -78,36 +181,33 @@ class StixManager(object):
 
             # Submit to Elastic index
             logger.debug(f"Indexing doc to {_write_idx}:\n {_document}")
-            self.es_client.index(
-                index=_write_idx,
-                id=OpenCTIConnectorHelper.get_attribute_in_extension("id", data),
-                body=_document,
+            self.bulk.add(
+                {
+                    "_op_type": "index",
+                    "_index": _write_idx,
+                    "_id": OpenCTIConnectorHelper.get_attribute_in_extension(
+                        "id", data
+                    ),
+                    "_source": _document,
+                }
             )
 
-        except RequestError as err:
-            logger.error("Unexpected error:", err, data)
         except Exception as err:
             logger.error("Something else happened", err, data)
 
         return data
 
     def delete_cti_event(self, data: dict) -> None:
-        _result: dict = {}
-        try:
-            _result = self.es_client.delete(
-                index=self.idx_pattern,
-                id=OpenCTIConnectorHelper.get_attribute_in_extension("id", data),
-                doc_type="_doc",
-            )
-        except NotFoundError:
-            logger.warn(
-                f"Document id {OpenCTIConnectorHelper.get_attribute_in_extension('id', data)} not found in index"
-            )
-
-        if _result.get("result", None) == "deleted":
-            logger.debug(
-                f"Document id {OpenCTIConnectorHelper.get_attribute_in_extension('id', data)} deleted"
-            )
+        logger.debug(
+            f"Deleting document id {OpenCTIConnectorHelper.get_attribute_in_extension('id', data)}"
+        )
+        self.bulk.add(
+            {
+                "_op_type": "delete",
+                "_index": self.idx_pattern,
+                "_id": OpenCTIConnectorHelper.get_attribute_in_extension("id", data),
+            }
+        )
 
         return
 
@@ -133,6 +233,11 @@ class IntelManager(object):
             self.write_idx = self.config.get("setup.ilm.rollover_alias", "opencti")
 
         self.pattern = re.compile(RE_DATEMATH)
+        self.bulk: BulkIndexer = BulkIndexer(
+            self.es_client,
+            self.config.get("output.elasticsearch.bulk_size", 1),
+            self.config.get("output.elasticsearch.bulk_interval", 5),
+        )
 
         self._setup_elasticsearch_index()
 
@@ -258,8 +363,7 @@ class IntelManager(object):
             logger.warning(f"For document id {id}, entity is '{entity}'. Skipping.")
             return None
 
-        _result: dict = {}
-        _document: Cut = {}
+        _document: dict = {}
 
         if data["type"] != "indicator":
             logger.error(
@@ -267,109 +371,84 @@ class IntelManager(object):
             )
             return None
 
-        if is_update is True:
+        if is_update is True and data.get("x_data_update", {}).get("replace", None):
             update_time: str = (
                 datetime.now(tz=timezone.utc).isoformat().replace("+00:00", "Z")
             )
-            try:
-                # Attempt to retreive existing document
-                logger.debug(
-                    f"Retrieving document id: {OpenCTIConnectorHelper.get_attribute_in_extension('id', data)}"
-                )
-                _result = self.es_client.get(
-                    index=self.write_idx,
-                    id=OpenCTIConnectorHelper.get_attribute_in_extension("id", data),
-                    doc_type="_doc",
-                )
+            # Only the changed fields are sent, UPDATE_SCRIPT applies them to
+            # the stored document
+            _document = {}
+
+            if entity["pattern_type"] == "stix":
+                # Pull in any indicator updates
+                _indicator: dict = self._create_ecs_indicator_stix(entity)
+                if _indicator == {}:
+                    return {}
+                add_branch(_document, ["threatintel", "indicator"], _indicator)
+                if entity.get("killChainPhases", None):
+                    phases = []
+                    for phase in sorted(
+                        entity["killChainPhases"],
+                        key=lambda i: (
+                            i["kill_chain_name"],
+                            OpenCTIConnectorHelper.get_attribute_in_extension(
+                                "order", i
+                            ),
+                        ),
+                    ):
+                        phases.append(
+                            {
+                                "killchain_name": phase["kill_chain_name"],
+                                "phase_name": phase["phase_name"],
+                                "opencti_phase_order": OpenCTIConnectorHelper.get_attribute_in_extension(
+                                    "order", phase
+                                ),
+                            }
+                        )
 
-            except NotFoundError:
-                logger.warn(
-                    f"Document not found to update at /{self.idx}/_doc/{OpenCTIConnectorHelper.get_attribute_in_extension('id', data)}"
+                    add_branch(
+                        _document,
+                        ["threatintel", "opencti", "killchain_phases"],
+                        phases,
+                    )
+            else:
+                logger.warning(
+                    f"Unsupported indicator pattern type: {entity['pattern_type']}. Skipping."
                 )
-                logger.warn("Skipping")
                 return {}
 
-            except RequestError as err:
-                logger.error(
-                    f"Unexpected error retreiving document at /{self.idx}/_doc/{OpenCTIConnectorHelper.get_attribute_in_extension('id', data)}:",
-                    err.__dict__,
-                )
-
-            if _result["found"] is True:
-                _document = Cut(_result["_source"])
-                _write_idx = _result["_index"]
-
-            if data.get("x_data_update", None):
-                if data["x_data_update"].get("replace", None):
-                    if entity["pattern_type"] == "stix":
-                        # Pull in any indicator updates
-                        _indicator: dict = self._create_ecs_indicator_stix(entity)
-                        if _indicator == {}:
-                            return {}
-                        _document["threatintel.indicator"] = _indicator
-                        if entity.get("killChainPhases", None):
-                            phases = []
-                            for phase in sorted(
-                                entity["killChainPhases"],
-                                key=lambda i: (
-                                    i["kill_chain_name"],
-                                    OpenCTIConnectorHelper.get_attribute_in_extension(
-                                        "order", i
-                                    ),
-                                ),
-                            ):
-                                phases.append(
-                                    {
-                                        "killchain_name": phase["kill_chain_name"],
-                                        "phase_name": phase["phase_name"],
-                                        "opencti_phase_order": OpenCTIConnectorHelper.get_attribute_in_extension(
-                                            "order", phase
-                                        ),
-                                    }
-                                )
-
-                            _document.setdefault(
-                                "threatintel.opencti.killchain_phases", phases
-                            )
-                    else:
-                        logger.warning(
-                            f"Unsupported indicator pattern type: {entity['pattern_type']}. Skipping."
-                        )
-                        return _document
-
-                    for k, v in data["x_data_update"].get("replace", {}).items():
-                        logger.debug(
-                            f"Updating field {k} -> {entity_field_mapping.get(k)} to {v}"
-                        )
-                        try:
-                            _field = entity_field_mapping.get(k)
-                            _document.setdefault(_field, v)
-                            _document[_field] = v
-                        except KeyError as err:
-                            logger.error(f"Unable to find field mapping for {k}", err)
-
-                    _document["threatintel.opencti.updated_at"] = update_time
-
-                    #  This scrubs the Cut object and returns a dict
-                    _document = remove_nones(_document)
-
-                    try:
-                        # Don't render timestamped index since this is an update
-                        # Submit to Elastic index
-                        logger.debug(f"Updating doc to {_write_idx}:\n {_document}")
-                        self.es_client.index(
-                            index=_write_idx,
-                            id=OpenCTIConnectorHelper.get_attribute_in_extension(
-                                "id", data
-                            ),
-                            body=_document,
-                        )
-                    except RequestError as err:
-                        logger.error("Unexpected error:", err, _document)
-                    except Exception as err:
-                        logger.error("Something else happened", err, _document)
+            for k, v in data["x_data_update"].get("replace", {}).items():
+                _fields = entity_field_mapping.get(k)
+                if _fields is None:
+                    logger.debug(f"Unable to find field mapping for {k}")
+                    continue
+                if not isinstance(_fields, list):
+                    _fields = [_fields]
+                for _field in _fields:
+                    logger.debug(f"Updating field {k} -> {_field} to {v}")
+                    add_branch(_document, _field.split("."), v)
+
+            add_branch(_document, ["threatintel", "opencti", "updated_at"], update_time)
+            _document = remove_nones(_document)
+
+            # Don't render timestamped index since this is an update
+            logger.debug(f"Updating doc in {self.write_idx}:\n {_document}")
+            self.bulk.add(
+                {
+                    "_op_type": "update",
+                    "_index": self.write_idx,
+                    "_id": OpenCTIConnectorHelper.get_attribute_in_extension(
+                        "id", data
+                    ),
+                    "script": {
+                        "source": UPDATE_SCRIPT,
+                        "lang": "painless",
+                        "params": {"doc": _document},
+                    },
+                }
+            )
 
-                    return _document
+            return _document
 
         creation_time: str = (
             datetime.now(tz=timezone.utc).isoformat().replace("+00:00", "Z")
@@ -487,13 +566,16 @@ class IntelManager(object):
 
             # Submit to Elastic index
             logger.debug(f"Indexing doc to {_write_idx}:\n {_document}")
-            self.es_client.index(
-                index=_write_idx,
-                id=OpenCTIConnectorHelper.get_attribute_in_extension("id", data),
-                body=_document,
+            self.bulk.add(
+                {
+                    "_op_type": "index",
+                    "_index": _write_idx,
+                    "_id": OpenCTIConnectorHelper.get_attribute_in_extension(
+                        "id", data
+                    ),
+                    "_source": _document,
+                }
             )
-        except RequestError as err:
-            logger.error("Unexpected error:", err, _document)
         except Exception as err:
             logger.error("Something else happened", err, _document)
 
@@ -501,7 +583,6 @@ class IntelManager(object):
 
     def delete_cti_event(self, data: dict) -> None:
         logger.debug(f"Deleting {data}")
-        _result: dict = {}
 
         if data["type"] != "indicator":
             logger.error(
@@ -509,21 +590,13 @@ class IntelManager(object):
             )
             return None
 
-        try:
-            _result = self.es_client.delete(
-                index=self.write_idx,
-                id=OpenCTIConnectorHelper.get_attribute_in_extension("id", data),
-                doc_type="_doc",
-            )
-        except NotFoundError:
-            logger.warn(
-                f"Document id {OpenCTIConnectorHelper.get_attribute_in_extension('id', data)} not found in index"
-            )
-
-        if _result.get("result", None) == "deleted":
-            logger.debug(
-                f"Document id {OpenCTIConnectorHelper.get_attribute_in_extension('id', data)} deleted"
-            )
+        self.bulk.add(
+            {
+                "_op_type": "delete",
+                "_index": self.write_idx,
+                "_id": OpenCTIConnectorHelper.get_attribute_in_extension("id", data),
+            }
+        )
 
         return
 
@@ -0,0 +1,52 @@
+from elastic.import_manager import BulkIndexer
+
+
+def test_flush_on_size(mocker):
+    bulk = mocker.patch("elastic.import_manager.helpers.bulk", return_value=(2, []))
+    indexer = BulkIndexer(mocker.Mock(), size=2, interval=3600)
+
+    assert indexer.add({"_op_type": "index", "_id": "a"}) is False
+    assert indexer.pending == 1
+    bulk.assert_not_called()
+
+    assert indexer.add({"_op_type": "delete", "_id": "a"}) is True
+    assert indexer.pending == 0
+    actions = bulk.call_args.args[1]
+    assert [action["_op_type"] for action in actions] == ["index", "delete"]
+
+
+def test_flush_on_interval(mocker):
+    bulk = mocker.patch("elastic.import_manager.helpers.bulk", return_value=(1, []))
+    indexer = BulkIndexer(mocker.Mock(), size=100, interval=0)
+
+    assert indexer.add({"_op_type": "index", "_id": "a"}) is True
+    bulk.assert_called_once()
+
+
+def test_failed_flush_keeps_actions(mocker):
+    bulk = mocker.patch(
+        "elastic.import_manager.helpers.bulk", side_effect=ConnectionError()
+    )
+    indexer = BulkIndexer(mocker.Mock(), size=1)
+
+    assert indexer.add({"_op_type": "index", "_id": "a"}) is False
+    assert indexer.pending == 1
+
+    bulk.side_effect = None
+    bulk.return_value = (1, [])
+    assert indexer.flush() is True
+    assert indexer.pending == 0
+
+
+def test_document_errors_are_dropped(mocker):
+    mocker.patch(
+        "elastic.import_manager.helpers.bulk",
+        return_value=(
+            0,
+            [{"update": {"_index": "opencti", "_id": "a", "status": 404}}],
+        ),
+    )
+    indexer = BulkIndexer(mocker.Mock(), size=1)
+
+    assert indexer.add({"_op_type": "update", "_id": "a", "doc": {}}) is True
+    assert indexer.pending == 0
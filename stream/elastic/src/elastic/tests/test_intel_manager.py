@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+
+from elastic.import_manager import UPDATE_SCRIPT, IntelManager
+
+
+def test_update_replaces_indicator(mocker):
+    manager = IntelManager.__new__(IntelManager)
+    manager.helper = mocker.Mock()
+    manager.helper.api.indicator.read.return_value = {
+        "pattern_type": "stix",
+        "killChainPhases": [],
+    }
+    manager.write_idx = "opencti"
+    manager.bulk = mocker.Mock()
+    manager._create_ecs_indicator_stix = mocker.Mock(
+        return_value={"type": "ipv4-addr", "ip": "198.51.100.7"}
+    )
+    data = {
+        "type": "indicator",
+        "extensions": {
+            "extension-definition--ea279b3e-5c71-4632-ac08-831c66a786ba": {
+                "id": "indicator-id"
+            }
+        },
+        "x_data_update": {"replace": {"description": "Updated"}},
+    }
+
+    manager.import_cti_event(datetime.now(tz=timezone.utc), data, is_update=True)
+
+    action = manager.bulk.add.call_args.args[0]
+    assert action["_op_type"] == "update"
+    assert action["_id"] == "indicator-id"
+    assert "doc" not in action
+    assert action["script"]["source"] == UPDATE_SCRIPT
+    # The whole indicator is sent, the script replaces the stored one with it
+    assert action["script"]["params"]["doc"]["threatintel"]["indicator"] == {
+        "type": "ipv4-addr",
+        "ip": "198.51.100.7",
+        "description": "Updated",
+    }
@@ -2,13 +2,17 @@
 # Splunk Connector for OpenCTI #
 ################################
 
+import copy
 import json
 import logging
 import os
+import threading
+import time
 import traceback
 from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from queue import Queue
+from queue import Empty, Queue
 
 import requests
 import yaml
@@ -97,6 +101,25 @@ class KVStore:
             else:
                 r.raise_for_status()
 
+    def batch_save(self, payloads: dict):
+        """Insert or update several documents in a single request
+
+        Args:
+            payloads (dict): documents to save, by id
+        """
+        documents = []
+        for id, payload in payloads.items():
+            payload["_key"] = id
+            documents.append(payload)
+        if len(documents) > 0:
+            r = requests.post(
+                f"{self.collection_url}/data/{self.splunk_kv_store_name}/batch_save",
+                json=documents,
+                headers=self.headers,
+                verify=self.splunk_ssl_verify,
+            )
+            r.raise_for_status()
+
     def delete(self, id: str):
         if id is not None:
             r = requests.delete(
@@ -142,19 +165,38 @@ class SplunkConnector:
         self,
         helper: OpenCTIConnectorHelper,
         kvstore: KVStore,
-        queue: Queue,
+        queues: list[Queue],
         ignore_types: list[str],
-        consumer_count: int,
         metrics: Metrics | None = None,
+        batch_size: int = 1,
+        batch_latency: float = 1.0,
     ) -> None:
         self.kvstore = kvstore
-        self.queue = queue
+        # one queue per consumer thread
+        self.queues = queues
         self.helper = helper
         self.ignore_types = ignore_types
         self.metrics = metrics
-        self.consumer_count = consumer_count
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
 
         self._org_name_cache = {}
+        self._stream_name = None
+        # stix-shifter translators are not shared between consumer threads
+        self._thread_local = threading.local()
+        self._translate_pattern = lru_cache(maxsize=65536)(self._translate_pattern)
+
+    @property
+    def stream_name(self) -> str:
+        if self._stream_name is None:
+            self._stream_name = self.helper.get_stream_collection()["name"]
+        return self._stream_name
+
+    @property
+    def translator(self) -> stix_translation.StixTranslation:
+        if not hasattr(self._thread_local, "translator"):
+            self._thread_local.translator = stix_translation.StixTranslation()
+        return self._thread_local.translator
 
     def is_filtered(self, data: dict):
         return "type" in data and data["type"] in self.ignore_types
@@ -169,49 +211,61 @@ class SplunkConnector:
 
         return org_name
 
+    def _translate_pattern(self, pattern: str) -> tuple:
+        """Translate a STIX pattern to Splunk queries and mapped values
+
+        Results are memoized by pattern (see __init__).
+
+        Args:
+            pattern (str): STIX pattern of the indicator
+
+        Returns:
+            tuple: splunk queries (None if not translated) and mapped values
+        """
+        splunk_queries = None
+        # add splunk query
+        try:
+            splunk_queries = self.translator.translate("splunk", "query", "{}", pattern)
+        except:
+            pass
+
+        # add mapped values
+        try:
+            parsed = self.translator.translate("splunk", "parse", "{}", pattern)
+            if "parsed_stix" in parsed and len(parsed["parsed_stix"]) > 0:
+                mapped_values = []
+                for value in parsed["parsed_stix"]:
+                    formatted_value = {}
+                    formatted_value[sanitize_key(value["attribute"])] = value["value"]
+                    mapped_values.append(formatted_value)
+            else:
+                raise ValueError("Not parsed")
+        except:
+            try:
+                splitted = pattern.split(" = ")
+                key = sanitize_key(splitted[0].replace("[", ""))
+                value = splitted[1].replace("'", "").replace("]", "")
+                formatted_value = {}
+                formatted_value[key] = value
+                mapped_values = [formatted_value]
+            except:
+                mapped_values = []
+        return splunk_queries, mapped_values
+
     def enrich_payload(self, payload: dict):
         # add stream name
-        payload["stream_name"] = self.helper.get_stream_collection()["name"]
+        payload["stream_name"] = self.stream_name
 
         if "type" in payload:
             if payload["type"] == "indicator" and payload["pattern_type"].startswith(
                 "stix"
             ):
-                # add splunk query
-                try:
-                    translation = stix_translation.StixTranslation()
-                    response = translation.translate(
-                        "splunk", "query", "{}", payload["pattern"]
-                    )
-                    payload["splunk_queries"] = response
-                except:
-                    pass
-
-                # add mapped values
-                try:
-                    parsed = translation.translate(
-                        "splunk", "parse", "{}", payload["pattern"]
-                    )
-                    if "parsed_stix" in parsed and len(parsed["parsed_stix"]) > 0:
-                        payload["mapped_values"] = []
-                        for value in parsed["parsed_stix"]:
-                            formatted_value = {}
-                            formatted_value[sanitize_key(value["attribute"])] = value[
-                                "value"
-                            ]
-                            payload["mapped_values"].append(formatted_value)
-                    else:
-                        raise ValueError("Not parsed")
-                except:
-                    try:
-                        splitted = payload["pattern"].split(" = ")
-                        key = sanitize_key(splitted[0].replace("[", ""))
-                        value = splitted[1].replace("'", "").replace("]", "")
-                        formatted_value = {}
-                        formatted_value[key] = value
-                        payload["mapped_values"] = [formatted_value]
-                    except:
-                        payload["mapped_values"] = []
+                splunk_queries, mapped_values = copy.deepcopy(
+                    self._translate_pattern(payload["pattern"])
+                )
+                if splunk_queries is not None:
+                    payload["splunk_queries"] = splunk_queries
+                payload["mapped_values"] = mapped_values
 
                 # add values
                 payload["values"] = sum(
@@ -245,30 +299,58 @@ class SplunkConnector:
         self.helper.listen_stream(self.produce)
 
     def produce(self, msg):
-        self.queue.put(msg)
+        payload = json.loads(msg.data)["data"]
+        id = OpenCTIConnectorHelper.get_attribute_in_extension("id", payload)
+        # all the events of an item go to the same consumer, so they are
+        # applied in the stream order (a pending batch can't overwrite a delete)
+        self.queues[hash(id) % len(self.queues)].put((msg, payload, id))
 
     def start_consumers(self):
-        self.helper.log_info(f"starting {self.consumer_count} consumer threads")
-        with ThreadPoolExecutor() as executor:
-            for _ in range(self.consumer_count):
-                executor.submit(self.consume)
+        self.helper.log_info(f"starting {len(self.queues)} consumer threads")
+        with ThreadPoolExecutor(max_workers=len(self.queues)) as executor:
+            for queue in self.queues:
+                executor.submit(self.consume, queue)
 
-    def consume(self):
+    def consume(self, queue: Queue):
         # ensure the process stop when there is an issue while
         # processing message
         try:
-            self._consume()
+            self._consume(queue)
         except Exception:
             error_msg = traceback.format_exc()
             self.helper.log_error("An error occurred while consuming messages")
             self.helper.log_error(error_msg)
             os._exit(1)  # exit the current process, killing all threads
 
-    def _consume(self):
+    def _flush(self, batch: dict, batch_msgs: list):
+        """Save the pending create and update events in one request"""
+        if len(batch) == 0:
+            return
+        self.kvstore.batch_save(batch)
+        self.helper.log_info(f"{len(batch)} kvstore items saved")
+        if self.metrics is not None:
+            for msg in batch_msgs:
+                self.metrics.msg(msg.event)
+            self.metrics.state(batch_msgs[-1].id)
+        batch.clear()
+        batch_msgs.clear()
+
+    def _consume(self, queue: Queue):
+        # pending create and update payloads, by id, when batching is enabled
+        batch = {}
+        batch_msgs = []
+        batch_deadline = None
         while True:
-            msg = self.queue.get()
-            payload = json.loads(msg.data)["data"]
-            id = OpenCTIConnectorHelper.get_attribute_in_extension("id", payload)
+            try:
+                if len(batch) == 0:
+                    msg, payload, id = queue.get()
+                else:
+                    msg, payload, id = queue.get(
+                        timeout=max(batch_deadline - time.monotonic(), 0)
+                    )
+            except Empty:
+                self._flush(batch, batch_msgs)
+                continue
 
             self.helper.log_info(f"processing message with id {id}")
 
@@ -278,6 +360,19 @@ class SplunkConnector:
 
             payload = self.enrich_payload(payload)
 
+            if self.batch_size > 1 and msg.event in ["create", "update"]:
+                if len(batch) == 0:
+                    batch_deadline = time.monotonic() + self.batch_latency
+                # a later event on the same item replaces the pending one
+                batch[id] = payload
+                batch_msgs.append(msg)
+                if len(batch) >= self.batch_size or time.monotonic() >= batch_deadline:
+                    self._flush(batch, batch_msgs)
+                continue
+
+            # keep the events order for the item being deleted
+            self._flush(batch, batch_msgs)
+
             match msg.event:
                 case "create":
                     self.kvstore.create(id, payload)
@@ -374,6 +469,22 @@ if __name__ == "__main__":
             default=10,
         )
 
+        batch_size: int = get_config_variable(
+            "SPLUNK_BATCH_SIZE",
+            ["splunk", "batch_size"],
+            config,
+            isNumber=True,
+            default=1,
+        )
+        batch_latency: float = float(
+            get_config_variable(
+                "SPLUNK_BATCH_LATENCY",
+                ["splunk", "batch_latency"],
+                config,
+                default=1,
+            )
+        )
+
         # metrics conf
         enable_prom_metrics: bool = get_config_variable(
             "METRICS_ENABLE", ["metrics", "enable"], config, default=False
@@ -395,8 +506,8 @@ if __name__ == "__main__":
             splunk_ssl_verify,
         )
 
-        # create queue
-        queue = Queue(maxsize=2 * consumer_count)
+        # create one queue per consumer
+        queues = [Queue(maxsize=2) for _ in range(consumer_count)]
 
         # create prom metrics
         if enable_prom_metrics:
@@ -410,10 +521,11 @@ if __name__ == "__main__":
         SplunkConnector(
             helper,
             kvstore,
-            queue,
+            queues,
             ignore_types,
-            consumer_count,
             metrics=metrics,
+            batch_size=batch_size,
+            batch_latency=batch_latency,
         ).start()
     except Exception:
         traceback.print_exc()